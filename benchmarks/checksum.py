@@ -0,0 +1,78 @@
+# Copyright 2023 (c) Vladislav Punko <iam.vlad.punko@gmail.com>
+
+"""Compare the throughput of the checksum calculation with the previous reading loop.
+
+Usage: python -m benchmarks.checksum [--sizes 1MiB 16MiB 256MiB] [--repeat 5]
+"""
+
+import argparse
+import hashlib
+import io
+import os
+import pathlib
+import tempfile
+import time
+import typing
+
+from git_backupper import fs
+
+_UNITS: typing.Final[dict[str, int]] = {"KiB": 2**10, "MiB": 2**20, "GiB": 2**30}
+
+
+def _parse_size(value: str) -> int:
+    for unit, multiplier in _UNITS.items():
+        if value.endswith(unit):
+            return int(value[: -len(unit)]) * multiplier
+
+    return int(value)
+
+
+def _calculate_checksum_by_chunks(path: pathlib.Path) -> str:
+    # This is the reading loop used before the buffer has been reused between chunks.
+    hash_func = hashlib.sha256()
+
+    with path.open(mode="rb", buffering=0) as stream_in:
+        for chunk in iter(lambda: stream_in.read(io.DEFAULT_BUFFER_SIZE), b""):
+            hash_func.update(chunk)
+
+    return hash_func.hexdigest()
+
+
+def _measure(func: typing.Callable[[pathlib.Path], str], path: pathlib.Path, repeat: int) -> float:
+    timings = []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(path)
+        timings.append(time.perf_counter() - start)
+
+    return min(timings)  # the least affected measurement
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default=["64KiB", "1MiB", "16MiB", "256MiB"], nargs="+")
+    parser.add_argument("--repeat", default=5, type=int)
+    arguments = parser.parse_args()
+
+    print(f"{'size':>10} {'chunks MB/s':>12} {'engine MB/s':>12} {'speedup':>8}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        for size in arguments.sizes:
+            path = pathlib.Path(directory) / size
+            path.write_bytes(os.urandom(_parse_size(size)))
+
+            assert _calculate_checksum_by_chunks(path) == fs.calculate_checksum(path)
+
+            baseline = _measure(_calculate_checksum_by_chunks, path, arguments.repeat)
+            engine = _measure(fs.calculate_checksum, path, arguments.repeat)
+
+            megabytes = _parse_size(size) / 10**6
+            print(
+                f"{size:>10} {megabytes / baseline:>12.1f} {megabytes / engine:>12.1f}"
+                f" {baseline / engine:>7.2f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# Copyright 2023 (c) Vladislav Punko <iam.vlad.punko@gmail.com>
+
+"""Compare the memory used by the manifest with the dictionary of checksum values.
+
+Usage: python -m benchmarks.manifest [--files 1000 10000 100000]
+"""
+
+import argparse
+import hashlib
+import pathlib
+import pickle
+import tracemalloc
+import typing
+
+from git_backupper import fs, manifest
+
+_ROOT: typing.Final[pathlib.Path] = pathlib.Path("/backup_repositories/repository.git")
+
+
+def _generate_checksums(count: int) -> dict[pathlib.Path, fs.FileChecksum]:
+    checksums = {}
+
+    for index in range(count):
+        digest = hashlib.sha256(str(index).encode()).hexdigest()
+        # Most files of a mirror are loose objects stored by their names.
+        path = _ROOT / "objects" / digest[:2] / digest[2:40]
+        checksums[path] = fs.FileChecksum(digest, index, index, index, index)
+
+    return checksums
+
+
+def _measure(func: typing.Callable[[], typing.Any]) -> tuple[typing.Any, int]:
+    tracemalloc.start()
+    try:
+        value = func()
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return value, size
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--files", default=[1000, 10000, 100000], nargs="+", type=int)
+    arguments = parser.parse_args()
+
+    print(
+        f"{'files':>8} {'dict MiB':>9} {'manifest MiB':>13} {'ratio':>7}"
+        f" {'dict pickle MiB':>16} {'manifest pickle MiB':>20}"
+    )
+
+    for count in arguments.files:
+        checksums, checksums_size = _measure(lambda: _generate_checksums(count))
+        # The checksum values are generated again to leave only the manifest in memory.
+        test_manifest, manifest_size = _measure(
+            lambda: manifest.Manifest.from_checksums(_ROOT, _generate_checksums(count))
+        )
+
+        assert test_manifest.to_checksums(_ROOT) == checksums
+
+        checksums_pickle = len(pickle.dumps(checksums, protocol=pickle.HIGHEST_PROTOCOL))
+        manifest_pickle = len(pickle.dumps(test_manifest, protocol=pickle.HIGHEST_PROTOCOL))
+        print(
+            f"{count:>8} {checksums_size / 2**20:>9.2f} {manifest_size / 2**20:>13.2f}"
+            f" {checksums_size / manifest_size:>6.1f}x"
+            f" {checksums_pickle / 2**20:>16.2f} {manifest_pickle / 2**20:>20.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
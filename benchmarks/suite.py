@@ -0,0 +1,209 @@
+# Copyright 2023 (c) Vladislav Punko <iam.vlad.punko@gmail.com>
+
+"""Measure the backup of synthetic repositories served as local remotes.
+
+Usage: python -m benchmarks.suite [--repositories 1 10 50] [--output results.json]
+                                  [--baseline previous.json]
+
+The same seed generates the same repositories, so the results written by different
+commits of this project can be compared with each other.
+"""
+
+import argparse
+import json
+import pathlib
+import platform
+import random
+import subprocess
+import tempfile
+import time
+import typing
+
+from benchmarks.checksum import _parse_size
+from git_backupper import api, cache, fs, repository
+
+# Fix the dates of commits to get the same object names on every run.
+_COMMITTER: typing.Final[bytes] = b"committer benchmark <benchmark@localhost> 1700000000 +0000"
+
+# The smaller values of these metrics are better.
+_METRICS: typing.Final[tuple[str, ...]] = (
+    "backup_clone_seconds",
+    "backup_fetch_seconds",
+    "backup_noop_seconds",
+    "clone_seconds",
+    "fetch_seconds",
+    "checksum_seconds_per_gb",
+    "cache_load_seconds",
+    "cache_save_seconds",
+)
+
+
+def _write_commits(
+    path: pathlib.Path, commits: int, files: int, file_size: int, generator: random.Random
+) -> None:
+    # Write the objects straight into the bare repository without a working tree.
+    process = subprocess.run(
+        ["git", "-C", str(path), "rev-parse", "--verify", "--quiet", "refs/heads/main"],
+        check=False,
+        stdout=subprocess.DEVNULL,
+    )
+    has_commits = not process.returncode
+    stream = []
+
+    for commit in range(commits):
+        marks = range(commit * files + 1, (commit + 1) * files + 1)
+        for mark in marks:
+            content = generator.randbytes(file_size)
+            stream.append(b"blob\nmark :%d\ndata %d\n%s\n" % (mark, len(content), content))
+
+        stream.append(b"commit refs/heads/main\n%s\ndata 9\nbenchmark\n" % _COMMITTER)
+        if has_commits and not commit:
+            # The branch written by fast-import itself is continued without this line.
+            stream.append(b"from refs/heads/main^0\n")
+        stream.extend(
+            b"M 100644 :%d files/%d/%d\n" % (mark, index % 16, index)
+            for index, mark in enumerate(marks)
+        )
+        stream.append(b"\n")
+
+    subprocess.run(
+        ["git", "-C", str(path), "fast-import", "--quiet"], check=True, input=b"".join(stream)
+    )
+
+
+def _create_remotes(
+    path: pathlib.Path, count: int, commits: int, files: int, file_size: int, seed: int
+) -> list[pathlib.Path]:
+    generator = random.Random(seed)
+    paths = []
+
+    for index in range(count):
+        remote_path = path / f"repository-{index}.git"
+        subprocess.run(
+            ["git", "init", "--bare", "--initial-branch=main", "--quiet", str(remote_path)],
+            check=True,
+        )
+        _write_commits(remote_path, commits, files, file_size, generator)
+        paths.append(remote_path)
+
+    return paths
+
+
+def _measure(func: typing.Callable[[], typing.Any]) -> float:
+    start = time.perf_counter()
+    func()
+
+    return time.perf_counter() - start
+
+
+def _get_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, check=True, text=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _run(directory: pathlib.Path, count: int, arguments: argparse.Namespace) -> dict[str, float]:
+    file_size = _parse_size(arguments.file_size)
+    remote_paths = _create_remotes(
+        directory / "remotes", count, arguments.commits, arguments.files, file_size, arguments.seed
+    )
+    urls = [path.as_uri() for path in remote_paths]
+    backup_path = directory / "backup"
+    cache_path = directory / "cache.pickle"
+
+    def backup() -> None:
+        api.backup(backup_path, urls, cache_path, max_workers=arguments.jobs)
+
+    results = {"repositories": count, "backup_clone_seconds": _measure(backup)}
+
+    # Time the phases of a single repository one after another without the other steps.
+    repositories = [
+        repository.Repository.from_url(parent_path=directory / "phases", url=url) for url in urls
+    ]
+    results["clone_seconds"] = sum(
+        _measure(test_repository.create_local_copy) for test_repository in repositories
+    )
+
+    generator = random.Random(arguments.seed + 1)
+    for path in remote_paths:
+        _write_commits(path, 1, arguments.files, file_size, generator)
+
+    results["fetch_seconds"] = sum(
+        _measure(test_repository.update_local_copy) for test_repository in repositories
+    )
+    results["backup_fetch_seconds"] = _measure(backup)
+    results["backup_noop_seconds"] = _measure(backup)
+
+    size = sum(path.stat().st_size for path in backup_path.rglob("*") if path.is_file())
+    duration = sum(_measure(lambda: fs.calculate_checksums(path)) for path in backup_path.iterdir())
+    results["checksum_mb_per_second"] = size / 10**6 / duration
+    results["checksum_seconds_per_gb"] = duration / size * 10**9
+
+    persistent_cache = cache.PersistentCache(cache_path)
+    results["cache_load_seconds"] = _measure(persistent_cache.__enter__)
+    results["cache_save_seconds"] = _measure(persistent_cache.__exit__)
+
+    return results
+
+
+def _compare(results: list[dict[str, float]], baseline: list[dict[str, float]]) -> None:
+    previous = {entry["repositories"]: entry for entry in baseline}
+
+    print(f"{'repositories':>12} {'metric':>24} {'baseline':>10} {'current':>10} {'ratio':>7}")
+    for entry in results:
+        if entry["repositories"] not in previous:
+            continue
+
+        for metric in _METRICS:
+            before, after = previous[entry["repositories"]][metric], entry[metric]
+            print(
+                f"{entry['repositories']:>12} {metric:>24} {before:>10.4f} {after:>10.4f}"
+                f" {after / before:>6.2f}x"
+            )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--repositories", default=[1, 10, 50], nargs="+", type=int)
+    parser.add_argument("--commits", default=20, type=int)
+    parser.add_argument("--files", default=10, type=int)
+    parser.add_argument("--file-size", default="16KiB")
+    parser.add_argument("--jobs", default=1, type=int)
+    parser.add_argument("--seed", default=0, type=int)
+    parser.add_argument("--output", type=pathlib.Path)
+    parser.add_argument("--baseline", type=pathlib.Path)
+    arguments = parser.parse_args()
+
+    results = []
+    for count in arguments.repositories:
+        with tempfile.TemporaryDirectory() as directory:
+            results.append(_run(pathlib.Path(directory), count, arguments))
+
+    document = {
+        "revision": _get_revision(),
+        "python": platform.python_version(),
+        "parameters": {
+            name: value
+            for name, value in vars(arguments).items()
+            if name not in {"output", "baseline"}
+        },
+        "results": results,
+    }
+    text = json.dumps(document, indent=2)
+
+    if arguments.output is None:
+        print(text)
+    else:
+        arguments.output.write_text(text + "\n")
+
+    if arguments.baseline is not None:
+        _compare(results, json.loads(arguments.baseline.read_text())["results"])
+
+
+if __name__ == "__main__":
+    main()
@@ -5,20 +5,184 @@
 import argparse
 import errno
 import logging
+import pathlib
 import sys
-from importlib.metadata import version
+import typing
 
-from git_backupper import api, defaults, exceptions, logger_wrapper, settings
+# The modules of this package are imported only after parsing the arguments to keep the
+# startup fast for the help and version messages. These choices are the values of enums.
+_CACHE_BACKENDS: typing.Final[tuple[str, ...]] = ("pickle", "sqlite")
+_INTEGRITY_STRATEGIES: typing.Final[tuple[str, ...]] = (
+    "checksums",
+    "fsck-connectivity",
+    "none",
+    "pack-trailer",
+)
+_LAYOUTS: typing.Final[tuple[str, ...]] = ("flat", "sharded")
+_LOG_FORMATS: typing.Final[tuple[str, ...]] = ("json", "text")
+_IO_CLASSES: typing.Final[tuple[str, ...]] = ("best-effort", "idle")
+_PROFILE_MODES: typing.Final[tuple[str, ...]] = ("deterministic", "sampling")
 
-logger_wrapper.setup()  # Set up the logging system.
 logger = logging.getLogger(__name__)
 
 
+class _VersionAction(argparse.Action):
+    """Look up the version of the installed package only when it is requested."""
+
+    def __init__(self, option_strings: list[str], dest: str = argparse.SUPPRESS) -> None:
+        super().__init__(
+            option_strings=option_strings,
+            dest=dest,
+            default=argparse.SUPPRESS,
+            nargs=0,
+            help="show program's version number and exit",
+        )
+
+    def __call__(self, parser: argparse.ArgumentParser, *args: typing.Any) -> None:
+        from importlib.metadata import version
+
+        parser._print_message(f"{version('git-backupper')}\n", sys.stdout)
+        parser.exit()
+
+
+def _positive_integer(value: str) -> int:
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"invalid positive integer value: {value!r}")
+
+    return number
+
+
+def _fraction(value: str) -> float:
+    try:
+        number = float(value)
+    except ValueError:
+        number = -1.0
+
+    if not 0.0 <= number < 1.0:
+        raise argparse.ArgumentTypeError(f"invalid fraction value: {value!r}")
+
+    return number
+
+
+def _get_backup_options(arguments: argparse.Namespace) -> dict[str, typing.Any]:
+    from git_backupper import cache, integrity, profiling, repository, throttle
+
+    return {
+        "max_workers": arguments.max_workers,
+        "max_workers_per_host": arguments.max_workers_per_host,
+        "paranoid": arguments.paranoid,
+        "hash_workers": arguments.hash_workers,
+        "integrity_strategy": integrity.Strategy(arguments.integrity_strategy),
+        "cache_backend": cache.Backend(arguments.cache_backend),
+        "ssh_multiplexing": arguments.ssh_multiplexing,
+        "maintenance_thresholds": (
+            repository.MaintenanceThresholds(
+                packs=arguments.maintenance_packs,
+                loose_objects=arguments.maintenance_loose_objects,
+            )
+            if arguments.maintenance
+            else None
+        ),
+        "fetch_intervals": (
+            cache.FetchIntervals(minimum=arguments.min_interval, maximum=arguments.max_staleness)
+            if arguments.adaptive
+            else None
+        ),
+        "verification_budget": (
+            integrity.VerificationBudget(
+                max_bytes=arguments.verification_budget * 2**20,
+                max_age=arguments.verification_max_age * 86400.0,
+            )
+            if arguments.verification_budget is not None
+            else None
+        ),
+        "metrics_path": arguments.metrics_path,
+        "textfile_path": arguments.textfile_path,
+        "profile_path": arguments.profile_path,
+        "profile_mode": profiling.Mode(arguments.profile_mode),
+        "layout": repository.Layout(arguments.layout),
+        "read_rate": arguments.read_rate,  # the settings file is used without this option
+        "process_priority": (
+            throttle.Priority(
+                niceness=arguments.niceness,
+                io_class=throttle.IOClass(arguments.io_class) if arguments.io_class else None,
+            )
+            if arguments.niceness is not None or arguments.io_class is not None
+            else None
+        ),
+    }
+
+
+def _serve(arguments: argparse.Namespace) -> None:
+    import signal
+    import threading
+
+    from git_backupper import daemon, defaults
+
+    # Finish the current run and save the cache before stopping the service.
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *args: stop_event.set())
+
+    daemon.serve(
+        defaults.SETTINGS_PATH,
+        interval=arguments.interval,
+        jitter=arguments.jitter,
+        stop_event=stop_event,
+        **_get_backup_options(arguments),
+    )
+
+
+def _run(arguments: argparse.Namespace) -> None:
+    from git_backupper import api, cache, defaults, repository, settings
+
+    if arguments.command == "serve":
+        _serve(arguments)
+        return
+
+    # Step -- 1.
+    application_settings = settings.Settings.from_json(path=defaults.SETTINGS_PATH)
+    logger.warning(application_settings)
+
+    if arguments.migrate:
+        api.migrate(
+            application_settings.backup_path,
+            application_settings.iter_repositories(),
+            repository.Layout(arguments.layout),
+            cache_backend=cache.Backend(arguments.cache_backend),
+        )
+        return
+
+    # Step -- 2.
+    options = _get_backup_options(arguments)
+    options["read_rate"] = options["read_rate"] or application_settings.read_rate
+    api.backup(
+        application_settings.backup_path,
+        application_settings.iter_repositories(),  # read the manifest while backing up
+        **options,
+    )
+
+    # Step -- 3.
+    if arguments.export_path is not None:
+        api.export_bundles(
+            application_settings.backup_path,
+            application_settings.iter_repositories(),
+            arguments.export_path,
+            cache_backend=cache.Backend(arguments.cache_backend),
+            layout=repository.Layout(arguments.layout),
+            process_priority=options["process_priority"],
+        )
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(
         description="Simplest way to back up and restore git repositories."
     )
-    parser.add_argument("-v", "--version", action="version", version=version("git-backupper"))
+    parser.add_argument("-v", "--version", action=_VersionAction)
     parser.add_argument(
         "-d",
         "--debug",
@@ -28,19 +192,219 @@ def main() -> None:
         dest="logging_level",
         help="generate extensive debugging output during command execution",
     )
+    parser.add_argument(
+        "--log-format",
+        choices=_LOG_FORMATS,
+        default="text",
+        help="write the log records as text or json lines (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--async-logging",
+        action="store_true",
+        help="write the log records in a background thread without blocking the workers",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        default=1,
+        dest="max_workers",
+        metavar="N",
+        type=_positive_integer,
+        help="back up at most N repositories at the same time (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--cache-backend",
+        choices=_CACHE_BACKENDS,
+        help="choose the storage of the cache between runs "
+        "(default: pickle, sqlite for the serve command)",
+    )
+    parser.add_argument(
+        "--jobs-per-host",
+        dest="max_workers_per_host",
+        metavar="N",
+        type=_positive_integer,
+        help="back up at most N repositories from the same host at the same time",
+    )
+    parser.add_argument(
+        "--hash-jobs",
+        default=1,
+        dest="hash_workers",
+        metavar="N",
+        type=_positive_integer,
+        help="read at most N files of a repository at the same time (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--integrity",
+        choices=_INTEGRITY_STRATEGIES,
+        default="checksums",
+        dest="integrity_strategy",
+        help="choose the way to detect corrupted local copies (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--verification-budget",
+        metavar="MIB",
+        type=_positive_integer,
+        help="read every file of the local copies verified the longest time ago, "
+        "up to MIB mebibytes per run",
+    )
+    parser.add_argument(
+        "--verification-max-age",
+        default=7,
+        metavar="DAYS",
+        type=_positive_integer,
+        help="warn about the local copies not read in full for DAYS (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--read-rate",
+        metavar="BYTES",
+        type=_positive_integer,
+        help="read at most BYTES per second to calculate the checksums",
+    )
+    parser.add_argument(
+        "--nice",
+        choices=range(20),
+        dest="niceness",
+        metavar="N",
+        type=int,
+        help="run the git commands with the niceness from 0 to 19",
+    )
+    parser.add_argument(
+        "--ionice",
+        choices=_IO_CLASSES,
+        dest="io_class",
+        help="run the git commands with the disk scheduling class",
+    )
+    parser.add_argument(
+        "--ssh-multiplexing",
+        action="store_true",
+        help="share one ssh connection per host between all git commands",
+    )
+    parser.add_argument(
+        "--layout",
+        choices=_LAYOUTS,
+        default="flat",
+        help="place the local copies in one directory or spread them by host and url hash "
+        "(default: %(default)s)",
+    )
+    parser.add_argument(
+        "--migrate",
+        action="store_true",
+        help="move the local copies made with another layout to the chosen layout and exit",
+    )
+    parser.add_argument(
+        "--maintenance",
+        action="store_true",
+        help="repack the local copies with too many packs or loose objects after the fetch",
+    )
+    parser.add_argument(
+        "--maintenance-packs",
+        default=50,  # the same limit as the automatic garbage collection of git uses
+        metavar="N",
+        type=_positive_integer,
+        help="run the maintenance when there are at least N packs (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--maintenance-loose-objects",
+        default=6700,
+        metavar="N",
+        type=_positive_integer,
+        help="run the maintenance when there are at least N loose objects (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--adaptive",
+        action="store_true",
+        help="skip the repositories checked too recently given how often they have changed",
+    )
+    parser.add_argument(
+        "--min-interval",
+        default=300,
+        metavar="SECONDS",
+        type=_positive_integer,
+        help="check the most active repositories once per SECONDS (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--max-staleness",
+        default=86400,
+        metavar="SECONDS",
+        type=_positive_integer,
+        help="check every repository at least once per SECONDS (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--metrics",
+        dest="metrics_path",
+        metavar="FILE",
+        type=pathlib.Path,
+        help="write the durations of all phases of the backup to the JSON file",
+    )
+    parser.add_argument(
+        "--metrics-textfile",
+        dest="textfile_path",
+        metavar="FILE",
+        type=pathlib.Path,
+        help="write the same metrics to the textfile of the prometheus node exporter",
+    )
+    parser.add_argument(
+        "--profile",
+        dest="profile_path",
+        metavar="DIRECTORY",
+        type=pathlib.Path,
+        help="write the profiling statistics of every repository to the directory",
+    )
+    parser.add_argument(
+        "--profile-mode",
+        choices=_PROFILE_MODES,
+        default="deterministic",
+        help="choose the way to collect the profiling statistics (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--export-bundles",
+        dest="export_path",
+        metavar="DIRECTORY",
+        type=pathlib.Path,
+        help="write the changes of the local copies to new git bundle files after the backup",
+    )
+    parser.add_argument(
+        "--paranoid",
+        action="store_true",
+        help="read every file to verify the local copies even if the files look unchanged",
+    )
 
-    try:
-        arguments = parser.parse_args()
+    subparsers = parser.add_subparsers(dest="command", metavar="COMMAND")
+    serve_parser = subparsers.add_parser(
+        "serve",
+        description="Back up every repository on its own interval without stopping. "
+        "The options of the backups are given before the command.",
+        help="back up the repositories continuously in a long-running process",
+    )
+    serve_parser.add_argument(
+        "--interval",
+        default=3600,
+        metavar="SECONDS",
+        type=_positive_integer,
+        help="back up every repository once per SECONDS (default: %(default)s)",
+    )
+    serve_parser.add_argument(
+        "--jitter",
+        default=0.1,
+        metavar="FRACTION",
+        type=_fraction,
+        help="change every interval by up to this fraction at random (default: %(default)s)",
+    )
+
+    arguments = parser.parse_args()
+    if arguments.cache_backend is None:
+        # The service saves the cache after every run, so it writes only the changed entries.
+        arguments.cache_backend = "sqlite" if arguments.command == "serve" else "pickle"
 
-        # Assign a new severity level to the logging system.
-        logger.setLevel(arguments.logging_level)
+    from git_backupper import exceptions, logger_wrapper
 
-        # Step -- 1.
-        application_settings = settings.Settings.from_json(path=defaults.SETTINGS_PATH)
-        logger.warning(application_settings)
+    # Set up the logging system.
+    logger_wrapper.setup(queued=arguments.async_logging, structured=arguments.log_format == "json")
+    # Assign a new severity level to the logging system.
+    logger.setLevel(arguments.logging_level)
 
-        # Step -- 2.
-        api.backup(application_settings.backup_path, application_settings.repositories)
+    try:
+        _run(arguments)
     except (
         exceptions.ExternalProcessError,
         exceptions.FileSystemError,
@@ -55,6 +419,9 @@ def main() -> None:
         # Terminate the execution of this program due to a keyboard interruption.
         sys.exit(getattr(err, "errno", errno.EINTR))
 
+    finally:
+        logger_wrapper.shutdown()  # write the records left in the queue
+
 
 if __name__ == "__main__":
     main()
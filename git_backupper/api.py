@@ -1,59 +1,554 @@
 # Copyright 2023 (c) Vladislav Punko <iam.vlad.punko@gmail.com>
 
+import collections
+import collections.abc
+import contextlib
+import dataclasses
+import functools
 import logging
 import pathlib
+import threading
+import time
+import typing
 
-from git_backupper import cache, defaults, fs, repository
+from git_backupper import (
+    cache,
+    exceptions,
+    fs,
+    integrity,
+    manifest,
+    metrics,
+    profiling,
+    repository,
+    scheduler,
+    settings,
+    ssh,
+    throttle,
+)
+from git_backupper.settings import sources
 
 logger = logging.getLogger(__name__)
 
-__all__ = ["backup"]
+__all__ = ["backup", "export_bundles", "migrate"]
+
+# This is the number of waiting repositories per worker read from a stream at once.
+_LOOKAHEAD: typing.Final[int] = 16
+# This is the number of seconds between the saves of the cache during a run.
+_SAVE_INTERVAL: typing.Final[float] = 60.0
+
+
+@dataclasses.dataclass(frozen=True)
+class _BackupContext:
+    backup_cache: typing.MutableMapping[typing.Hashable, typing.Any]
+    lock: threading.Lock  # protect the cache shared between workers
+    path_locks: collections.defaultdict[pathlib.Path, threading.Lock] = dataclasses.field(
+        default_factory=lambda: collections.defaultdict(threading.Lock)
+    )
+    hash_workers: int = 1
+    integrity_strategy: integrity.Strategy = integrity.Strategy.CHECKSUMS
+    fetch_intervals: typing.Optional[cache.FetchIntervals] = None
+    maintenance_thresholds: typing.Optional[repository.MaintenanceThresholds] = None
+    paranoid: bool = False
+    verification_planner: typing.Optional[integrity.VerificationPlanner] = None
+    failed_urls: typing.Optional[set[str]] = None  # stop the run on the first error without it
+    persistent_cache: typing.Optional[typing.Union[cache.PersistentCache, cache.SQLiteCache]] = None
+
+
+def _maintain_repository(
+    backup_repository: repository.Repository, thresholds: repository.MaintenanceThresholds
+) -> None:
+    try:
+        if backup_repository.needs_maintenance(thresholds):
+            logger.info(
+                "Run the maintenance of the '%s' repository.", str(backup_repository.local_path)
+            )
+            backup_repository.run_maintenance()
+    except exceptions.ExternalProcessError:
+        # The local copy remains valid because git replaces the files only on success.
+        logger.warning(
+            "The maintenance of the '%s' repository has failed.", str(backup_repository.local_path)
+        )
+
+
+def _backup_repository(backup_repository: repository.Repository, context: _BackupContext) -> None:
+    try:
+        remote_references = backup_repository.list_remote_references()
+    except exceptions.ExternalProcessError:
+        logger.warning(
+            "The remote repository could not be detected for: '%s'.", backup_repository.url
+        )
+        return
+
+    with context.lock:
+        is_cached = backup_repository in context.backup_cache
+        if is_cached:
+            state = cache.RepositoryState.from_value(
+                context.backup_cache[backup_repository], path=backup_repository.local_path
+            )
+
+    # Step -- 1.
+    if is_cached and backup_repository.exists_locally():
+        # The local copies chosen by the planner are verified by reading every file.
+        is_audit = context.verification_planner is not None and (
+            context.verification_planner.is_selected(backup_repository)
+        )
+        with metrics.timer("verify"):
+            result = integrity.verify(
+                backup_repository,
+                state.checksums,
+                strategy=integrity.Strategy.CHECKSUMS if is_audit else context.integrity_strategy,
+                paranoid=is_audit or context.paranoid,
+                max_workers=context.hash_workers,
+            )
+
+        if result and is_audit:
+            state.verified_at = time.time()
+
+        if result and backup_repository.is_up_to_date(remote_references):
+            logger.info("The '%s' repository is up to date.", str(backup_repository.local_path))
+            state.record_check(changed=False)
+            with context.lock:
+                context.backup_cache[backup_repository] = state
+
+        elif result:
+            backup_repository.update_local_copy()  # git fetch
+            state.record_check(changed=True)
+            if context.maintenance_thresholds is not None:
+                _maintain_repository(backup_repository, context.maintenance_thresholds)
+
+            # Keep track of the files that have been created or changed by this update.
+            state.checksums = manifest.Manifest.from_checksums(
+                backup_repository.local_path,
+                fs.calculate_file_checksums(
+                    backup_repository.local_path,
+                    previous=state.checksums.to_checksums(backup_repository.local_path),
+                    max_workers=context.hash_workers,
+                ),
+            )
+            with context.lock:
+                context.backup_cache[backup_repository] = state
+        else:
+            if result.diff:
+                logger.warning(
+                    "The '%s' repository is corrupted. Files: %s.",
+                    str(backup_repository.local_path),
+                    result.diff,
+                )
+            else:
+                logger.warning(
+                    "The '%s' repository is corrupted.", str(backup_repository.local_path)
+                )
+            if backup_repository.local_path.is_dir():
+                fs.remove_directory(backup_repository.local_path)
+
+    # Step -- 2.
+    if not is_cached and (
+        backup_repository.local_path.is_dir() and not backup_repository.exists_locally()
+    ):
+        fs.remove_directory(backup_repository.local_path)
+
+    # Step -- 3.
+    if not backup_repository.local_path.is_dir():
+        backup_repository.create_local_copy()  # git clone
+        backup_repository.update_local_copy()  # git fetch -> FETCH_HEAD
+        state = cache.RepositoryState(
+            checksums=manifest.Manifest.from_checksums(
+                backup_repository.local_path,
+                fs.calculate_file_checksums(
+                    backup_repository.local_path, max_workers=context.hash_workers
+                ),
+            ),
+            verified_at=time.time(),  # every file has just been read
+        )
+        state.record_check(changed=True)
+        with context.lock:
+            context.backup_cache[backup_repository] = state
+
+
+def _backup_entry(
+    backup_repository: repository.Repository,
+    entry: settings.RepositoryEntry,
+    context: _BackupContext,
+) -> None:
+    # The options of the entry replace the options of the whole run for this repository.
+    if entry.integrity is not None:
+        context = dataclasses.replace(
+            context, integrity_strategy=integrity.Strategy(entry.integrity)
+        )
+    if entry.paranoid is not None:
+        context = dataclasses.replace(context, paranoid=entry.paranoid)
+
+    with context.lock:
+        path_lock = context.path_locks[backup_repository.local_path]
+
+    # Avoid running the git commands in the same directory at once.
+    with path_lock, profiling.section(backup_repository.unique_name):
+        with metrics.repository(backup_repository.url), metrics.timer("backup"):
+            start = time.monotonic()
+            try:
+                _backup_repository(backup_repository, context)
+            except (exceptions.ExternalProcessError, exceptions.FileSystemError):
+                if context.failed_urls is None:
+                    raise
+
+                logger.error("The backup of the '%s' repository has failed.", backup_repository.url)
+                with context.lock:
+                    context.failed_urls.add(backup_repository.url)
+                return
+
+            _add_duration(backup_repository, context, time.monotonic() - start)
+
+    # Keep the entries of this run when the process is killed before it is over.
+    if context.persistent_cache is not None:
+        with context.lock:
+            context.persistent_cache.flush(interval=_SAVE_INTERVAL)
+
+
+def _add_duration(
+    backup_repository: repository.Repository, context: _BackupContext, duration: float
+) -> None:
+    with context.lock:
+        if backup_repository not in context.backup_cache:
+            return  # the backup has been skipped
+
+        state = cache.RepositoryState.from_value(
+            context.backup_cache[backup_repository], path=backup_repository.local_path
+        )
+        state.add_duration(duration)
+        context.backup_cache[backup_repository] = state
+
+
+def _get_state(
+    backup_repository: repository.Repository, context: _BackupContext
+) -> typing.Optional[cache.RepositoryState]:
+    with context.lock:
+        value = context.backup_cache.get(backup_repository)
+
+    if value is None:
+        return None
+
+    return cache.RepositoryState.from_value(value, path=backup_repository.local_path)
+
+
+def _create_jobs(
+    backup_repositories: typing.Iterable[tuple[repository.Repository, settings.RepositoryEntry]],
+    context: _BackupContext,
+) -> typing.Iterator[scheduler.Job]:
+    now = time.time()
+
+    for backup_repository, entry in backup_repositories:
+        state = _get_state(backup_repository, context)
+
+        if (
+            state is not None
+            and context.fetch_intervals is not None
+            and state.get_next_check(context.fetch_intervals) > now
+        ):
+            logger.debug("The '%s' repository is not due yet.", str(backup_repository.local_path))
+            metrics.add("skipped_repositories", 1)
+            continue
+
+        if state is not None and context.verification_planner is not None:
+            context.verification_planner.add(
+                backup_repository, verified_at=state.verified_at, size=state.checksums.size
+            )
+
+        yield scheduler.Job(
+            func=functools.partial(_backup_entry, backup_repository, entry, context),
+            host=backup_repository.host,
+            # The first backup is usually the longest one.
+            cost=state.expected_duration if state is not None else float("inf"),
+        )
 
 
 def backup(
     backup_path: pathlib.Path,
-    repositories: list[str],
-    cache_path: pathlib.Path = defaults.CACHE_PATH,
+    repositories: typing.Iterable[typing.Union[str, settings.RepositoryEntry]],
+    cache_path: typing.Optional[pathlib.Path] = None,
+    max_workers: int = 1,
+    paranoid: bool = False,
+    hash_workers: int = 1,
+    integrity_strategy: integrity.Strategy = integrity.Strategy.CHECKSUMS,
+    cache_backend: cache.Backend = cache.Backend.PICKLE,
+    ssh_multiplexing: bool = False,
+    max_workers_per_host: typing.Optional[int] = None,
+    maintenance_thresholds: typing.Optional[repository.MaintenanceThresholds] = None,
+    fetch_intervals: typing.Optional[cache.FetchIntervals] = None,
+    verification_budget: typing.Optional[integrity.VerificationBudget] = None,
+    metrics_path: typing.Optional[pathlib.Path] = None,
+    textfile_path: typing.Optional[pathlib.Path] = None,
+    profile_path: typing.Optional[pathlib.Path] = None,
+    profile_mode: profiling.Mode = profiling.Mode.DETERMINISTIC,
+    layout: repository.Layout = repository.Layout.FLAT,
+    read_rate: typing.Optional[float] = None,
+    process_priority: typing.Optional[throttle.Priority] = None,
+    backup_cache: typing.Optional[typing.MutableMapping[typing.Hashable, typing.Any]] = None,
+    failed_urls: typing.Optional[set[str]] = None,
 ) -> None:
+    """Back up all the provided repositories using a bounded pool of worker threads.
+
+    Every worker goes through the same steps for a repository: it verifies the local
+    copy, updates it and makes a new clone when the local copy is corrupted. The
+    repositories sharing the same local path are always handled by one worker.
+
+    The repositories that took the longest time to back up during the previous runs
+    are started first. The number of workers for the same host can be limited.
+
+    The local copies are verified with the given integrity strategy. Only the files
+    with a changed status are read again to verify the local copies unless the
+    paranoid mode is used to calculate the checksum of every file anew.
+    The files of every repository are read by the given number of hashing threads.
+    Pass the verification budget to read every file of the local copies verified
+    the longest time ago until the budget of bytes is spent. The rest of the local
+    copies are verified with the given integrity strategy during this run.
+
+    Enable the ssh multiplexing to share one connection per host between all git
+    commands run by the workers.
+
+    The local copies with more packs or loose objects than the given thresholds are
+    repacked after every fetch. The maintenance is disabled without the thresholds.
+
+    Every check of a remote repository is recorded to estimate how often it changes.
+    Pass the fetch intervals to skip the repositories checked too recently given
+    their change rate. The repositories are never left unchecked for longer than the
+    maximum interval.
+
+    The durations of all phases, the number of files and bytes read to calculate
+    the checksums are written to the JSON report and the node exporter textfile
+    at the end of a successful run.
+
+    The profiling statistics of every local path are written to a separate file in
+    the given profile directory to find the hot spots of particular repositories.
+
+    Limit the read rate to share the disk with other programs. The files are read to
+    calculate the checksums at no more than the given number of bytes per second,
+    and the git commands are run with the given cpu and disk priority.
+
+    The repositories can be read one by one from a stream such as a large manifest.
+    The first backups are started while the rest are still being read in this case,
+    and the longest ones are started first only among the repositories read so far.
+    Every entry can replace the integrity strategy and the paranoid mode of the run.
+
+    The local copies are placed in the backup directory with the given layout. Use
+    the migration to move the existing local copies when the layout is changed.
+
+    The cache is saved at least once a minute while the repositories are backed up
+    to keep most of the entries when the process is killed before the end of a run.
+    Pass the opened cache to keep it in memory between the runs of a long-running
+    process. The cache is neither loaded nor saved by this function in this case.
+    Pass the set of failed urls to go on with the other repositories when the backup
+    of one of them fails. The urls of the failed repositories are added to the set.
+    """
     if not backup_path.is_dir():
         fs.create_directory(backup_path)
 
-    for repository_url in repositories:
-        backup_repository = repository.Repository.from_url(
-            parent_path=backup_path, url=repository_url
+    # Read all the repositories of a collection at once to start the longest ones first.
+    lookahead = (
+        None if isinstance(repositories, collections.abc.Collection) else (max_workers * _LOOKAHEAD)
+    )
+
+    with contextlib.ExitStack() as stack:
+        if profile_path is not None:
+            stack.enter_context(profiling.profile(profile_path, mode=profile_mode))
+
+        collector = stack.enter_context(metrics.collect())
+        if ssh_multiplexing:
+            stack.enter_context(ssh.multiplexing())
+
+        stack.enter_context(throttle.limit(read_rate))
+        if process_priority is not None:
+            stack.enter_context(throttle.priority(process_priority))
+
+        persistent_cache = None
+        if backup_cache is None:
+            persistent_cache = cache.open_cache(path=cache_path, backend=cache_backend)
+            backup_cache = stack.enter_context(persistent_cache)
+        context = _BackupContext(
+            backup_cache=backup_cache,
+            lock=threading.Lock(),
+            persistent_cache=persistent_cache,
+            hash_workers=hash_workers,
+            integrity_strategy=integrity_strategy,
+            fetch_intervals=fetch_intervals,
+            maintenance_thresholds=maintenance_thresholds,
+            paranoid=paranoid,
+            failed_urls=failed_urls,
+            verification_planner=(
+                integrity.VerificationPlanner(verification_budget)
+                if verification_budget is not None
+                else None
+            ),
         )
 
-        if not backup_repository.exists_on_remote():
-            logger.warning(
-                "The remote repository could not be detected for: '%s'.", backup_repository.url
+        backup_repositories = (
+            (
+                repository.Repository.from_url(
+                    parent_path=backup_path, url=entry.url, layout=layout
+                ),
+                entry,
             )
-            continue
+            for entry in sources.deduplicate(repositories)
+        )
+        scheduler.run(
+            _create_jobs(backup_repositories, context),
+            max_workers=max_workers,
+            max_workers_per_host=max_workers_per_host,
+            lookahead=lookahead,
+        )
+
+    if metrics_path is not None:
+        collector.write_json(metrics_path)
+    if textfile_path is not None:
+        collector.write_prometheus(textfile_path)
+
+
+def _write_bundles(
+    backup_repository: repository.Repository,
+    bundle_path: pathlib.Path,
+    references: dict[str, str],
+    prerequisites: set[str],
+) -> None:
+    new_objects = (
+        backup_repository.filter_new_objects(set(references.values()), prerequisites)
+        if prerequisites
+        else set(references.values())
+    )
+
+    new_references = {
+        reference: object_name
+        for reference, object_name in references.items()
+        if object_name in new_objects
+    }
+    if new_references:
+        backup_repository.create_bundle(
+            bundle_path, references=new_references, prerequisites=prerequisites
+        )
+
+    # The objects the other references point to are excluded by the prerequisites, so
+    # git would drop these references. Every such object gets its own small bundle file
+    # excluding only its parents, as one of them can be an ancestor of another one.
+    old_objects = sorted(set(references.values()) - new_objects)
+    for number, object_name in enumerate(old_objects, start=1):
+        backup_repository.create_bundle(
+            bundle_path.with_name(f"{bundle_path.stem}-{number}{bundle_path.suffix}"),
+            references={
+                reference: target
+                for reference, target in references.items()
+                if target == object_name
+            },
+            prerequisites={object_name},
+        )
+
 
-        with cache.PersistentCache(path=cache_path) as backup_cache:
-            # Step -- 1.
-            if backup_repository in backup_cache and backup_repository.exists_locally():
-                checksums = fs.calculate_checksums(backup_repository.local_path)
+def export_bundles(
+    backup_path: pathlib.Path,
+    repositories: typing.Iterable[typing.Union[str, settings.RepositoryEntry]],
+    export_path: pathlib.Path,
+    cache_path: typing.Optional[pathlib.Path] = None,
+    cache_backend: cache.Backend = cache.Backend.PICKLE,
+    layout: repository.Layout = repository.Layout.FLAT,
+    process_priority: typing.Optional[throttle.Priority] = None,
+) -> None:
+    """Write the objects added to the local copies since the previous export to new
+    bundle files in the provided directory.
+
+    The first bundle file of a repository has all its objects. Every next one has only
+    the objects of the changed references and requires the previous bundle files.
+    The references moved to the objects of the previous bundles are written to extra
+    bundle files named after the main one. The git commands writing the bundle files
+    are run with the given priority.
+    """
+    name = time.strftime("%Y%m%dT%H%M%SZ.bundle", time.gmtime())
+
+    with contextlib.ExitStack() as stack:
+        if process_priority is not None:
+            stack.enter_context(throttle.priority(process_priority))
+
+        backup_cache = stack.enter_context(cache.open_cache(path=cache_path, backend=cache_backend))
+        for entry in sources.deduplicate(repositories):
+            backup_repository = repository.Repository.from_url(
+                parent_path=backup_path, url=entry.url, layout=layout
+            )
+
+            if backup_repository not in backup_cache or not backup_repository.exists_locally():
+                logger.warning(
+                    "The local copy could not be detected for: '%s'.", backup_repository.url
+                )
+                continue
+
+            state = cache.RepositoryState.from_value(
+                backup_cache[backup_repository], path=backup_repository.local_path
+            )
+            references = backup_repository.list_local_references()
+
+            changed_references = {
+                reference: object_name
+                for reference, object_name in references.items()
+                if state.exported_references.get(reference) != object_name
+            }
+            if changed_references:
+                bundle_path = (
+                    export_path
+                    / backup_repository.local_path.relative_to(backup_path.expanduser())
+                    / name
+                )
+                fs.create_directory(bundle_path.parent)
+
+                _write_bundles(
+                    backup_repository,
+                    bundle_path,
+                    references=changed_references,
+                    prerequisites=set(state.exported_references.values()),
+                )
 
-                if backup_cache[backup_repository] == checksums:
-                    backup_repository.update_local_copy()  # git fetch
-                    backup_cache[backup_repository].update(checksums)
-                else:
+            state.exported_references = references
+            backup_cache[backup_repository] = state
+
+
+def migrate(
+    backup_path: pathlib.Path,
+    repositories: typing.Iterable[typing.Union[str, settings.RepositoryEntry]],
+    layout: repository.Layout,
+    cache_path: typing.Optional[pathlib.Path] = None,
+    cache_backend: cache.Backend = cache.Backend.PICKLE,
+) -> None:
+    """Move the local copies placed with other layouts to the paths of the given layout.
+
+    The directories are renamed in place, so nothing is cloned or read again, and the
+    cached states follow the local copies. The local copies cloned from other urls
+    and the paths already taken in the given layout are left as they are.
+    """
+    with cache.open_cache(path=cache_path, backend=cache_backend) as backup_cache:
+        for entry in sources.deduplicate(repositories):
+            target_repository = repository.Repository.from_url(
+                parent_path=backup_path, url=entry.url, layout=layout
+            )
+
+            for source_layout in repository.Layout:
+                source_repository = repository.Repository.from_url(
+                    parent_path=backup_path, url=entry.url, layout=source_layout
+                )
+                if source_layout is layout or not source_repository.exists_locally():
+                    continue
+
+                # Different urls can share the same local path in the flat layout.
+                if source_repository.get_local_url() != entry.url:
+                    continue
+
+                if target_repository.local_path.exists():
                     logger.warning(
-                        "The '%s' repository is corrupted.", str(backup_repository.local_path)
+                        "The '%s' path is already taken.", str(target_repository.local_path)
                     )
-                    if backup_repository.local_path.is_dir():
-                        fs.remove_directory(backup_repository.local_path)
+                    break
 
-            # Step -- 2.
-            if backup_repository not in backup_cache and (
-                backup_repository.local_path.is_dir() and not backup_repository.exists_locally()
-            ):
-                fs.remove_directory(backup_repository.local_path)
-
-            # Step -- 3.
-            if not backup_repository.local_path.is_dir():
-                backup_repository.create_local_copy()  # git clone
-                backup_repository.update_local_copy()  # git fetch -> FETCH_HEAD
-                backup_cache[backup_repository] = fs.calculate_checksums(
-                    backup_repository.local_path
+                fs.move_directory(source_repository.local_path, target_repository.local_path)
+                logger.info(
+                    "The '%s' repository has been moved to: '%s'.",
+                    str(source_repository.local_path),
+                    str(target_repository.local_path),
                 )
+
+                # The manifest keeps the paths relative to the local copy and remains valid.
+                if source_repository in backup_cache:
+                    backup_cache[target_repository] = backup_cache.pop(source_repository)
+                break
@@ -1,16 +1,122 @@
 # Copyright 2023 (c) Vladislav Punko <iam.vlad.punko@gmail.com>
 
 import collections
+import collections.abc
+import contextlib
+import dataclasses
+import enum
 import logging
 import pathlib
 import pickle
+import sqlite3
+import threading
+import time
 import typing
 
-from git_backupper import defaults, exceptions
+from git_backupper import defaults, exceptions, fs, manifest, metrics
 
 logger = logging.getLogger(__name__)
 
-__all__ = ["PersistentCache"]
+__all__ = [
+    "Backend",
+    "FetchIntervals",
+    "PersistentCache",
+    "RepositoryState",
+    "SQLiteCache",
+    "open_cache",
+]
+
+# This is the weight of the latest check in the moving average of the change rate.
+_SMOOTHING: typing.Final[float] = 0.3
+
+_T = typing.TypeVar("_T", bound="RepositoryState")
+
+
+class Backend(enum.Enum):
+    """The storage used to keep the cache between program runs."""
+
+    PICKLE = "pickle"  # load and save the whole cache at once
+    SQLITE = "sqlite"  # load and save the entries one by one
+
+    def __str__(self) -> str:
+        return self.value
+
+
+class FetchIntervals(typing.NamedTuple):
+    minimum: float = 300.0  # the seconds between the checks of the most active repositories
+    maximum: float = 86400.0  # the longest time a local copy can stay out of date
+
+
+@dataclasses.dataclass
+class RepositoryState:
+    """The state of the local copy of a repository kept between program runs."""
+
+    checksums: manifest.Manifest = dataclasses.field(default_factory=manifest.Manifest)
+    durations: list[float] = dataclasses.field(default_factory=list)  # the latest backups
+    # These are the references of the local copy written to the latest bundle file.
+    exported_references: dict[str, str] = dataclasses.field(default_factory=dict)
+    # The exponentially weighted share of checks of the remote repository that found changes.
+    change_rate: float = 1.0
+    checked_at: float = 0.0  # the unix time of the latest check
+    verified_at: float = 0.0  # the unix time of the latest verification of every file
+
+    def __setstate__(self, state: dict[str, typing.Any]) -> None:
+        # Fill in the fields added after the state had been saved by the previous versions.
+        for field in dataclasses.fields(self):
+            if field.name in state:
+                continue
+
+            if field.default_factory is not dataclasses.MISSING:
+                state[field.name] = field.default_factory()
+            elif field.default is not dataclasses.MISSING:
+                state[field.name] = field.default
+
+        self.__dict__.update(state)
+
+    @property
+    def expected_duration(self) -> float:
+        """Return the expected duration of the next backup based on the latest ones."""
+        if not self.durations:
+            return float("inf")
+
+        return sum(self.durations) / len(self.durations)
+
+    def add_duration(self, duration: float, limit: int = 5) -> None:
+        self.durations = [*self.durations, duration][-limit:]
+
+    def record_check(self, changed: bool) -> None:
+        """Keep track of whether the remote repository has changed since the previous check."""
+        self.change_rate = _SMOOTHING * changed + (1.0 - _SMOOTHING) * self.change_rate
+        self.checked_at = time.time()
+
+    def get_next_check(self, intervals: FetchIntervals) -> float:
+        """Return the unix time of the next check of the remote repository.
+
+        The time between the checks grows as the share of checks that found changes
+        goes down, from the minimum interval for the repositories changed every time
+        to the maximum one for the repositories that never change.
+        """
+        change_rate = max(self.change_rate, intervals.minimum / intervals.maximum)
+
+        return self.checked_at + min(intervals.minimum / change_rate, intervals.maximum)
+
+    @classmethod
+    def from_value(cls: type[_T], value: typing.Any, path: pathlib.Path) -> _T:
+        """Convert the cached value of the local copy in the provided path to the current
+        state representation.
+        """
+        if isinstance(value, cls):
+            return value
+
+        # The previous versions of this program kept nothing but the checksum values.
+        # The impossible file status forces the calculation of the checksum values again.
+        # The inode numbers are unsigned, and zero is never used for an existing file.
+        return cls(
+            checksums=manifest.Manifest.from_checksums(
+                path,
+                {item: fs.FileChecksum(digest, -1, -1, 0, -1) for item, digest in value.items()},
+            )
+        )
 
 
 class PersistentCache(collections.UserDict[typing.Hashable, typing.Any]):
@@ -19,6 +125,8 @@ class PersistentCache(collections.UserDict[typing.Hashable, typing.Any]):
 
         self.path = pathlib.Path(path).expanduser()
 
+        self._saved_at = time.monotonic()
+
     def __enter__(self) -> dict[typing.Hashable, typing.Any]:
         if self.path.is_file():
             self._load()
@@ -28,6 +136,17 @@ class PersistentCache(collections.UserDict[typing.Hashable, typing.Any]):
     def __exit__(self, *args: typing.Any, **kwargs: typing.Any) -> None:
         self._save()
 
+    def flush(self, interval: float = 0.0) -> None:
+        """Save the whole cache without closing it unless it has been saved within
+        the given number of seconds.
+        """
+        if time.monotonic() - self._saved_at < interval:
+            return
+
+        self._save()
+        self._saved_at = time.monotonic()
+
+    @metrics.timer("cache_load")
     def _load(self) -> None:
         try:
             with self.path.open(mode="rb") as stream_in:
@@ -46,6 +165,7 @@ class PersistentCache(collections.UserDict[typing.Hashable, typing.Any]):
                 "Unable to convert the input data into its original or structured form."
             ) from err
 
+    @metrics.timer("cache_save")
     def _save(self) -> None:
         try:
             with self.path.open(mode="wb") as stream_out:
@@ -55,3 +175,147 @@ class PersistentCache(collections.UserDict[typing.Hashable, typing.Any]):
                 "An error occurred while trying to dump data and save it to the current machine."
             )
             raise exceptions.FileSystemError(f"Failed to dump data to {str(self.path)!r}.") from err
+
+
+class SQLiteCache(collections.abc.MutableMapping[typing.Hashable, typing.Any]):
+    """The persistent cache keeping every entry in a separate row of a database.
+
+    Every lookup and update touches only the row of the provided key in a single
+    transaction. The data of the pickle cache is moved to a new database once.
+    """
+
+    def __init__(
+        self,
+        path: typing.Union[str, pathlib.Path] = defaults.CACHE_DATABASE_PATH,
+        legacy_path: typing.Optional[typing.Union[str, pathlib.Path]] = defaults.CACHE_PATH,
+    ) -> None:
+        self.path = pathlib.Path(path).expanduser()
+        self.legacy_path = pathlib.Path(legacy_path).expanduser() if legacy_path else None
+
+        self._connection: typing.Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()  # the connection is shared between threads
+
+    def __enter__(self) -> "SQLiteCache":
+        is_new = not self.path.is_file()
+
+        try:
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            with self._connection:
+                self._connection.execute(
+                    "CREATE TABLE IF NOT EXISTS cache "
+                    "(id TEXT PRIMARY KEY, key BLOB NOT NULL, value BLOB NOT NULL)"
+                )
+        except sqlite3.Error as err:
+            logger.error("It is impossible to open the database on the current machine.")
+            raise exceptions.FileSystemError(
+                f"Failed to open the database at {str(self.path)!r}."
+            ) from err
+
+        if is_new and self.legacy_path is not None and self.legacy_path.is_file():
+            self._migrate(self.legacy_path)
+
+        return self
+
+    def __exit__(self, *args: typing.Any, **kwargs: typing.Any) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def flush(self, interval: float = 0.0) -> None:
+        """Do nothing since every entry is saved as soon as it is changed."""
+
+    def __getitem__(self, key: typing.Hashable) -> typing.Any:
+        rows = self._execute("SELECT value FROM cache WHERE id = ?", (repr(key),))
+        if not rows:
+            raise KeyError(key)
+
+        return self._loads(rows[0][0])
+
+    def __setitem__(self, key: typing.Hashable, value: typing.Any) -> None:
+        self._execute(
+            "INSERT OR REPLACE INTO cache (id, key, value) VALUES (?, ?, ?)",
+            (repr(key), self._dumps(key), self._dumps(value)),
+        )
+
+    def __delitem__(self, key: typing.Hashable) -> None:
+        if key not in self:
+            raise KeyError(key)
+
+        self._execute("DELETE FROM cache WHERE id = ?", (repr(key),))
+
+    def __contains__(self, key: object) -> bool:
+        return bool(self._execute("SELECT 1 FROM cache WHERE id = ?", (repr(key),)))
+
+    def __iter__(self) -> typing.Iterator[typing.Hashable]:
+        return iter([self._loads(key) for key, in self._execute("SELECT key FROM cache")])
+
+    def __len__(self) -> int:
+        return int(self._execute("SELECT COUNT(*) FROM cache")[0][0])
+
+    @staticmethod
+    def _dumps(value: typing.Any) -> bytes:
+        return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def _loads(data: bytes) -> typing.Any:
+        try:
+            return pickle.loads(data)
+        except (EOFError, pickle.UnpicklingError) as err:
+            logger.error("The attempt to retrieve data stored using pickle has failed.")
+            raise exceptions.SettingsError(
+                "Unable to convert the input data into its original or structured form."
+            ) from err
+
+    def _execute(
+        self, statement: str, parameters: typing.Sequence[typing.Any] = ()
+    ) -> list[typing.Any]:
+        with self._transaction() as connection:
+            return connection.execute(statement, parameters).fetchall()
+
+    def _migrate(self, path: pathlib.Path) -> None:
+        legacy_cache = PersistentCache(path=path)
+        legacy_cache._load()
+
+        with self._transaction() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO cache (id, key, value) VALUES (?, ?, ?)",
+                [
+                    (repr(key), self._dumps(key), self._dumps(value))
+                    for key, value in legacy_cache.items()
+                ],
+            )
+
+        logger.info("The cache has been moved from '%s' to '%s'.", str(path), str(self.path))
+
+    @contextlib.contextmanager
+    def _transaction(self) -> typing.Iterator[sqlite3.Connection]:
+        if self._connection is None:
+            raise RuntimeError("The database must be opened using the with statement.")
+
+        try:
+            # Commit or roll back the transaction.
+            with metrics.timer("cache_transaction"), self._lock, self._connection:
+                yield self._connection
+        except sqlite3.Error as err:
+            logger.error("An error occurred while trying to access the database.")
+            raise exceptions.FileSystemError(
+                f"Failed to access the database at {str(self.path)!r}."
+            ) from err
+
+
+def open_cache(
+    path: typing.Optional[typing.Union[str, pathlib.Path]] = None,
+    backend: Backend = Backend.PICKLE,
+) -> typing.Union[PersistentCache, SQLiteCache]:
+    """Create the persistent cache of the provided type at the default or given path.
+
+    The pickle cache at the default path is moved only to the database at the default
+    path, as the database at another path is not related to it.
+    """
+    if backend is Backend.SQLITE:
+        if path is not None:
+            return SQLiteCache(path=path, legacy_path=None)
+
+        return SQLiteCache(path=defaults.CACHE_DATABASE_PATH)
+
+    return PersistentCache(path=path or defaults.CACHE_PATH)
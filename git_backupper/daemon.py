@@ -0,0 +1,184 @@
+# Copyright 2023 (c) Vladislav Punko <iam.vlad.punko@gmail.com>
+
+import heapq
+import logging
+import pathlib
+import random
+import threading
+import time
+import typing
+
+from git_backupper import api, cache, exceptions, settings
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["serve"]
+
+# This is the number of seconds between the checks of the settings file for changes.
+_RELOAD_INTERVAL: typing.Final[float] = 5.0
+# This is the longest number of seconds to wait before backing up a failed repository again.
+_RETRY_INTERVAL: typing.Final[float] = 300.0
+
+
+def _get_delay(interval: float, jitter: float) -> float:
+    # Spread the backups of repositories with the same interval over time.
+    return interval * (1.0 + random.uniform(-jitter, jitter))
+
+
+def _get_modification_times(
+    application_settings: settings.Settings, settings_path: pathlib.Path
+) -> tuple[int, ...]:
+    paths = [settings_path]
+    if application_settings.manifest is not None:
+        paths.append(application_settings.manifest)
+        # The directory is not changed when one of its files is changed in place.
+        if application_settings.manifest.is_dir():
+            paths.extend(sorted(application_settings.manifest.glob("*.jsonl")))
+
+    try:
+        return tuple(path.stat().st_mtime_ns for path in paths)
+    except OSError:
+        return ()  # the file is being replaced and will be read on the next check
+
+
+class _Schedule:
+    """The repositories of the settings file along with the times of their next backups."""
+
+    def __init__(self) -> None:
+        self.entries: dict[str, settings.RepositoryEntry] = {}
+
+        self._due: dict[str, float] = {}
+        self._heap: list[tuple[float, str]] = []
+
+    def update(self, entries: typing.Iterable[settings.RepositoryEntry]) -> None:
+        """Replace the repositories keeping the times of backups of the remaining ones."""
+        now = time.monotonic()
+        self.entries = {entry.url: entry for entry in entries}
+
+        for url in self._due.keys() - self.entries.keys():
+            del self._due[url]  # the entry in the heap is skipped later
+
+        for url in self.entries.keys() - self._due.keys():
+            self.push(url, now)  # back up the new repositories at once
+
+    def push(self, url: str, due: float) -> None:
+        self._due[url] = due
+        heapq.heappush(self._heap, (due, url))
+
+    def pop_ready(self, now: float) -> list[settings.RepositoryEntry]:
+        ready = []
+
+        while self._heap and self._heap[0][0] <= now:
+            due, url = heapq.heappop(self._heap)
+            # Skip the removed repositories and the outdated times of rescheduled ones.
+            if self._due.get(url) == due:
+                del self._due[url]
+                ready.append(self.entries[url])
+
+        return ready
+
+    def get_next_due(self) -> float:
+        # Drop the outdated times to find the next backup at the top of the heap.
+        while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+        return self._heap[0][0] if self._heap else float("inf")
+
+
+def _reload(
+    application_settings: settings.Settings, settings_path: pathlib.Path, schedule: _Schedule
+) -> settings.Settings:
+    try:
+        new_settings = settings.Settings.from_json(settings_path)
+        schedule.update(new_settings.iter_repositories())
+    except (exceptions.FileSystemError, exceptions.SettingsError):
+        logger.warning("The previous settings are used until the settings file is fixed.")
+        return application_settings
+
+    logger.info("The settings have been loaded again from: '%s'.", str(settings_path))
+    return new_settings
+
+
+def serve(
+    settings_path: pathlib.Path,
+    interval: float,
+    jitter: float = 0.1,
+    stop_event: typing.Optional[threading.Event] = None,
+    cache_path: typing.Optional[pathlib.Path] = None,
+    cache_backend: cache.Backend = cache.Backend.SQLITE,
+    **options: typing.Any,
+) -> None:
+    """Back up every repository on its own interval until the stop event is set.
+
+    The settings are loaded once and kept in memory along with the opened cache. The
+    settings file and the manifest are read again as soon as they are changed. The new repositories
+    are backed up at once, and the removed ones are no longer backed up.
+
+    Every repository is backed up again after the given number of seconds or the
+    interval of its entry. The intervals are changed by the given fraction at random
+    to avoid backing up all repositories at the same time. A failed repository does
+    not stop the backups of other ones and is backed up again sooner than the rest.
+
+    The cache is saved after every run. The default database backend writes only the
+    changed entries, while the pickle backend rewrites the whole cache every time.
+    The options are passed to the backup function as they are, and the read rate of
+    the settings file is used when none is given.
+    """
+    stop_event = stop_event or threading.Event()
+
+    if cache_backend is cache.Backend.PICKLE:
+        logger.warning("The whole cache is saved after every run with the pickle backend.")
+
+    application_settings = settings.Settings.from_json(settings_path)
+    modification_times = _get_modification_times(application_settings, settings_path)
+
+    schedule = _Schedule()
+    schedule.update(application_settings.iter_repositories())
+    next_reload = time.monotonic() + _RELOAD_INTERVAL
+
+    persistent_cache = cache.open_cache(path=cache_path, backend=cache_backend)
+    with persistent_cache as backup_cache:
+        while not stop_event.is_set():
+            if time.monotonic() >= next_reload:
+                next_reload = time.monotonic() + _RELOAD_INTERVAL
+
+                current_times = _get_modification_times(application_settings, settings_path)
+                if current_times and current_times != modification_times:
+                    application_settings = _reload(application_settings, settings_path, schedule)
+                    modification_times = _get_modification_times(
+                        application_settings, settings_path
+                    )
+
+            ready = schedule.pop_ready(time.monotonic())
+            if not ready:
+                stop_event.wait(
+                    max(0.0, min(schedule.get_next_due(), next_reload) - time.monotonic())
+                )
+                continue
+
+            failed_urls: set[str] = set()
+            try:
+                api.backup(
+                    application_settings.backup_path,
+                    ready,
+                    backup_cache=backup_cache,
+                    failed_urls=failed_urls,
+                    **{
+                        **options,
+                        "read_rate": options.get("read_rate") or application_settings.read_rate,
+                    },
+                )
+            except (exceptions.ExternalProcessError, exceptions.FileSystemError):
+                # The remaining repositories of this run are backed up on the next one.
+                logger.error("The backup has failed and will be run again later.")
+                failed_urls.update(entry.url for entry in ready)
+            finally:
+                persistent_cache.flush()
+
+            finished_at = time.monotonic()
+            for entry in ready:
+                entry_interval = entry.interval or interval
+                if entry.url in failed_urls:
+                    entry_interval = min(entry_interval, _RETRY_INTERVAL)
+
+                schedule.push(entry.url, finished_at + _get_delay(entry_interval, jitter))
@@ -1,32 +1,96 @@
 # Copyright 2023 (c) Vladislav Punko <iam.vlad.punko@gmail.com>
 
+import concurrent.futures
+import errno
 import hashlib
-import io
 import logging
+import mmap
+import os
 import pathlib
 import shutil
+import typing
 
-from git_backupper import exceptions
+from git_backupper import exceptions, metrics, throttle
 
 logger = logging.getLogger(__name__)
 
-__all__ = ["calculate_checksum", "calculate_checksums", "create_directory", "remove_directory"]
+# This is the same buffer size as the standard library uses to calculate file digests.
+_BUFFER_SIZE: typing.Final[int] = 2**18  # 256 KiB
+_MMAP_THRESHOLD: typing.Final[int] = 2**26  # 64 MiB
+
+__all__ = [
+    "FileChecksum",
+    "calculate_checksum",
+    "calculate_checksums",
+    "calculate_file_checksums",
+    "create_directory",
+    "have_same_digests",
+    "move_directory",
+    "remove_directory",
+]
+
+
+class FileChecksum(typing.NamedTuple):
+    """The checksum value of a file and the file status it was calculated for."""
+
+    digest: str
+    size: int
+    mtime_ns: int
+    inode: int
+    ctime_ns: int
+
+    @classmethod
+    def from_stat(cls, digest: str, status: os.stat_result) -> "FileChecksum":
+        return cls(digest, status.st_size, status.st_mtime_ns, status.st_ino, status.st_ctime_ns)
+
+    def matches(self, status: os.stat_result) -> bool:
+        """Check whether the file has kept the same status since the checksum calculation."""
+        return (self.size, self.mtime_ns, self.inode, self.ctime_ns) == (
+            status.st_size,
+            status.st_mtime_ns,
+            status.st_ino,
+            status.st_ctime_ns,
+        )
+
+
+def _update_hash(hash_func: typing.Any, stream_in: typing.BinaryIO, buffer_size: int) -> None:
+    # Read the data into the same buffer to avoid creating a new bytes object per chunk.
+    buffer = bytearray(buffer_size)
+    view = memoryview(buffer)
+
+    while size := stream_in.readinto(buffer):  # type: ignore[attr-defined]
+        hash_func.update(view[:size])
+        throttle.consume(size)
 
 
-def calculate_checksum(path: pathlib.Path, buffer_size: int = io.DEFAULT_BUFFER_SIZE) -> str:
+def calculate_checksum(path: pathlib.Path, buffer_size: int = _BUFFER_SIZE) -> str:
     """Calculate the checksum value for the provided path.
 
     The function uses the sha-256 algorithm to calculate the hash value. This hash
     function is well-suited for detecting accidental or intentional data changes
     in digital information.
+
+    Large files are mapped into memory and hashed without copying the data. Other
+    files are read in chunks of the given size into a buffer created only once.
+    All files are read in chunks when the read rate is limited.
     """
     hash_func = hashlib.sha256()
 
     try:
         with path.expanduser().open(mode="rb", buffering=0) as stream_in:
-            for chunk in iter(lambda: stream_in.read(buffer_size), b""):
-                hash_func.update(chunk)
-    except OSError as err:
+            if throttle.is_limited():
+                _update_hash(hash_func, stream_in, buffer_size)
+
+            elif os.fstat(stream_in.fileno()).st_size >= _MMAP_THRESHOLD:
+                with mmap.mmap(stream_in.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                    hash_func.update(buffer)
+
+            elif hasattr(hashlib, "file_digest") and buffer_size == _BUFFER_SIZE:
+                hash_func = hashlib.file_digest(stream_in, "sha256")  # python 3.11+
+
+            else:
+                _update_hash(hash_func, stream_in, buffer_size)
+    except (OSError, ValueError) as err:  # the file can be truncated before mapping it
         logger.error("It is impossible to calculate the checksum value for the provided path.")
         raise exceptions.FileSystemError(
             f"Failed to calculate the checksum value for the provided path {str(path)!r}."
@@ -35,19 +99,73 @@ def calculate_checksum(path: pathlib.Path, buffer_size: int = io.DEFAULT_BUFFER_
     return hash_func.hexdigest()
 
 
-def calculate_checksums(path: pathlib.Path) -> dict[pathlib.Path, str]:
+def calculate_checksums(path: pathlib.Path, max_workers: int = 1) -> dict[pathlib.Path, str]:
     """Calculate the checksums of all files in the provided directory path and its
     associated subdirectories on the current working machine.
     """
-    checksums: dict[pathlib.Path, str] = {}
+    return {
+        item: checksum.digest
+        for item, checksum in calculate_file_checksums(path, max_workers=max_workers).items()
+    }
+
+
+@metrics.timer("checksums")
+def calculate_file_checksums(
+    path: pathlib.Path,
+    previous: typing.Optional[typing.Mapping[pathlib.Path, FileChecksum]] = None,
+    max_workers: int = 1,
+    exclude: typing.Optional[typing.Callable[[pathlib.Path], bool]] = None,
+) -> dict[pathlib.Path, FileChecksum]:
+    """Calculate the checksums of all files in the provided directory path along with
+    the status of every file.
+
+    The checksum values from the previous calculation are used again for the files
+    whose size, modification time, inode number and change time remain the same.
+    Pass nothing to calculate the checksum value of every file from scratch.
+
+    The files are read by the given number of threads. The largest files are read
+    first to keep all threads busy until the very end of the calculation. Use the
+    exclude function to skip the files verified in some other way.
+    """
+    previous = previous or {}
+    checksums: dict[pathlib.Path, typing.Optional[FileChecksum]] = {}
+    statuses: dict[pathlib.Path, os.stat_result] = {}
 
     for item in path.glob("**/*"):
-        if not item.is_file():
+        if not item.is_file() or (exclude is not None and exclude(item)):
             continue
 
-        checksums[item] = calculate_checksum(item)
+        try:
+            status = item.stat()
+        except OSError as err:
+            logger.error("It is impossible to get the status of the provided path.")
+            raise exceptions.FileSystemError(
+                f"Failed to get the status of the provided path {str(item)!r}."
+            ) from err
+
+        checksum = previous.get(item)
+        if checksum is None or not checksum.matches(status):
+            checksum = None
+            statuses[item] = status
+
+        checksums[item] = checksum  # keep the order of files
+
+    paths = sorted(statuses, key=lambda item: statuses[item].st_size, reverse=True)
 
-    return checksums
+    if max_workers > 1 and len(paths) > 1:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            digests = executor.map(calculate_checksum, paths)
+            for item, digest in zip(paths, digests):
+                checksums[item] = FileChecksum.from_stat(digest, statuses[item])
+    else:
+        for item in paths:
+            checksums[item] = FileChecksum.from_stat(calculate_checksum(item), statuses[item])
+
+    metrics.add("hashed_files", len(paths))
+    metrics.add("hashed_bytes", sum(statuses[item].st_size for item in paths))
+    metrics.add("reused_files", len(checksums) - len(paths))
+
+    return typing.cast(dict[pathlib.Path, FileChecksum], checksums)
 
 
 def create_directory(path: pathlib.Path) -> None:
@@ -62,6 +180,33 @@ def create_directory(path: pathlib.Path) -> None:
         ) from err
 
 
+def have_same_digests(
+    checksums: typing.Mapping[pathlib.Path, FileChecksum],
+    other: typing.Mapping[pathlib.Path, FileChecksum],
+) -> bool:
+    """Compare the content of files regardless of the status they have on the disk."""
+    if checksums.keys() != other.keys():
+        return False
+
+    return all(checksums[item].digest == other[item].digest for item in checksums)
+
+
+def move_directory(path: pathlib.Path, target_path: pathlib.Path) -> None:
+    """Rename the directory without copying its files, keeping the status of every file."""
+    try:
+        target_path.parent.mkdir(parents=True, exist_ok=True)
+        # Fail rather than replace an empty directory at the target path.
+        if target_path.exists():
+            raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), str(target_path))
+
+        path.rename(target_path)
+    except OSError as err:
+        logger.error("It is impossible to move a directory on the current machine.")
+        raise exceptions.FileSystemError(
+            f"Failed to move directory {str(path)!r} to {str(target_path)!r}."
+        ) from err
+
+
 def remove_directory(path: pathlib.Path) -> None:
     try:
         # There are no built-in python functions to remove a symbolic link to a directory.
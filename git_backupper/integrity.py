@@ -0,0 +1,205 @@
+# Copyright 2023 (c) Vladislav Punko <iam.vlad.punko@gmail.com>
+
+import enum
+import hashlib
+import heapq
+import itertools
+import logging
+import pathlib
+import threading
+import time
+import typing
+
+from git_backupper import fs, manifest, repository
+
+logger = logging.getLogger(__name__)
+
+__all__ = [
+    "Strategy",
+    "VerificationBudget",
+    "VerificationPlanner",
+    "VerificationResult",
+    "verify",
+    "verify_pack",
+]
+
+# Git uses the hash algorithm of the repository to name the pack files after their trailers.
+_HASH_ALGORITHMS: typing.Final[dict[int, str]] = {20: "sha1", 32: "sha256"}
+
+_IDX_SIGNATURE: typing.Final[bytes] = b"\377tOc"
+_PACK_SIGNATURE: typing.Final[bytes] = b"PACK"
+
+# This checksum never matches any file to mark the pack files that failed the verification.
+_UNKNOWN_CHECKSUM: typing.Final[fs.FileChecksum] = fs.FileChecksum("0" * 64, -1, -1, 0, -1)
+
+
+class Strategy(enum.Enum):
+    """The way to make sure that the local copy of a repository has not been corrupted."""
+
+    CHECKSUMS = "checksums"  # read every changed file
+    FSCK_CONNECTIVITY = "fsck-connectivity"  # ask git to walk all reachable objects
+    NONE = "none"
+    PACK_TRAILER = "pack-trailer"  # read nothing but the trailers of the immutable pack files
+
+    def __str__(self) -> str:
+        return self.value
+
+
+class VerificationResult(typing.NamedTuple):
+    is_consistent: bool
+    diff: manifest.ManifestDiff = manifest.ManifestDiff()  # the files that differ
+
+    def __bool__(self) -> bool:
+        return self.is_consistent
+
+
+class VerificationBudget(typing.NamedTuple):
+    max_bytes: int  # the size of files read to verify the local copies fully per run
+    max_age: float = 604800.0  # the seconds a local copy is expected to go without a full audit
+
+
+class VerificationPlanner:
+    """Choose the local copies to verify fully without exceeding the budget of a run.
+
+    The local copies verified the longest time ago are chosen first among the ones
+    added so far, so every local copy is verified in turn over a number of runs.
+    """
+
+    def __init__(self, budget: VerificationBudget) -> None:
+        self.budget = budget
+        self.remaining_bytes = budget.max_bytes
+
+        self._candidates: list[tuple[float, int, int, repository.Repository]] = []
+        self._counter = itertools.count()  # keep the order of local copies verified at once
+        self._lock = threading.Lock()
+        self._selected: set[repository.Repository] = set()
+
+    def add(self, backup_repository: repository.Repository, verified_at: float, size: int) -> None:
+        with self._lock:
+            heapq.heappush(
+                self._candidates, (verified_at, next(self._counter), size, backup_repository)
+            )
+
+    def is_selected(self, backup_repository: repository.Repository) -> bool:
+        """Check whether the local copy is to be verified fully during this run."""
+        with self._lock:
+            now = time.time()
+
+            while self._candidates:
+                verified_at, _, size, candidate = heapq.heappop(self._candidates)
+                if size <= self.remaining_bytes:
+                    self.remaining_bytes -= size
+                    self._selected.add(candidate)
+
+                elif verified_at + self.budget.max_age <= now:
+                    logger.warning(
+                        "The budget is too small to verify the '%s' repository in time.",
+                        str(candidate.local_path),
+                    )
+
+            return backup_repository in self._selected
+
+
+def _is_pack_file(path: pathlib.Path) -> bool:
+    return (
+        path.parent.name == "pack"
+        and path.parent.parent.name == "objects"
+        and path.name.startswith("pack-")
+        and path.suffix in {".idx", ".pack"}
+    )
+
+
+def verify_pack(path: pathlib.Path) -> bool:
+    """Verify the pack file by reading only its header, trailer and index file.
+
+    The pack file is named after the hash value written at its very end. The index
+    file keeps the same hash value of the pack file and the hash value of itself.
+    """
+    name = path.stem.removeprefix("pack-")
+    hash_size = len(name) // 2
+    try:
+        algorithm = _HASH_ALGORITHMS[hash_size]
+
+        with path.open(mode="rb") as stream_in:
+            header = stream_in.read(12)
+            stream_in.seek(-hash_size, 2)  # go to the end of the file
+            trailer = stream_in.read(hash_size)
+
+        index = path.with_suffix(".idx").read_bytes()
+    except (KeyError, OSError):
+        logger.debug("Failed to read the pack file: '%s'.", str(path), exc_info=True)
+        return False
+
+    if header[:4] != _PACK_SIGNATURE or trailer.hex() != name:
+        return False
+
+    # The index file ends with the hash value of the pack file and the hash value of itself.
+    index_size = len(index) - hash_size
+    if not index.endswith(trailer, 0, index_size):
+        return False
+
+    if index[:4] == _IDX_SIGNATURE:  # version 2 and later
+        if hashlib.new(algorithm, index[:index_size]).digest() != index[index_size:]:
+            return False
+
+        # The last entry of the fan-out table is the number of objects in the pack file.
+        if index[1028:1032] != header[8:12]:
+            return False
+
+    return True
+
+
+def verify(
+    backup_repository: repository.Repository,
+    checksums: manifest.Manifest,
+    strategy: Strategy = Strategy.CHECKSUMS,
+    paranoid: bool = False,
+    max_workers: int = 1,
+) -> VerificationResult:
+    """Check that the local copy of the repository has remained the same since the
+    provided checksums were calculated.
+
+    The paranoid mode makes the verification read all files that are verified by
+    their checksums even if their status remains unchanged.
+    """
+    if strategy is Strategy.NONE:
+        return VerificationResult(is_consistent=True)
+
+    if strategy is Strategy.FSCK_CONNECTIVITY:
+        return VerificationResult(is_consistent=backup_repository.check_connectivity())
+
+    expected = checksums.to_checksums(backup_repository.local_path)
+    # Do not use the file status to skip reading any files for a full audit.
+    previous = None if paranoid else expected
+
+    if strategy is Strategy.CHECKSUMS:
+        actual = fs.calculate_file_checksums(
+            backup_repository.local_path, previous=previous, max_workers=max_workers
+        )
+    else:
+        actual = fs.calculate_file_checksums(
+            backup_repository.local_path,
+            previous=previous,
+            max_workers=max_workers,
+            exclude=_is_pack_file,
+        )
+
+        # Verify every pack once for both its pack and index files.
+        valid_packs: dict[pathlib.Path, bool] = {}
+        for path in filter(_is_pack_file, backup_repository.local_path.glob("objects/pack/pack-*")):
+            pack_path = path.with_suffix(".pack")
+            if pack_path not in valid_packs:
+                valid_packs[pack_path] = verify_pack(pack_path)
+
+            checksum = expected.get(path, _UNKNOWN_CHECKSUM)
+            # The pack files are immutable, so the valid ones keep the previous checksums.
+            if not valid_packs[pack_path]:
+                checksum = _UNKNOWN_CHECKSUM
+
+            actual[path] = checksum
+
+    actual_checksums = manifest.Manifest.from_checksums(backup_repository.local_path, actual)
+    if actual_checksums == checksums:
+        return VerificationResult(is_consistent=True)
+
+    return VerificationResult(is_consistent=False, diff=checksums.diff(actual_checksums))
@@ -1,33 +1,90 @@
 # Copyright 2023 (c) Vladislav Punko <iam.vlad.punko@gmail.com>
 
+import atexit
+import json
 import logging
 import logging.config
+import logging.handlers
 import os
+import queue
 import tempfile
+import typing
 
-__all__ = ["setup"]
+from git_backupper import metrics
 
+__all__ = ["JSONFormatter", "setup", "shutdown"]
 
-def setup(level: int = logging.WARNING) -> None:
+_listener: typing.Optional[logging.handlers.QueueListener] = None
+
+
+class _ContextFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        # Keep the fields added by the thread that has created the record.
+        if not hasattr(record, "repository"):
+            record.repository, record.phase = metrics.get_context()
+
+        return True
+
+
+class JSONFormatter(logging.Formatter):
+    """Format every record as a single line of JSON with the repository and phase
+    processed by the thread that has created the record.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "repository": getattr(record, "repository", ""),
+            "phase": getattr(record, "phase", ""),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+
+        return json.dumps({key: value for key, value in entry.items() if value})
+
+
+def setup(level: int = logging.WARNING, queued: bool = False, structured: bool = False) -> None:
+    """Set up the logging system to write the records to the console and log file.
+
+    The queued mode moves the formatting and writing of the records to a background
+    thread, so the workers never wait for the disk or terminal. The records left in
+    the queue are written by the shutdown function called at the exit.
+    """
+    global _listener
+
+    shutdown()  # stop the listener of the previous setup
     logging.config.dictConfig(
         {
             "disable_existing_loggers": False,
+            "filters": {
+                "context": {
+                    "()": _ContextFilter,
+                },
+            },
             "formatters": {
                 "default": {
                     "format": "%(asctime)s - %(levelname)s :: %(name)s :: %(message)s",
                 },
+                "json": {
+                    "()": JSONFormatter,
+                },
             },
             "handlers": {
                 "console": {
                     "class": "logging.StreamHandler",
-                    "formatter": "default",
+                    "filters": ["context"],
+                    "formatter": "json" if structured else "default",
                     "stream": "ext://sys.stdout",
                 },
                 "logfile": {
                     "class": "logging.FileHandler",
                     "encoding": "utf-8",
                     "filename": os.path.join(tempfile.gettempdir(), "git-backupper.log"),
-                    "formatter": "default",
+                    "filters": ["context"],
+                    "formatter": "json" if structured else "default",
                     "mode": "at",
                 },
             },
@@ -40,3 +97,29 @@ def setup(level: int = logging.WARNING) -> None:
             "version": 1,
         }
     )
+
+    if not queued:
+        return
+
+    root_logger = logging.getLogger()
+    records: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+
+    queue_handler = logging.handlers.QueueHandler(records)
+    queue_handler.addFilter(_ContextFilter())
+
+    _listener = logging.handlers.QueueListener(
+        records, *root_logger.handlers, respect_handler_level=True
+    )
+    root_logger.handlers = [queue_handler]
+    _listener.start()
+
+    atexit.register(shutdown)
+
+
+def shutdown() -> None:
+    """Write all records left in the queue and stop the background thread."""
+    global _listener
+
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,247 @@
+# Copyright 2023 (c) Vladislav Punko <iam.vlad.punko@gmail.com>
+
+import array
+import bisect
+import collections
+import collections.abc
+import hashlib
+import itertools
+import pathlib
+import sys
+import typing
+
+from git_backupper import fs
+
+__all__ = ["Manifest", "ManifestDiff"]
+
+_DIGEST_SIZE: typing.Final[int] = 32  # sha-256
+_STATE_SIZE: typing.Final[int] = 3  # size, mtime_ns and ctime_ns
+
+_T = typing.TypeVar("_T", bound="Manifest")
+
+
+class ManifestDiff(typing.NamedTuple):
+    added: tuple[str, ...] = ()
+    changed: tuple[str, ...] = ()
+    removed: tuple[str, ...] = ()
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.changed or self.removed)
+
+    def __str__(self) -> str:
+        return "; ".join(
+            f"{name} {_format_paths(paths)}" for name, paths in self._asdict().items() if paths
+        )
+
+
+def _format_paths(paths: tuple[str, ...], limit: int = 5) -> str:
+    text = ", ".join(repr(path) for path in paths[:limit])
+
+    return f"{text} and {len(paths) - limit} more" if len(paths) > limit else text
+
+
+class Manifest(collections.abc.Mapping[str, fs.FileChecksum]):
+    """The compact representation of the checksum values of all files in a directory.
+
+    The paths relative to the directory are kept sorted in a single tuple. The raw
+    digests and file statuses are packed into contiguous buffers in the same order.
+    The inode numbers are kept apart since they are unsigned 64-bit values.
+
+    Every directory has a hash value calculated from the names and hash values of
+    its files and subdirectories. Two manifests are compared by their root hash
+    values, and the differences are searched only in the subdirectories whose hash
+    values do not match.
+    """
+
+    __slots__ = ("_digests", "_inodes", "_paths", "_states", "_tree")
+
+    def __init__(self, checksums: typing.Iterable[tuple[str, fs.FileChecksum]] = ()) -> None:
+        entries = sorted(checksums)
+
+        self._paths = tuple(sys.intern(path) for path, _ in entries)
+        self._digests = b"".join(bytes.fromhex(checksum.digest) for _, checksum in entries)
+        self._states = array.array(
+            "q",
+            itertools.chain.from_iterable(
+                (checksum.size, checksum.mtime_ns, checksum.ctime_ns) for _, checksum in entries
+            ),
+        )
+        self._inodes = array.array("Q", (checksum.inode for _, checksum in entries))
+        self._tree = self._build_tree()
+
+    def __setstate__(self, state: tuple[None, dict[str, typing.Any]]) -> None:
+        _, slots = state
+        if "_inodes" not in slots:
+            # The previous versions kept the inode numbers along with the other values.
+            states = slots["_states"]
+            slots["_inodes"] = array.array("Q", (max(inode, 0) for inode in states[2::4]))
+            slots["_states"] = array.array(
+                "q",
+                itertools.chain.from_iterable(
+                    (states[index], states[index + 1], states[index + 3])
+                    for index in range(0, len(states), 4)
+                ),
+            )
+
+        for name, value in slots.items():
+            setattr(self, name, value)
+
+    @classmethod
+    def from_checksums(
+        cls: type[_T],
+        path: pathlib.Path,
+        checksums: typing.Mapping[pathlib.Path, fs.FileChecksum],
+    ) -> _T:
+        """Create the manifest from the checksum values of files in the provided path."""
+        return cls((item.relative_to(path).as_posix(), value) for item, value in checksums.items())
+
+    def __getitem__(self, key: str) -> fs.FileChecksum:
+        index = bisect.bisect_left(self._paths, key)
+        if index == len(self._paths) or self._paths[index] != key:
+            raise KeyError(key)
+
+        return self._get_checksum(index)
+
+    def __iter__(self) -> typing.Iterator[str]:
+        return iter(self._paths)
+
+    def __len__(self) -> int:
+        return len(self._paths)
+
+    def __eq__(self, other: object) -> bool:
+        # Compare the content of files regardless of the status they have on the disk.
+        if not isinstance(other, Manifest):
+            return NotImplemented
+
+        return self._tree[""] == other._tree[""]
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(files={len(self)}, root={self.root!r})"
+
+    @property
+    def size(self) -> int:
+        """Return the total size of all files in bytes."""
+        return sum(self._states[::_STATE_SIZE])  # the size is the first value of every file
+
+    @property
+    def root(self) -> str:
+        """Return the hash value of the whole directory."""
+        return self._tree[""].hex()
+
+    def diff(self, other: "Manifest") -> ManifestDiff:
+        """Find the files added, changed and removed in the other manifest."""
+        added: list[str] = []
+        changed: list[str] = []
+        removed: list[str] = []
+        self._diff_directory(other, "", added, changed, removed)
+
+        return ManifestDiff(
+            added=tuple(sorted(added)),
+            changed=tuple(sorted(changed)),
+            removed=tuple(sorted(removed)),
+        )
+
+    def to_checksums(self, path: pathlib.Path) -> dict[pathlib.Path, fs.FileChecksum]:
+        """Restore the checksum values of files in the provided path."""
+        return {path / item: self._get_checksum(index) for index, item in enumerate(self._paths)}
+
+    def _get_checksum(self, index: int) -> fs.FileChecksum:
+        start, end = index * _STATE_SIZE, (index + 1) * _STATE_SIZE
+        size, mtime_ns, ctime_ns = self._states[start:end]
+        return fs.FileChecksum(
+            self._get_digest(index).hex(), size, mtime_ns, self._inodes[index], ctime_ns
+        )
+
+    def _get_digest(self, index: int) -> bytes:
+        start, end = index * _DIGEST_SIZE, (index + 1) * _DIGEST_SIZE
+        return self._digests[start:end]
+
+    def _build_tree(self) -> dict[str, bytes]:
+        entries: collections.defaultdict[str, list[bytes]] = collections.defaultdict(list)
+        directories = {""}
+
+        for index, path in enumerate(self._paths):
+            directory, _, name = path.rpartition("/")
+            entries[directory].append(b"f " + name.encode() + b"\0" + self._get_digest(index))
+
+            while directory not in directories:
+                directories.add(directory)
+                directory = directory.rpartition("/")[0]
+
+        tree: dict[str, bytes] = {}
+        # Calculate the hash values of the deepest directories before their parents.
+        for directory in sorted(directories, key=lambda item: item.count("/") + bool(item))[::-1]:
+            tree[directory] = hashlib.sha256(b"".join(sorted(entries[directory]))).digest()
+
+            if directory:
+                parent, _, name = directory.rpartition("/")
+                entries[parent].append(b"d " + name.encode() + b"\0" + tree[directory])
+
+        return tree
+
+    def _diff_directory(
+        self,
+        other: "Manifest",
+        directory: str,
+        added: list[str],
+        changed: list[str],
+        removed: list[str],
+    ) -> None:
+        if self._tree.get(directory) == other._tree.get(directory):
+            return  # all files in the directory remain the same
+
+        files, subdirectories = self._list_directory(directory)
+        other_files, other_subdirectories = other._list_directory(directory)
+
+        for path in files.keys() | other_files.keys():
+            if path not in other_files:
+                removed.append(path)
+            elif path not in files:
+                added.append(path)
+            elif self._get_digest(files[path]) != other._get_digest(other_files[path]):
+                changed.append(path)
+
+        for subdirectory in subdirectories | other_subdirectories:
+            if subdirectory not in other_subdirectories:
+                removed.extend(self._list_subtree(subdirectory))
+            elif subdirectory not in subdirectories:
+                added.extend(other._list_subtree(subdirectory))
+            else:
+                self._diff_directory(other, subdirectory, added, changed, removed)
+
+    def _get_subtree_range(self, directory: str) -> tuple[int, int]:
+        if not directory:
+            return 0, len(self._paths)
+
+        # All paths of the subtree are sorted right after each other.
+        return (
+            bisect.bisect_left(self._paths, directory + "/"),
+            bisect.bisect_left(self._paths, directory + "0"),  # the next character after "/"
+        )
+
+    def _list_directory(self, directory: str) -> tuple[dict[str, int], set[str]]:
+        files: dict[str, int] = {}
+        subdirectories: set[str] = set()
+
+        prefix = directory + "/" if directory else ""
+        offset = len(prefix)
+
+        index, end = self._get_subtree_range(directory)
+        while index < end:
+            path = self._paths[index]
+            name, separator, _ = path[offset:].partition("/")
+            if not separator:
+                files[path] = index
+                index += 1
+                continue
+
+            subdirectories.add(prefix + name)
+            # Skip the rest of the subdirectory.
+            index = bisect.bisect_left(self._paths, prefix + name + "0", index, end)
+
+        return files, subdirectories
+
+    def _list_subtree(self, directory: str) -> tuple[str, ...]:
+        start, end = self._get_subtree_range(directory)
+
+        return self._paths[start:end]
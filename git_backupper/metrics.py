@@ -0,0 +1,178 @@
+# Copyright 2023 (c) Vladislav Punko <iam.vlad.punko@gmail.com>
+
+import collections
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import pathlib
+import tempfile
+import threading
+import time
+import typing
+
+from git_backupper import exceptions
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["Collector", "add", "collect", "get_context", "repository", "timer"]
+
+_PREFIX: typing.Final[str] = "git_backupper"
+
+# This is the repository processed by the current thread. The other metrics belong to the run.
+_repository: contextvars.ContextVar[str] = contextvars.ContextVar("repository", default="")
+_phase: contextvars.ContextVar[str] = contextvars.ContextVar("phase", default="")
+
+_collector: typing.Optional["Collector"] = None
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _write_atomically(path: pathlib.Path, text: str) -> None:
+    # The readers of the file must never see a half-written report.
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            mode="wt", dir=path.parent, prefix=f".{path.name}.", delete=False, encoding="utf-8"
+        ) as stream_out:
+            stream_out.write(text)
+
+        os.replace(stream_out.name, path)
+    except OSError as err:
+        logger.error("It is impossible to write the metrics report on the current machine.")
+        raise exceptions.FileSystemError(f"Failed to write the metrics to {str(path)!r}.") from err
+
+
+class Collector:
+    """The storage of the durations of phases and the counters of every repository."""
+
+    def __init__(self) -> None:
+        self.calls: collections.defaultdict[str, collections.Counter[str]] = (
+            collections.defaultdict(collections.Counter)
+        )
+        self.counters: collections.defaultdict[str, collections.defaultdict[str, float]] = (
+            collections.defaultdict(lambda: collections.defaultdict(float))
+        )
+        self.durations: collections.defaultdict[str, collections.defaultdict[str, float]] = (
+            collections.defaultdict(lambda: collections.defaultdict(float))
+        )
+        self.finished_at = 0.0  # the unix time of the end of the run
+
+        self._lock = threading.Lock()  # the metrics are recorded by many threads
+
+    def add(self, name: str, value: float, repository_url: str = "") -> None:
+        with self._lock:
+            self.counters[repository_url][name] += value
+
+    def add_duration(self, phase: str, duration: float, repository_url: str = "") -> None:
+        with self._lock:
+            self.calls[repository_url][phase] += 1
+            self.durations[repository_url][phase] += duration
+
+    def to_dict(self) -> dict[str, typing.Any]:
+        with self._lock:
+            repository_urls = sorted(self.calls.keys() | self.counters.keys())
+
+            def get_report(repository_url: str) -> dict[str, typing.Any]:
+                return {
+                    "phases": {
+                        phase: {"calls": calls, "seconds": self.durations[repository_url][phase]}
+                        for phase, calls in sorted(self.calls[repository_url].items())
+                    },
+                    **dict(sorted(self.counters[repository_url].items())),
+                }
+
+            return {
+                "finished_at": self.finished_at,
+                "run": get_report(""),
+                "repositories": {url: get_report(url) for url in repository_urls if url},
+            }
+
+    def to_prometheus(self) -> str:
+        """Return the metrics in the text format of the node exporter."""
+        report = self.to_dict()
+        reports = {"": report["run"], **report["repositories"]}
+
+        lines = [
+            f"# HELP {_PREFIX}_last_run_timestamp_seconds The end time of the last run.",
+            f"# TYPE {_PREFIX}_last_run_timestamp_seconds gauge",
+            f"{_PREFIX}_last_run_timestamp_seconds {report['finished_at']}",
+        ]
+        for name, kind in (("seconds", "time spent in"), ("calls", "number of calls of")):
+            lines.append(f"# HELP {_PREFIX}_phase_{name} The {kind} every phase of the last run.")
+            lines.append(f"# TYPE {_PREFIX}_phase_{name} gauge")
+            for url, values in reports.items():
+                for phase, phase_values in values["phases"].items():
+                    lines.append(
+                        f'{_PREFIX}_phase_{name}{{repository="{_escape(url)}",'
+                        f'phase="{_escape(phase)}"}} {phase_values[name]}'
+                    )
+
+        counters = sorted({name for values in reports.values() for name in values} - {"phases"})
+        for name in counters:
+            lines.append(f"# HELP {_PREFIX}_{name} The {name.replace('_', ' ')} of the last run.")
+            lines.append(f"# TYPE {_PREFIX}_{name} gauge")
+            for url, values in reports.items():
+                if name in values:
+                    lines.append(f'{_PREFIX}_{name}{{repository="{_escape(url)}"}} {values[name]}')
+
+        return "\n".join(lines) + "\n"
+
+    def write_json(self, path: pathlib.Path) -> None:
+        _write_atomically(path, json.dumps(self.to_dict(), indent=2) + "\n")
+
+    def write_prometheus(self, path: pathlib.Path) -> None:
+        _write_atomically(path, self.to_prometheus())
+
+
+def add(name: str, value: float) -> None:
+    """Add the value to the counter of the repository processed by the current thread."""
+    if _collector is not None:
+        _collector.add(name, value, repository_url=_repository.get())
+
+
+@contextlib.contextmanager
+def collect() -> typing.Iterator[Collector]:
+    """Record the metrics of all threads to the same collector in this context."""
+    global _collector
+
+    collector = Collector()
+    previous_collector, _collector = _collector, collector
+    try:
+        yield collector
+    finally:
+        collector.finished_at = time.time()
+        _collector = previous_collector
+
+
+def get_context() -> tuple[str, str]:
+    """Return the repository and the innermost phase processed by the current thread."""
+    return _repository.get(), _phase.get()
+
+
+@contextlib.contextmanager
+def repository(repository_url: str) -> typing.Iterator[None]:
+    """Assign the metrics recorded by the current thread to the provided repository."""
+    token = _repository.set(repository_url)
+    try:
+        yield
+    finally:
+        _repository.reset(token)
+
+
+@contextlib.contextmanager
+def timer(phase: str) -> typing.Iterator[None]:
+    """Add the duration of this context to the phase of the current repository."""
+    collector, start = _collector, time.perf_counter()
+    token = _phase.set(phase)
+    try:
+        yield
+    finally:
+        _phase.reset(token)
+        if collector is not None:
+            collector.add_duration(
+                phase, time.perf_counter() - start, repository_url=_repository.get()
+            )
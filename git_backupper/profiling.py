@@ -0,0 +1,185 @@
+# Copyright 2023 (c) Vladislav Punko <iam.vlad.punko@gmail.com>
+
+import collections
+import contextlib
+import cProfile
+import enum
+import logging
+import marshal
+import pathlib
+import sys
+import threading
+import types
+import typing
+
+from git_backupper import exceptions, fs
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["Mode", "profile", "section"]
+
+_MAIN_SECTION: typing.Final[str] = "main"  # the repository names always end with .git
+
+# This is the same key of a function as the profiler of the standard library uses.
+_Function = tuple[str, int, str]
+
+_profile: typing.Optional[tuple[pathlib.Path, "Mode"]] = None
+_sampler: typing.Optional["_Sampler"] = None
+
+
+class Mode(enum.Enum):
+    """The way to collect the statistics of the function calls."""
+
+    DETERMINISTIC = "deterministic"  # record every call with a noticeable overhead
+    SAMPLING = "sampling"  # look at the call stacks of the threads from time to time
+
+    def __str__(self) -> str:
+        return self.value
+
+
+def _get_stack(frame: typing.Optional[types.FrameType]) -> tuple[_Function, ...]:
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+        frame = frame.f_back
+
+    return tuple(reversed(stack))  # from the outermost call to the current one
+
+
+def _to_stats(samples: collections.Counter[tuple[_Function, ...]], interval: float) -> dict:
+    # Every entry has the primitive and total numbers of calls, the time spent in the
+    # function itself, the time spent in the function and its callees and the callers.
+    stats: dict[_Function, list[typing.Any]] = {}
+
+    for stack, count in samples.items():
+        duration = count * interval
+
+        for index, function in enumerate(stack):
+            entry = stats.setdefault(function, [0, 0, 0.0, 0.0, {}])
+            if function not in stack[:index]:  # count the recursive calls once
+                entry[0] += count
+                entry[1] += count
+                entry[3] += duration
+
+            if index:
+                caller = stack[index - 1]
+                calls, primitive_calls, own_time, total_time = entry[4].get(caller, (0, 0, 0, 0))
+                entry[4][caller] = (
+                    calls + count,
+                    primitive_calls + count,
+                    own_time + (duration if index == len(stack) - 1 else 0),
+                    total_time + duration,
+                )
+
+        stats[stack[-1]][2] += duration
+
+    return {function: tuple(entry) for function, entry in stats.items()}
+
+
+def _dump(stats: dict, path: pathlib.Path) -> None:
+    try:
+        with path.open(mode="wb") as stream_out:
+            marshal.dump(stats, stream_out)
+    except OSError as err:
+        logger.error("It is impossible to save the profiling statistics on the current machine.")
+        raise exceptions.FileSystemError(
+            f"Failed to dump the statistics to {str(path)!r}."
+        ) from err
+
+
+class _Sampler(threading.Thread):
+    def __init__(self, interval: float = 0.005) -> None:
+        super().__init__(daemon=True, name="git-backupper-sampler")
+
+        self.interval = interval
+        self.samples: collections.defaultdict[str, collections.Counter[tuple[_Function, ...]]] = (
+            collections.defaultdict(collections.Counter)
+        )
+        self.sections: dict[int, str] = {}  # the names of sections run by the threads
+
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            frames = sys._current_frames()
+
+            with self._lock:
+                for thread_id, name in self.sections.items():
+                    stack = _get_stack(frames.get(thread_id))
+                    if stack:
+                        self.samples[name][stack] += 1
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.join()
+
+    def enter(self, name: str) -> None:
+        with self._lock:
+            self.sections[threading.get_ident()] = name
+
+    def exit(self) -> None:
+        with self._lock:
+            self.sections.pop(threading.get_ident(), None)
+
+
+@contextlib.contextmanager
+def profile(directory: pathlib.Path, mode: Mode = Mode.DETERMINISTIC) -> typing.Iterator[None]:
+    """Collect the statistics of the function calls made in this context.
+
+    The statistics of the sections run by other threads are written to separate
+    files in the provided directory. The rest is written to the main.pstats file.
+    """
+    global _profile, _sampler
+
+    fs.create_directory(directory)
+
+    _profile = (directory, mode)
+    if mode is Mode.SAMPLING:
+        _sampler = _Sampler()
+        _sampler.start()
+    try:
+        with section(_MAIN_SECTION):
+            yield
+    finally:
+        if _sampler is not None:
+            _sampler.stop()
+            for name, samples in _sampler.samples.items():
+                _dump(_to_stats(samples, _sampler.interval), directory / f"{name}.pstats")
+
+        _profile = _sampler = None
+
+
+@contextlib.contextmanager
+def section(name: str) -> typing.Iterator[None]:
+    """Collect the statistics of the current thread to the file with the provided name."""
+    if _profile is None:
+        yield
+        return
+
+    directory, mode = _profile
+    if mode is Mode.SAMPLING and _sampler is not None:
+        _sampler.enter(name)
+        try:
+            yield
+        finally:
+            _sampler.exit()
+        return
+
+    # The deterministic profiler records the function calls of the current thread only.
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:  # python 3.12+ allows a single active profiler for all threads
+        logger.warning("The profiling statistics cannot be collected for: '%s'.", name)
+        yield
+        return
+
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.create_stats()
+        _dump(profiler.stats, directory / f"{name}.pstats")  # type: ignore[attr-defined]
+        logger.debug("The profiling statistics have been saved for: '%s'.", name)
@@ -0,0 +1,130 @@
+# Copyright 2023 (c) Vladislav Punko <iam.vlad.punko@gmail.com>
+
+import collections
+import io
+import logging
+import re
+import typing
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["Progress", "Tracker", "Transfer", "parse", "read_lines"]
+
+# Git redraws the progress lines in place using carriage returns.
+_LINE_SEPARATOR: typing.Final[re.Pattern[bytes]] = re.compile(rb"[\r\n]")
+_MAX_LINE_SIZE: typing.Final[int] = 2**13  # 8 KiB
+
+_PROGRESS_PATTERN: typing.Final[re.Pattern[str]] = re.compile(
+    r"(?:remote: )?(?P<phase>[A-Z][a-z]+(?: [a-z]+)*):\s+(?P<percent>\d+)%"
+    r" \((?P<current>\d+)/(?P<total>\d+)\)"
+    r"(?:, (?P<size>[\d.]+) (?P<size_unit>bytes|[KMG]iB))?"
+    r"(?: \| (?P<rate>[\d.]+) (?P<rate_unit>bytes|[KMG]iB)/s)?"
+    r"(?P<done>, done\.)?"
+)
+# The remote side reports the number of objects sent even for the smallest transfers.
+_TOTAL_PATTERN: typing.Final[re.Pattern[str]] = re.compile(
+    r"(?:remote: )?Total (?P<total>\d+) \(delta \d+\).*"
+)
+_UNITS: typing.Final[dict[str, int]] = {"bytes": 1, "KiB": 2**10, "MiB": 2**20, "GiB": 2**30}
+
+
+class Progress(typing.NamedTuple):
+    phase: str  # for example, receiving objects or resolving deltas
+    current: int
+    total: int
+    received_bytes: int = 0  # git shows the sizes of large transfers only
+    rate: float = 0.0  # bytes per second
+    done: bool = False
+
+
+class Transfer(typing.NamedTuple):
+    objects: int = 0
+    received_bytes: int = 0
+    rate: float = 0.0  # bytes per second at the end of the transfer
+
+
+def _to_bytes(value: typing.Optional[str], unit: typing.Optional[str]) -> float:
+    return float(value) * _UNITS[unit] if value and unit else 0.0
+
+
+def parse(line: str) -> typing.Optional[Progress]:
+    """Return the progress event for the progress line of git or nothing for others."""
+    match = _TOTAL_PATTERN.fullmatch(line.rstrip())
+    if match is not None:
+        total = int(match["total"])
+        return Progress(phase="Total", current=total, total=total, done=True)
+
+    match = _PROGRESS_PATTERN.fullmatch(line.rstrip())
+    if match is None:
+        return None
+
+    return Progress(
+        phase=match["phase"],
+        current=int(match["current"]),
+        total=int(match["total"]),
+        received_bytes=int(_to_bytes(match["size"], match["size_unit"])),
+        rate=_to_bytes(match["rate"], match["rate_unit"]),
+        done=match["done"] is not None,
+    )
+
+
+def read_lines(stream: io.BufferedIOBase, buffer_size: int = 2**16) -> typing.Iterator[str]:
+    """Read the lines separated by the line feeds or carriage returns from the stream.
+
+    Only one chunk and a single line of limited size are kept in memory, and longer
+    lines are split into parts of that size.
+    """
+    pending = b""
+
+    while True:
+        chunk = stream.read1(buffer_size)
+        if not chunk:
+            break
+
+        *lines, pending = _LINE_SEPARATOR.split(pending + chunk)
+        if len(pending) > _MAX_LINE_SIZE:
+            lines.append(pending)
+            pending = b""
+
+        for line in lines:
+            for start in range(0, len(line), _MAX_LINE_SIZE):
+                end = start + _MAX_LINE_SIZE
+                if line[start:end].strip():
+                    yield line[start:end].decode(errors="replace")
+
+    if pending.strip():
+        yield pending.decode(errors="replace")
+
+
+class Tracker:
+    """Keep the latest progress events of every phase and the last messages of git."""
+
+    def __init__(self, max_messages: int = 20) -> None:
+        self.events: dict[str, Progress] = {}
+        self.messages: collections.deque[str] = collections.deque(maxlen=max_messages)
+
+    @property
+    def transfer(self) -> Transfer:
+        # Git unpacks the objects of small transfers instead of keeping the received pack
+        # and shows the progress of neither for the smallest ones.
+        event = (
+            self.events.get("Receiving objects")
+            or self.events.get("Unpacking objects")
+            or self.events.get("Total")
+        )
+        if event is None:
+            return Transfer()
+
+        return Transfer(objects=event.total, received_bytes=event.received_bytes, rate=event.rate)
+
+    def consume(self, stream: io.BufferedIOBase) -> None:
+        for line in read_lines(stream):
+            event = parse(line)
+            if event is None:
+                self.messages.append(line)
+                logger.info("%s", line)
+                continue
+
+            self.events[event.phase] = event
+            if event.done:
+                logger.debug("%s", line)
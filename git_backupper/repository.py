@@ -1,33 +1,61 @@
 # Copyright 2023 (c) Vladislav Punko <iam.vlad.punko@gmail.com>
 
+import contextvars
 import dataclasses
+import enum
+import hashlib
 import logging
 import os
 import pathlib
 import reprlib
 import shlex
 import subprocess
+import threading
 import types
 import typing
+import urllib.parse
 
-from git_backupper import exceptions
+from git_backupper import exceptions, metrics, progress, throttle
 
 GIT_COMMANDS: typing.Final[types.MappingProxyType[str, str]] = types.MappingProxyType(
     {
-        "clone": "git clone --mirror --no-hardlinks -- {0!r} {1!r}",
-        "fetch": "git -C {0!r} fetch --all --verbose",
+        "bundle": "git -C {0!r} bundle create --quiet {1!r} --stdin",
+        "clone": "git clone --mirror --no-hardlinks --progress -- {0!r} {1!r}",
+        "commit-graph": "git -C {0!r} commit-graph write --reachable --split --no-progress",
+        "config": "git -C {0!r} config --get remote.origin.url",
+        "count-objects": "git -C {0!r} count-objects -v",
+        "fetch": "git -C {0!r} fetch --all --progress --verbose",
+        "for-each-ref": "git -C {0!r} for-each-ref --format='%(objectname) %(refname)'",
+        "fsck": "git -C {0!r} fsck --connectivity-only --no-progress",
         "ls-remote": "git ls-remote --exit-code -- {0!r}",
+        # Merge the small packs until every pack is at least twice as big as the next one.
+        "repack": "git -C {0!r} repack -d --quiet --geometric=2 --write-midx",
+        "rev-list": "git -C {0!r} rev-list --objects --stdin",
         "rev-parse": "git -C {0!r} rev-parse --git-dir",
     }
 )
 
 logger = logging.getLogger(__name__)
 
-__all__ = ["Repository"]
+__all__ = ["Layout", "MaintenanceThresholds", "Repository"]
+
+# Most file systems limit the length of a single name to 255 bytes.
+_MAX_NAME_LENGTH: typing.Final[int] = 200
+_LOCAL_HOST: typing.Final[str] = "local"  # the shard of repositories without a host name
 
 _T = typing.TypeVar("_T", bound="Repository")
 
 
+class Layout(enum.Enum):
+    """The way to place the local copies in the backup directory."""
+
+    FLAT = "flat"  # <name>.git
+    SHARDED = "sharded"  # <host>/<aa>/<bb>/<org>__<name>-<hash>.git
+
+    def __str__(self) -> str:
+        return self.value
+
+
 def _get_repository_name(url: str) -> str:
     """Return the name of a particular repository specified by its web address."""
     name = url.split("/").pop()
@@ -35,7 +63,75 @@ def _get_repository_name(url: str) -> str:
     return name if name.endswith(".git") else f"{name}.git"
 
 
-def _run_git_command(command: str, silent: bool = False) -> None:
+def _get_host(url: str) -> str:
+    if "://" in url:
+        return urllib.parse.urlsplit(url).hostname or ""
+
+    # This is the scp-like syntax for ssh: [user@]host:path/to/repository.git
+    address, separator, _ = url.partition(":")
+    if not separator or "/" in address:
+        return ""
+
+    return address.rpartition("@")[2].lower()
+
+
+def _get_sharded_path(url: str) -> pathlib.Path:
+    """Return the path of a repository relative to the backup directory in the sharded
+    layout. The two levels of directories named by the hash value of the url keep the
+    number of entries in every directory small, and the longer prefix of the hash value
+    in the name keeps apart the urls with the same path.
+    """
+    digest = hashlib.sha256(url.encode()).hexdigest()
+
+    host = _get_host(url)
+    if "://" in url:
+        path = urllib.parse.urlsplit(url).path
+    else:
+        path = url.partition(":")[2] if host else url
+
+    # Keep the organization and group names to tell apart the repositories with the same name.
+    parts = [part for part in path.split("/") if part not in {"", ".", ".."}]
+    name = "__".join(parts).removesuffix(".git")[-_MAX_NAME_LENGTH:]
+    # The joined parts and the host without a port are ambiguous without the hash value.
+    name = f"{name}-{digest[:12]}" if name else digest
+
+    return pathlib.Path(host or _LOCAL_HOST, digest[:2], digest[2:4], f"{name}.git")
+
+
+def _parse_references(output: str) -> dict[str, str]:
+    """Return the object names of references from the output of git commands."""
+    references = {}
+
+    for line in output.splitlines():
+        object_name, reference = line.split()
+        # Skip the symbolic reference and the peeled tags since mirrors keep neither of them.
+        if reference == "HEAD" or reference.endswith("^{}"):
+            continue
+
+        references[reference] = object_name
+
+    return references
+
+
+def _get_phase(arguments: list[str]) -> str:
+    # Skip the options of git itself to get the name of its subcommand.
+    arguments = arguments[3:] if arguments[1:2] == ["-C"] else arguments[1:]
+
+    return f"git {arguments[0]}" if arguments else "git"
+
+
+def _run_git_command(
+    command: str,
+    silent: bool = False,
+    capture_output: bool = False,
+    input: typing.Optional[str] = None,
+    tracker: typing.Optional[progress.Tracker] = None,
+) -> str:
+    """Run the git command and return its output if it has been captured.
+
+    The messages of git are read line by line in a separate thread and written to
+    the log instead of the terminal. The progress lines are passed to the tracker.
+    """
     env: dict[str, str] = {
         # Disables the prompting of the git credential helper and avoids blocking
         # when the user is required to enter authentication credentials.
@@ -43,15 +139,88 @@ def _run_git_command(command: str, silent: bool = False) -> None:
     }
     env.update(os.environ)
 
-    stdout = stderr = subprocess.DEVNULL if silent else None  # streams
-    try:
-        subprocess.check_call(shlex.split(command), env=env, stdout=stdout, stderr=stderr)
-    except subprocess.CalledProcessError as err:
+    stdout = subprocess.PIPE if capture_output else subprocess.DEVNULL
+    tracker = tracker or progress.Tracker()
+
+    arguments = shlex.split(command)
+    phase = _get_phase(arguments)
+    arguments = [*throttle.get_command_prefix(), *arguments]  # run with the lower priority
+
+    with metrics.timer(phase):
+        if silent:
+            process = subprocess.run(
+                arguments, env=env, input=input, stdout=stdout, stderr=subprocess.DEVNULL, text=True
+            )
+        else:
+            process = _run_process(arguments, env=env, input=input, stdout=stdout, tracker=tracker)
+
+    if process.returncode:
         if not silent:
             logger.error(
                 "An error occurred on the machine while attempting to execute the command."
             )
-        raise exceptions.ExternalProcessError(f"Failed to run the command: {command!r}.") from err
+            for message in tracker.messages:
+                logger.error("%s", message)
+        raise exceptions.ExternalProcessError(
+            f"Failed to run the command: {command!r}."
+        ) from subprocess.CalledProcessError(process.returncode, arguments)
+
+    return process.stdout or ""
+
+
+def _run_process(
+    arguments: list[str],
+    env: dict[str, str],
+    input: typing.Optional[str],
+    stdout: int,
+    tracker: progress.Tracker,
+) -> subprocess.CompletedProcess[str]:
+    # Use a separate pipe to read the messages while the output is being collected.
+    read_fd, write_fd = os.pipe()
+    try:
+        process = subprocess.Popen(
+            arguments,
+            env=env,
+            stdin=subprocess.PIPE if input is not None else subprocess.DEVNULL,
+            stdout=stdout,
+            stderr=write_fd,
+            text=True,
+        )
+    except BaseException:
+        os.close(read_fd)
+        raise
+    finally:
+        os.close(write_fd)
+
+    with open(read_fd, mode="rb") as stream_in:
+        # Keep the repository of the current thread to write the messages to the log.
+        reader = threading.Thread(
+            target=contextvars.copy_context().run, args=(tracker.consume, stream_in)
+        )
+        reader.start()
+        try:
+            output, _ = process.communicate(input)
+        finally:
+            reader.join()
+
+    return subprocess.CompletedProcess(arguments, process.returncode, stdout=output)
+
+
+def _run_transfer_command(command: str) -> progress.Transfer:
+    tracker = progress.Tracker()
+    _run_git_command(command, tracker=tracker)
+
+    transfer = tracker.transfer
+    metrics.add("received_objects", transfer.objects)
+    metrics.add("received_bytes", transfer.received_bytes)
+
+    return transfer
+
+
+class MaintenanceThresholds(typing.NamedTuple):
+    # These are the default limits of the automatic garbage collection of git.
+    packs: int = 50
+    loose_objects: int = 6700
 
 
 @dataclasses.dataclass(frozen=True)
@@ -60,21 +229,82 @@ class Repository:
     url: str
 
     @classmethod
-    def from_url(cls: type[_T], url: str, parent_path: pathlib.Path) -> _T:
+    def from_url(
+        cls: type[_T], url: str, parent_path: pathlib.Path, layout: Layout = Layout.FLAT
+    ) -> _T:
         """This method allows creating a repository instance knowing only the repository
         storage path on the current working machine.
+
+        The sharded layout gives every url its own path and spreads the local copies
+        over many small directories instead of a single large one.
         """
+        if layout is Layout.SHARDED:
+            return cls(local_path=(parent_path / _get_sharded_path(url)).expanduser(), url=url)
+
         return cls(local_path=(parent_path / _get_repository_name(url)).expanduser(), url=url)
 
     def __str__(self) -> str:
         return reprlib.repr(self.to_dict())
 
+    @property
+    def host(self) -> str:
+        """Return the host name of the remote repository or nothing for local paths."""
+        return _get_host(self.url)
+
+    @property
+    def unique_name(self) -> str:
+        """Return the name telling apart the repositories with different urls."""
+        return _get_sharded_path(self.url).stem
+
     def __repr__(self) -> str:
         return f"{self.__class__.__name__}(local_path={str(self.local_path)!r}, url={self.url!r})"
 
-    def create_local_copy(self) -> None:
+    def check_connectivity(self) -> bool:
+        """Check that all objects reachable from the references of the local copy exist."""
+        try:
+            _run_git_command(GIT_COMMANDS["fsck"].format(str(self.local_path)), silent=True)
+        except exceptions.ExternalProcessError:
+            return False
+
+        return True
+
+    def create_bundle(
+        self, path: pathlib.Path, references: dict[str, str], prerequisites: set[str]
+    ) -> None:
+        """Write the objects reachable from the provided references to the bundle file
+        except the objects reachable from the prerequisite commits.
+        """
+        tips = set(references.values()) & prerequisites
+        revisions = [
+            *references,
+            *(f"^{object_name}" for object_name in sorted(prerequisites - tips)),
+            # Exclude only the parents of the commits written to the previous bundles to
+            # keep the references pointing to them in this bundle.
+            *(f"^{object_name}^@" for object_name in sorted(tips)),
+        ]
+        _run_git_command(
+            GIT_COMMANDS["bundle"].format(str(self.local_path), str(path)),
+            input="".join(f"{revision}\n" for revision in revisions),
+        )
+
+    def count_objects(self) -> dict[str, int]:
+        """Return the number of loose objects and packs in the local copy."""
+        output = _run_git_command(
+            GIT_COMMANDS["count-objects"].format(str(self.local_path)),
+            silent=True,
+            capture_output=True,
+        )
+
+        statistics = {}
+        for line in output.splitlines():
+            name, _, value = line.partition(": ")
+            statistics[name] = int(value)
+
+        return statistics
+
+    def create_local_copy(self) -> progress.Transfer:
         # Clone a mirrored copy of the specified repository onto the current machine.
-        _run_git_command(GIT_COMMANDS["clone"].format(self.url, str(self.local_path)))
+        return _run_transfer_command(GIT_COMMANDS["clone"].format(self.url, str(self.local_path)))
 
     def exists_locally(self) -> bool:
         if not self.local_path.is_dir():
@@ -89,14 +319,75 @@ class Repository:
 
     def exists_on_remote(self) -> bool:
         try:
-            _run_git_command(GIT_COMMANDS["ls-remote"].format(self.url), silent=True)
+            self.list_remote_references()
         except exceptions.ExternalProcessError:
             return False
 
         return True
 
+    def get_local_url(self) -> str:
+        """Return the url the local copy has been cloned from."""
+        return _run_git_command(
+            GIT_COMMANDS["config"].format(str(self.local_path)), silent=True, capture_output=True
+        ).strip()
+
+    def is_up_to_date(self, remote_references: dict[str, str]) -> bool:
+        """Check whether the local copy already has all the provided remote references."""
+        return remote_references.items() <= self.list_local_references().items()
+
+    def filter_new_objects(self, object_names: set[str], prerequisites: set[str]) -> set[str]:
+        """Return the provided objects that are not reachable from the prerequisite commits."""
+        output = _run_git_command(
+            GIT_COMMANDS["rev-list"].format(str(self.local_path)),
+            silent=True,
+            capture_output=True,
+            input="".join(
+                f"{revision}\n"
+                for revision in [
+                    *sorted(object_names),
+                    *(f"^{object_name}" for object_name in sorted(prerequisites)),
+                ]
+            ),
+        )
+
+        return object_names & {line.split(maxsplit=1)[0] for line in output.splitlines() if line}
+
+    def list_local_references(self) -> dict[str, str]:
+        """Return the object names of all references in the local copy."""
+        return _parse_references(
+            _run_git_command(
+                GIT_COMMANDS["for-each-ref"].format(str(self.local_path)),
+                silent=True,
+                capture_output=True,
+            )
+        )
+
+    def list_remote_references(self) -> dict[str, str]:
+        """Return the object names of all references in the remote repository."""
+        return _parse_references(
+            _run_git_command(
+                GIT_COMMANDS["ls-remote"].format(self.url), silent=True, capture_output=True
+            )
+        )
+
+    def needs_maintenance(self, thresholds: MaintenanceThresholds) -> bool:
+        """Check whether the local copy has too many packs or loose objects."""
+        statistics = self.count_objects()
+
+        return (
+            statistics["packs"] >= thresholds.packs
+            or statistics["count"] >= thresholds.loose_objects
+        )
+
+    def run_maintenance(self) -> None:
+        """Pack the loose objects and small packs together and write the commit-graph
+        and multi-pack-index files to speed up the next fetch.
+        """
+        _run_git_command(GIT_COMMANDS["repack"].format(str(self.local_path)))
+        _run_git_command(GIT_COMMANDS["commit-graph"].format(str(self.local_path)))
+
     def to_dict(self) -> dict[str, typing.Union[str, pathlib.Path]]:
         return dataclasses.asdict(self)
 
-    def update_local_copy(self) -> None:
-        _run_git_command(GIT_COMMANDS["fetch"].format(str(self.local_path)))
+    def update_local_copy(self) -> progress.Transfer:
+        return _run_transfer_command(GIT_COMMANDS["fetch"].format(str(self.local_path)))
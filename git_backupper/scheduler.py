@@ -0,0 +1,94 @@
+# Copyright 2023 (c) Vladislav Punko <iam.vlad.punko@gmail.com>
+
+import collections
+import concurrent.futures
+import heapq
+import itertools
+import logging
+import typing
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["Job", "run"]
+
+
+class Job(typing.NamedTuple):
+    func: typing.Callable[[], None]
+    host: str
+    cost: float = float("inf")  # the expected duration of the job in seconds
+
+
+def _push(queues: dict[str, list[tuple[float, int, Job]]], job: Job, order: int) -> None:
+    # Keep the longest job of every host at the top of its heap and the order of others.
+    heapq.heappush(queues.setdefault(job.host, []), (-job.cost, order, job))
+
+
+def run(
+    jobs: typing.Iterable[Job],
+    max_workers: int = 1,
+    max_workers_per_host: typing.Optional[int] = None,
+    lookahead: typing.Optional[int] = None,
+) -> None:
+    """Run the provided jobs using a pool of worker threads.
+
+    The longest jobs are started first to avoid waiting for a single long job at the
+    end. No more than the given number of jobs for the same host are run at once.
+    The first error raised by any job stops starting new jobs and is raised again
+    as soon as all the running jobs are done.
+
+    Pass the lookahead to read only that number of waiting jobs from the iterable at
+    once and start the first jobs before the rest are generated. The longest jobs are
+    started first among the jobs read so far in this case.
+    """
+    pending = iter(jobs)
+    counter = itertools.count()
+
+    queues: dict[str, list[tuple[float, int, Job]]] = {}
+    queued = 0
+
+    running: dict[concurrent.futures.Future[None], Job] = {}
+    workers_per_host: collections.Counter[str] = collections.Counter()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        try:
+            while True:
+                while lookahead is None or queued < lookahead:
+                    job = next(pending, None)
+                    if job is None:
+                        break
+
+                    _push(queues, job, next(counter))
+                    queued += 1
+
+                if not queues and not running:
+                    break
+
+                while len(running) < max_workers:
+                    # Take the longest job among the hosts that are not busy enough.
+                    candidates = [
+                        queue[0][2]
+                        for host, queue in queues.items()
+                        if not max_workers_per_host or workers_per_host[host] < max_workers_per_host
+                    ]
+                    if not candidates:
+                        break
+
+                    job = max(candidates, key=lambda job: job.cost)
+                    heapq.heappop(queues[job.host])
+                    if not queues[job.host]:
+                        del queues[job.host]
+                    queued -= 1
+
+                    running[executor.submit(job.func)] = job
+                    workers_per_host[job.host] += 1
+
+                done, _ = concurrent.futures.wait(
+                    running, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                for future in done:
+                    workers_per_host[running.pop(future).host] -= 1
+                    future.result()  # propagate the first error raised by a job
+        except BaseException:
+            logger.debug("Wait for %d running jobs to stop this program runtime.", len(running))
+            executor.shutdown(wait=True, cancel_futures=True)
+            raise
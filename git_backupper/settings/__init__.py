@@ -1,5 +1,6 @@
 # Copyright 2023 (c) Vladislav Punko <iam.vlad.punko@gmail.com>
 
 from git_backupper.settings.settings import Settings
+from git_backupper.settings.sources import RepositoryEntry
 
-__all__ = ["Settings"]
+__all__ = ["RepositoryEntry", "Settings"]
@@ -1,12 +1,13 @@
 # Copyright 2023 (c) Vladislav Punko <iam.vlad.punko@gmail.com>
 
+import itertools
 import json
 import logging
 import pathlib
 import typing
 
 from git_backupper import defaults, exceptions
-from git_backupper.settings import fields
+from git_backupper.settings import fields, sources
 
 logger = logging.getLogger(__name__)
 
@@ -14,6 +15,9 @@ __all__ = ["Settings"]
 
 _T = typing.TypeVar("_T", bound="Settings")
 
+_KEYS: typing.Final[frozenset[str]] = frozenset(("backup_path", "repositories"))
+_OPTIONAL_KEYS: typing.Final[frozenset[str]] = frozenset(("manifest", "read_rate"))
+
 
 class Settings:
     # schema
@@ -22,11 +26,22 @@ class Settings:
 
     def __init__(
         self,
-        repositories: list[str],
+        repositories: typing.Sequence[str] = (),
         backup_path: typing.Union[str, pathlib.Path] = defaults.BACKUP_DIRECTORY_PATH,
+        manifest: typing.Optional[typing.Union[str, pathlib.Path]] = None,
+        read_rate: typing.Optional[int] = None,
     ) -> None:
         self.backup_path = backup_path
         self.repositories = repositories
+        # The manifest is read only when the repositories are iterated over.
+        self.manifest = fields.PathField().process_value(manifest) if manifest is not None else None
+
+        if read_rate is not None and (
+            isinstance(read_rate, bool) or not isinstance(read_rate, int) or read_rate < 1
+        ):
+            raise exceptions.SettingsError("The read rate must be a positive integer.")
+        # This is the number of bytes per second read to calculate the checksums.
+        self.read_rate = read_rate
 
     @classmethod
     def from_json(
@@ -48,7 +63,8 @@ class Settings:
             ) from err
 
         # Ensure that the settings conform to the expected schema before using them.
-        if not {"repositories"} <= set(settings.keys()) <= {"backup_path", "repositories"}:
+        keys = set(settings.keys())
+        if not keys & {"manifest", "repositories"} or not keys <= _KEYS | _OPTIONAL_KEYS:
             raise exceptions.SettingsError("File does not match expected schema.")
 
         return cls(**settings)
@@ -62,5 +78,15 @@ class Settings:
             f"(repositories={self.repositories}, backup_path={str(self.backup_path)!r})"
         )
 
+    def iter_repositories(self) -> typing.Iterator[sources.RepositoryEntry]:
+        """Return the repositories of the settings file followed by the repositories of
+        the manifest without duplicates.
+        """
+        return sources.deduplicate(
+            itertools.chain(
+                self.repositories, sources.read_manifest(self.manifest) if self.manifest else ()
+            )
+        )
+
     def to_dict(self) -> dict[str, typing.Union[pathlib.Path, list[str]]]:
-        return self.__dict__
+        return {name: value for name, value in self.__dict__.items() if value is not None}
@@ -0,0 +1,107 @@
+# Copyright 2023 (c) Vladislav Punko <iam.vlad.punko@gmail.com>
+
+import json
+import logging
+import pathlib
+import typing
+
+from git_backupper import exceptions
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["RepositoryEntry", "deduplicate", "read_manifest"]
+
+# These are the values of the integrity strategies that can be set for a single repository.
+_INTEGRITY_STRATEGIES: typing.Final[frozenset[str]] = frozenset(
+    ("checksums", "fsck-connectivity", "none", "pack-trailer")
+)
+
+
+class RepositoryEntry(typing.NamedTuple):
+    url: str
+    # The options below replace the options of the whole run for this repository.
+    integrity: typing.Optional[str] = None
+    paranoid: typing.Optional[bool] = None
+    interval: typing.Optional[float] = None  # the seconds between the backups of the daemon
+
+
+def _to_entry(value: typing.Any) -> RepositoryEntry:
+    if isinstance(value, str):
+        value = {"url": value}
+
+    if not isinstance(value, dict):
+        raise exceptions.SettingsError("Every entry must be a string or an object.")
+
+    if not {"url"} <= value.keys() <= set(RepositoryEntry._fields):
+        raise exceptions.SettingsError("Entry does not match expected schema.")
+
+    if not isinstance(value["url"], str) or not value["url"]:
+        raise exceptions.SettingsError("The url of the repository must be a non-empty string.")
+
+    if value.get("integrity") not in {None, *_INTEGRITY_STRATEGIES}:
+        raise exceptions.SettingsError(f"Unknown integrity strategy: {value['integrity']!r}.")
+
+    if not isinstance(value.get("paranoid", False), bool):
+        raise exceptions.SettingsError("The paranoid option must be a boolean value.")
+
+    interval = value.get("interval", 1)
+    if isinstance(interval, bool) or not isinstance(interval, (float, int)) or interval <= 0:
+        raise exceptions.SettingsError("The interval option must be a positive number.")
+
+    return RepositoryEntry(**value)
+
+
+def _read_lines(path: pathlib.Path) -> typing.Iterator[RepositoryEntry]:
+    try:
+        with path.open(encoding="utf-8") as stream_in:
+            for number, line in enumerate(stream_in, start=1):
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+
+                try:
+                    yield _to_entry(json.loads(line))
+                except (exceptions.SettingsError, json.JSONDecodeError) as err:
+                    logger.error(
+                        "The manifest has an invalid entry at line %d: '%s'.", number, line
+                    )
+                    raise exceptions.SettingsError(
+                        f"Failed to parse the line {number} of the manifest: {str(path)!r}."
+                    ) from err
+    except OSError as err:
+        logger.error("It is impossible to load the manifest from the determined location.")
+        raise exceptions.FileSystemError(
+            f"Failed to load the manifest from the provided path: {str(path)!r}."
+        ) from err
+
+
+def read_manifest(path: pathlib.Path) -> typing.Iterator[RepositoryEntry]:
+    """Read the repositories one by one from the JSON Lines file or every such file
+    in the provided directory in the order of their names.
+
+    Every line is either the url of a repository or an object with the url and
+    the options of the repository. Empty lines and lines starting with # are skipped.
+    """
+    if path.is_dir():
+        for item in sorted(path.glob("*.jsonl")):
+            yield from _read_lines(item)
+    else:
+        yield from _read_lines(path)
+
+
+def deduplicate(
+    entries: typing.Iterable[typing.Union[str, RepositoryEntry]],
+) -> typing.Iterator[RepositoryEntry]:
+    """Skip the repositories that have already been read from the provided entries."""
+    urls: set[str] = set()
+
+    for entry in entries:
+        if isinstance(entry, str):
+            entry = RepositoryEntry(url=entry)
+
+        if entry.url in urls:
+            logger.debug("The repository has already been read from the manifest: '%s'.", entry.url)
+            continue
+
+        urls.add(entry.url)
+        yield entry
@@ -0,0 +1,64 @@
+# Copyright 2023 (c) Vladislav Punko <iam.vlad.punko@gmail.com>
+
+import contextlib
+import logging
+import os
+import pathlib
+import shlex
+import shutil
+import subprocess
+import tempfile
+import typing
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["multiplexing"]
+
+
+def _close_connections(command: list[str], directory: pathlib.Path) -> None:
+    for path in directory.iterdir():
+        # The master connection ignores the host name when its socket path is provided.
+        # The command must have no other socket path since ssh uses the first one given.
+        subprocess.run(
+            [*command, "-o", f"ControlPath={str(path)}", "-O", "exit", "localhost"],
+            check=False,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+@contextlib.contextmanager
+def multiplexing(
+    persist: int = 60, ssh_command: typing.Optional[str] = None
+) -> typing.Iterator[pathlib.Path]:
+    """Share one ssh connection per host between all git commands run in this context.
+
+    The ssh master connections are kept in a temporary directory for the provided
+    number of seconds after the last use and closed at the end of the context.
+    """
+    base_command = ssh_command or os.environ.get("GIT_SSH_COMMAND") or "ssh"
+    # Use a short path because the length of the unix socket paths is limited.
+    directory = pathlib.Path(tempfile.mkdtemp(prefix="git-backupper-ssh-"))
+    options = [
+        "-o",
+        "ControlMaster=auto",
+        "-o",
+        f"ControlPath={str(directory / '%C')}",  # the hash of the host, port and user
+        "-o",
+        f"ControlPersist={persist}",
+    ]
+
+    previous_command = os.environ.get("GIT_SSH_COMMAND")
+    os.environ["GIT_SSH_COMMAND"] = " ".join([base_command, *map(shlex.quote, options)])
+    try:
+        yield directory
+    finally:
+        if previous_command is None:
+            os.environ.pop("GIT_SSH_COMMAND", None)
+        else:
+            os.environ["GIT_SSH_COMMAND"] = previous_command
+
+        logger.debug("Close the shared ssh connections in '%s'.", str(directory))
+        _close_connections(shlex.split(base_command), directory)
@@ -0,0 +1,132 @@
+# Copyright 2023 (c) Vladislav Punko <iam.vlad.punko@gmail.com>
+
+import contextlib
+import enum
+import logging
+import shutil
+import threading
+import time
+import typing
+
+from git_backupper import metrics
+
+logger = logging.getLogger(__name__)
+
+__all__ = [
+    "IOClass",
+    "Priority",
+    "TokenBucket",
+    "consume",
+    "get_command_prefix",
+    "is_limited",
+    "limit",
+    "priority",
+]
+
+_bucket: typing.Optional["TokenBucket"] = None
+_command_prefix: tuple[str, ...] = ()
+
+
+class IOClass(enum.Enum):
+    """The scheduling class of the disk requests made by the git processes."""
+
+    BEST_EFFORT = "best-effort"
+    IDLE = "idle"  # read and write only when no other process uses the disk
+
+    def __str__(self) -> str:
+        return self.value
+
+
+# These are the numbers of the scheduling classes the ionice command of util-linux accepts.
+_IO_CLASSES: typing.Final[dict[IOClass, str]] = {IOClass.BEST_EFFORT: "2", IOClass.IDLE: "3"}
+
+
+class Priority(typing.NamedTuple):
+    niceness: typing.Optional[int] = None  # from 0 to 19 to lower the cpu priority
+    io_class: typing.Optional[IOClass] = None
+
+
+class TokenBucket:
+    """Let through no more than the given number of bytes per second on average.
+
+    The bytes that exceed the available tokens are still let through, and the
+    thread that took them waits until the debt is paid off. The other threads wait
+    for the same debt, so the rate is shared between all of them.
+    """
+
+    def __init__(self, rate: float, capacity: typing.Optional[float] = None) -> None:
+        self.rate = rate
+        self.capacity = capacity or rate  # allow bursts of a single second
+
+        self._lock = threading.Lock()
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+
+    def consume(self, amount: int) -> float:
+        """Take the given number of tokens and return the time spent waiting for them."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            self._tokens -= amount
+
+            delay = max(0.0, -self._tokens / self.rate)
+
+        if delay:
+            time.sleep(delay)
+
+        return delay
+
+
+def consume(amount: int) -> None:
+    """Wait until the given number of bytes can be read without exceeding the limit."""
+    if _bucket is not None:
+        metrics.add("throttled_seconds", _bucket.consume(amount))
+
+
+def is_limited() -> bool:
+    return _bucket is not None
+
+
+@contextlib.contextmanager
+def limit(rate: typing.Optional[float]) -> typing.Iterator[None]:
+    """Limit the number of bytes per second read by all threads in this context."""
+    global _bucket
+
+    previous_bucket, _bucket = _bucket, TokenBucket(rate) if rate else None
+    try:
+        yield
+    finally:
+        _bucket = previous_bucket
+
+
+def _get_prefix(process_priority: Priority) -> tuple[str, ...]:
+    prefix: list[str] = []
+
+    if process_priority.io_class is not None:
+        if shutil.which("ionice") is None:
+            logger.warning("The disk priority cannot be changed without the ionice command.")
+        else:
+            prefix += ["ionice", "-c", _IO_CLASSES[process_priority.io_class]]
+
+    if process_priority.niceness is not None:
+        prefix += ["nice", "-n", str(process_priority.niceness)]
+
+    return tuple(prefix)
+
+
+def get_command_prefix() -> tuple[str, ...]:
+    """Return the arguments to run the external commands with the current priority."""
+    return _command_prefix
+
+
+@contextlib.contextmanager
+def priority(process_priority: Priority) -> typing.Iterator[None]:
+    """Run the git commands started in this context with the given priority."""
+    global _command_prefix
+
+    previous_prefix, _command_prefix = _command_prefix, _get_prefix(process_priority)
+    try:
+        yield
+    finally:
+        _command_prefix = previous_prefix
@@ -2,6 +2,8 @@
 
 import hashlib
 import pathlib
+import subprocess
+import urllib.parse
 import uuid
 
 import pytest
@@ -42,3 +44,39 @@ def checksums(directory_path):
         data[path] = hashlib.sha256(path.read_bytes()).hexdigest()
 
     return data
+
+
+@pytest.fixture
+def commit_factory():
+    def _create_commit(repository_url):
+        path = urllib.parse.urlparse(repository_url).path
+        subprocess.check_call(
+            [
+                "git",
+                "-C",
+                path,
+                "-c",
+                "user.name=test",
+                "-c",
+                "user.email=test@localhost",
+                "commit",
+                "--allow-empty",
+                "--message=test",
+                "--quiet",
+            ]
+        )
+
+    return _create_commit
+
+
+@pytest.fixture
+def remote_repository_factory(commit_factory, tmp_path):
+    def _create_remote_repository(name):
+        path = tmp_path / "remotes" / name
+        subprocess.check_call(["git", "init", "--initial-branch=main", "--quiet", str(path)])
+
+        commit_factory(path.as_uri())
+
+        return path.as_uri()
+
+    return _create_remote_repository
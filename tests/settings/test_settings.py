@@ -94,3 +94,50 @@ def test_validation_during_load_settings(settings_path):
         settings.Settings.from_json(settings_path)
 
     assert str(error.value) == "File does not match expected schema."
+
+
+def test_load_settings_with_manifest(backup_path, settings_path):
+    pathlib.Path("manifest.jsonl").write_text('"2.git"\n"4.git"\n{"url": "1.git"}\n')
+    settings_path.write_text(
+        json.dumps(
+            {
+                "backup_path": str(backup_path),
+                "repositories": ["1.git", "2.git"],
+                "manifest": "manifest.jsonl",
+            }
+        )
+    )
+
+    test_settings = settings.Settings.from_json(settings_path)
+
+    assert [entry.url for entry in test_settings.iter_repositories()] == ["1.git", "2.git", "4.git"]
+    assert test_settings.to_dict()["manifest"] == pathlib.Path("manifest.jsonl")
+
+
+def test_load_settings_with_manifest_only(backup_path, settings_path):
+    settings_path.write_text(
+        json.dumps({"backup_path": str(backup_path), "manifest": "manifest.jsonl"})
+    )
+
+    test_settings = settings.Settings.from_json(settings_path)
+
+    assert test_settings.repositories == []
+    assert test_settings.manifest == pathlib.Path("manifest.jsonl")
+
+
+def test_load_settings_with_read_rate(backup_path, repositories, settings_path):
+    settings_path.write_text(
+        json.dumps(
+            {"backup_path": str(backup_path), "repositories": repositories, "read_rate": 2**20}
+        )
+    )
+
+    assert settings.Settings.from_json(settings_path).read_rate == 2**20
+
+
+@pytest.mark.parametrize("read_rate", (0, -1, 1.5, True, "1"))
+def test_settings_with_invalid_read_rate(backup_path, read_rate, repositories):
+    with pytest.raises(exceptions.SettingsError) as error:
+        settings.Settings(repositories=repositories, backup_path=backup_path, read_rate=read_rate)
+
+    assert str(error.value) == "The read rate must be a positive integer."
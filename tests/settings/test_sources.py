@@ -0,0 +1,105 @@
+# Copyright 2023 (c) Vladislav Punko <iam.vlad.punko@gmail.com>
+
+import logging
+import pathlib
+
+import pytest
+
+from git_backupper import exceptions, integrity
+from git_backupper.settings import sources
+
+
+@pytest.fixture
+def manifest_path(fs):
+    path = pathlib.Path("manifest.jsonl")
+    path.write_text(
+        "# the repositories of the team\n"
+        '"https://github.com/vladpunko/git-backupper.git"\n'
+        "\n"
+        '{"url": "https://github.com/vladpunko/git-deepcopy.git", "integrity": "none"}\n'
+        '{"url": "https://github.com/vladpunko/vim.git", "paranoid": true}\n'
+    )
+
+    return path
+
+
+def test_read_manifest(manifest_path):
+    assert list(sources.read_manifest(manifest_path)) == [
+        sources.RepositoryEntry(url="https://github.com/vladpunko/git-backupper.git"),
+        sources.RepositoryEntry(
+            url="https://github.com/vladpunko/git-deepcopy.git", integrity="none"
+        ),
+        sources.RepositoryEntry(url="https://github.com/vladpunko/vim.git", paranoid=True),
+    ]
+
+
+def test_read_manifest_directory(fs):
+    directory_path = pathlib.Path("manifest.d")
+    directory_path.mkdir()
+    (directory_path / "2.jsonl").write_text('"2.git"\n')
+    (directory_path / "1.jsonl").write_text('"1.git"\n')
+    (directory_path / "README.md").write_text("# skip\n")
+
+    assert [entry.url for entry in sources.read_manifest(directory_path)] == ["1.git", "2.git"]
+
+
+def test_read_manifest_lazily(manifest_path):
+    manifest_path.write_text('"1.git"\n[\n')
+
+    entries = sources.read_manifest(manifest_path)
+
+    assert next(entries).url == "1.git"  # the invalid line has not been read yet
+    with pytest.raises(exceptions.SettingsError):
+        next(entries)
+
+
+@pytest.mark.parametrize(
+    "line",
+    (
+        "[",
+        "1",
+        '{"path": "1.git"}',
+        '{"url": ""}',
+        '{"url": "1.git", "integrity": "unknown"}',
+        '{"url": "1.git", "paranoid": "yes"}',
+        '{"url": "1.git", "interval": 0}',
+        '{"url": "1.git", "interval": true}',
+    ),
+)
+def test_read_manifest_with_validation_error(caplog, line, manifest_path):
+    manifest_path.write_text(f'"1.git"\n{line}\n"2.git"\n')
+
+    with caplog.at_level(logging.ERROR):
+        with pytest.raises(exceptions.SettingsError) as error:
+            list(sources.read_manifest(manifest_path))
+
+    assert f"The manifest has an invalid entry at line 2: {line!r}." in caplog.text
+    assert str(error.value) == (
+        f"Failed to parse the line 2 of the manifest: {str(manifest_path)!r}."
+    )
+
+
+def test_read_manifest_with_error(caplog, fs):
+    manifest_path = pathlib.Path("manifest.jsonl")
+
+    with caplog.at_level(logging.ERROR):
+        with pytest.raises(exceptions.FileSystemError) as error:
+            list(sources.read_manifest(manifest_path))
+
+    message = "It is impossible to load the manifest from the determined location."
+    assert message in caplog.text
+    assert str(error.value) == (
+        f"Failed to load the manifest from the provided path: {str(manifest_path)!r}."
+    )
+
+
+def test_deduplicate():
+    entries = sources.deduplicate(
+        ["1.git", sources.RepositoryEntry(url="1.git", paranoid=True), "2.git", "1.git"]
+    )
+
+    assert list(entries) == [sources.RepositoryEntry(url="1.git"), sources.RepositoryEntry("2.git")]
+
+
+def test_integrity_strategies():
+    assert sources._INTEGRITY_STRATEGIES == {strategy.value for strategy in integrity.Strategy}
@@ -1,12 +1,15 @@
 # Copyright 2023 (c) Vladislav Punko <iam.vlad.punko@gmail.com>
 
+import json
 import logging
 import os
 import pickle
+import subprocess
+import urllib.parse
 
 import pytest
 
-from git_backupper import api, repository
+from git_backupper import api, cache, exceptions, integrity, repository, settings
 
 
 @pytest.fixture
@@ -69,3 +72,425 @@ def test_backup_directory_exists(backup_path, cache_path, repositories):
     api.backup(backup_path, repositories, cache_path)
 
     assert repository_path.is_dir()
+
+
+def test_backup_concurrently(backup_path, cache_path, remote_repository_factory):
+    repositories = [remote_repository_factory(f"repository-{index}") for index in range(5)]
+
+    api.backup(backup_path, repositories, cache_path, max_workers=3)
+
+    backup_cache = pickle.loads(cache_path.read_bytes())
+    for repository_url in repositories:
+        test_repository = repository.Repository.from_url(
+            parent_path=backup_path, url=repository_url
+        )
+        assert test_repository.exists_locally()
+        assert test_repository in backup_cache
+    assert len(os.listdir(backup_path)) == len(repositories)
+
+
+def test_backup_concurrently_with_error(mocker, backup_path, cache_path, remote_repository_factory):
+    repositories = [remote_repository_factory(f"repository-{index}") for index in range(3)]
+    mocker.patch(
+        "git_backupper.repository.Repository.create_local_copy",
+        side_effect=exceptions.ExternalProcessError,
+    )
+
+    with pytest.raises(exceptions.ExternalProcessError):
+        api.backup(backup_path, repositories, cache_path, max_workers=2)
+
+    assert pickle.loads(cache_path.read_bytes()) == {}
+
+
+def test_backup_with_failed_urls(mocker, backup_path, cache_path, remote_repository_factory):
+    repositories = [remote_repository_factory(f"repository-{index}") for index in range(3)]
+    create_local_copy = repository.Repository.create_local_copy
+
+    def _create_local_copy(self):
+        if self.url == repositories[0]:
+            raise exceptions.ExternalProcessError
+
+        return create_local_copy(self)
+
+    mocker.patch.object(
+        repository.Repository,
+        "create_local_copy",
+        autospec=True,
+        side_effect=_create_local_copy,
+    )
+
+    failed_urls = set()
+    api.backup(backup_path, repositories, cache_path, max_workers=2, failed_urls=failed_urls)
+
+    assert failed_urls == {repositories[0]}
+    assert len(pickle.loads(cache_path.read_bytes())) == 2
+
+
+def test_backup_saves_cache_during_run(mocker, backup_path, cache_path, remote_repository_factory):
+    mocker.patch.object(api, "_SAVE_INTERVAL", 0.0)
+    repositories = [remote_repository_factory(f"repository-{index}") for index in range(2)]
+    create_local_copy = repository.Repository.create_local_copy
+    saved_urls = []
+
+    def _create_local_copy(self):
+        if self.url == repositories[1]:
+            # Look at the cache file as if the process were killed at this point.
+            saved_urls.extend(
+                backup_repository.url for backup_repository in pickle.loads(cache_path.read_bytes())
+            )
+
+        return create_local_copy(self)
+
+    mocker.patch.object(
+        repository.Repository,
+        "create_local_copy",
+        autospec=True,
+        side_effect=_create_local_copy,
+    )
+
+    api.backup(backup_path, repositories, cache_path)
+
+    assert saved_urls == [repositories[0]]
+
+
+def test_backup_updated_remote_repository(
+    caplog, mocker, backup_path, cache_path, commit_factory, remote_repository_factory
+):
+    repository_url = remote_repository_factory("repository")
+    test_repository = repository.Repository.from_url(parent_path=backup_path, url=repository_url)
+
+    api.backup(backup_path, [repository_url], cache_path)
+
+    commit_factory(repository_url)
+    create_local_copy_mock = mocker.patch.object(repository.Repository, "create_local_copy")
+    with caplog.at_level(logging.WARNING):
+        api.backup(backup_path, [repository_url], cache_path)
+        api.backup(backup_path, [repository_url], cache_path, paranoid=True)
+
+    create_local_copy_mock.assert_not_called()
+    assert "corrupted" not in caplog.text
+    assert (
+        subprocess.check_output(
+            ["git", "-C", str(test_repository.local_path), "rev-list", "--all", "--count"],
+            text=True,
+        )
+        == "2\n"
+    )
+
+
+def test_backup_corrupted_repository_with_pack_trailer(
+    caplog, backup_path, cache_path, remote_repository_factory
+):
+    repository_url = remote_repository_factory("repository")
+    test_repository = repository.Repository.from_url(parent_path=backup_path, url=repository_url)
+
+    api.backup(backup_path, [repository_url], cache_path)
+
+    for path in (test_repository.local_path / "objects" / "pack").glob("pack-*.pack"):
+        path.unlink()
+    with caplog.at_level(logging.WARNING):
+        api.backup(
+            backup_path,
+            [repository_url],
+            cache_path,
+            integrity_strategy=integrity.Strategy.PACK_TRAILER,
+        )
+
+    message = f"The {str(test_repository.local_path)!r} repository is corrupted. Files: changed"
+    assert message in caplog.text
+    assert test_repository.check_connectivity()
+
+
+def test_backup_with_sqlite_cache(tmp_path, backup_path, remote_repository_factory):
+    repository_url = remote_repository_factory("repository")
+    test_repository = repository.Repository.from_url(parent_path=backup_path, url=repository_url)
+    database_path = tmp_path / ".git_backupper.sqlite3"
+
+    for _ in range(2):
+        api.backup(backup_path, [repository_url], database_path, cache_backend=cache.Backend.SQLITE)
+
+    with cache.SQLiteCache(path=database_path, legacy_path=None) as test_cache:
+        assert isinstance(test_cache[test_repository], cache.RepositoryState)
+
+
+def test_backup_unchanged_remote_repository(
+    mocker, backup_path, cache_path, commit_factory, remote_repository_factory
+):
+    repository_url = remote_repository_factory("repository")
+    api.backup(backup_path, [repository_url], cache_path)
+
+    update_local_copy_mock = mocker.patch.object(
+        repository.Repository, "update_local_copy", autospec=True
+    )
+    api.backup(backup_path, [repository_url], cache_path)
+    update_local_copy_mock.assert_not_called()
+
+    commit_factory(repository_url)
+    api.backup(backup_path, [repository_url], cache_path)
+    update_local_copy_mock.assert_called_once()
+
+
+def test_backup_durations(backup_path, cache_path, remote_repository_factory):
+    repository_url = remote_repository_factory("repository")
+    test_repository = repository.Repository.from_url(parent_path=backup_path, url=repository_url)
+
+    for _ in range(2):
+        api.backup(backup_path, [repository_url], cache_path, max_workers_per_host=1)
+
+    assert len(pickle.loads(cache_path.read_bytes())[test_repository].durations) == 2
+
+
+def test_export_bundles(
+    mocker, backup_path, cache_path, commit_factory, remote_repository_factory, tmp_path
+):
+    mocker.patch.object(api.time, "strftime", side_effect=["1.bundle", "2.bundle", "3.bundle"])
+
+    repository_url = remote_repository_factory("repository")
+    test_repository = repository.Repository.from_url(parent_path=backup_path, url=repository_url)
+    export_path = tmp_path / "export"
+    bundles_path = export_path / test_repository.local_path.name
+
+    api.backup(backup_path, [repository_url], cache_path)
+    api.export_bundles(backup_path, [repository_url], export_path, cache_path)
+
+    commit_factory(repository_url)
+    api.backup(backup_path, [repository_url], cache_path)
+    api.export_bundles(backup_path, [repository_url], export_path, cache_path)
+
+    api.export_bundles(backup_path, [repository_url], export_path, cache_path)  # no changes
+    assert sorted(path.name for path in bundles_path.iterdir()) == ["1.bundle", "2.bundle"]
+
+    # The latest bundle file has only the new commit and requires the previous one.
+    restored_path = tmp_path / "restored"
+    subprocess.check_call(["git", "init", "--bare", "--quiet", str(restored_path)])
+    with pytest.raises(subprocess.CalledProcessError):
+        subprocess.check_call(
+            ["git", "-C", str(restored_path), "bundle", "verify", str(bundles_path / "2.bundle")],
+            stderr=subprocess.DEVNULL,
+        )
+
+    for name in ("1.bundle", "2.bundle"):
+        subprocess.check_call(
+            [
+                "git",
+                "-C",
+                str(restored_path),
+                "fetch",
+                "--quiet",
+                str(bundles_path / name),
+                "refs/*:refs/*",
+            ]
+        )
+
+    test_repository = repository.Repository.from_url(parent_path=backup_path, url=repository_url)
+    assert (
+        subprocess.check_output(
+            ["git", "-C", str(restored_path), "rev-parse", "refs/heads/main"], text=True
+        ).strip()
+        == test_repository.list_remote_references()["refs/heads/main"]
+    )
+
+
+def test_export_bundles_with_tag_on_exported_commit(
+    mocker, backup_path, cache_path, commit_factory, remote_repository_factory, tmp_path
+):
+    mocker.patch.object(api.time, "strftime", side_effect=["1.bundle", "2.bundle"])
+
+    repository_url = remote_repository_factory("repository")
+    test_repository = repository.Repository.from_url(parent_path=backup_path, url=repository_url)
+    export_path = tmp_path / "export"
+    bundles_path = export_path / test_repository.local_path.name
+
+    for _ in range(2):
+        commit_factory(repository_url)
+    api.backup(backup_path, [repository_url], cache_path)
+    api.export_bundles(backup_path, [repository_url], export_path, cache_path)
+
+    # The new tags point to the ancestors of the exported commit, which have no new objects.
+    remote_path = urllib.parse.urlparse(repository_url).path
+    subprocess.check_call(["git", "-C", remote_path, "tag", "v1", "main~2"])
+    subprocess.check_call(["git", "-C", remote_path, "tag", "v2", "main~1"])
+    api.backup(backup_path, [repository_url], cache_path)
+    api.export_bundles(backup_path, [repository_url], export_path, cache_path)
+
+    restored_path = tmp_path / "restored"
+    subprocess.check_call(["git", "init", "--bare", "--quiet", str(restored_path)])
+    for bundle_path in sorted(bundles_path.glob("*.bundle")):
+        subprocess.check_call(
+            [
+                "git",
+                "-C",
+                str(restored_path),
+                "fetch",
+                "--quiet",
+                str(bundle_path),
+                "refs/*:refs/*",
+            ]
+        )
+
+    restored_repository = repository.Repository(local_path=restored_path, url=repository_url)
+    assert restored_repository.list_local_references() == test_repository.list_local_references()
+    assert {"refs/tags/v1", "refs/tags/v2"} <= restored_repository.list_local_references().keys()
+
+
+def test_export_bundles_without_local_copy(caplog, backup_path, cache_path, tmp_path):
+    api.export_bundles(backup_path, ["https://localhost/repository"], tmp_path, cache_path)
+
+    assert "The local copy could not be detected for" in caplog.text
+
+
+def test_backup_with_maintenance(
+    caplog, backup_path, cache_path, commit_factory, remote_repository_factory
+):
+    repository_url = remote_repository_factory("repository")
+    test_repository = repository.Repository.from_url(parent_path=backup_path, url=repository_url)
+    thresholds = repository.MaintenanceThresholds(packs=2, loose_objects=2)
+
+    for _ in range(3):
+        commit_factory(repository_url)
+        api.backup(backup_path, [repository_url], cache_path, maintenance_thresholds=thresholds)
+
+    assert test_repository.count_objects()["count"] < thresholds.loose_objects
+    # The checksums of the rewritten files have been updated after the maintenance.
+    api.backup(backup_path, [repository_url], cache_path, paranoid=True)
+    assert "corrupted" not in caplog.text
+    assert test_repository.is_up_to_date(test_repository.list_remote_references())
+
+
+def test_backup_metrics(backup_path, cache_path, remote_repository_factory, tmp_path):
+    repository_url = remote_repository_factory("repository")
+    metrics_path = tmp_path / "metrics.json"
+    textfile_path = tmp_path / "git_backupper.prom"
+
+    api.backup(
+        backup_path,
+        [repository_url],
+        cache_path,
+        metrics_path=metrics_path,
+        textfile_path=textfile_path,
+    )
+
+    report = json.loads(metrics_path.read_text())
+    assert "cache_save" in report["run"]["phases"]  # there is nothing to load on the first run
+    assert {"backup", "checksums", "git clone", "git fetch", "git ls-remote"} <= report[
+        "repositories"
+    ][repository_url]["phases"].keys()
+    assert report["repositories"][repository_url]["hashed_files"] > 0
+    assert report["repositories"][repository_url]["received_objects"] > 0
+    assert f'git_backupper_phase_calls{{repository="{repository_url}",phase="git clone"}} 1' in (
+        textfile_path.read_text().splitlines()
+    )
+
+
+def test_backup_profile(backup_path, cache_path, remote_repository_factory, tmp_path):
+    repository_url = remote_repository_factory("repository")
+    test_repository = repository.Repository.from_url(parent_path=backup_path, url=repository_url)
+    profile_path = tmp_path / "profile"
+
+    api.backup(backup_path, [repository_url], cache_path, profile_path=profile_path)
+
+    assert sorted(path.name for path in profile_path.iterdir()) == [
+        "main.pstats",
+        f"{test_repository.unique_name}.pstats",
+    ]
+
+
+def test_backup_stream(mocker, backup_path, cache_path, remote_repository_factory):
+    repositories = [remote_repository_factory(f"repository-{index}") for index in range(3)]
+    verify_mock = mocker.spy(integrity, "verify")
+
+    for _ in range(2):
+        api.backup(
+            backup_path,
+            (
+                settings.RepositoryEntry(url=repository_url, integrity="fsck-connectivity")
+                for repository_url in repositories + repositories  # check for duplicates
+            ),
+            cache_path,
+            max_workers=2,
+        )
+
+    assert len(pickle.loads(cache_path.read_bytes())) == len(repositories)
+    assert [call.kwargs["strategy"] for call in verify_mock.call_args_list] == [
+        integrity.Strategy.FSCK_CONNECTIVITY
+    ] * len(repositories)
+
+
+def test_migrate(mocker, backup_path, cache_path, remote_repository_factory):
+    repository_url = remote_repository_factory("repository")
+    flat_repository = repository.Repository.from_url(parent_path=backup_path, url=repository_url)
+    sharded_repository = repository.Repository.from_url(
+        parent_path=backup_path, url=repository_url, layout=repository.Layout.SHARDED
+    )
+    api.backup(backup_path, [repository_url], cache_path)
+
+    api.migrate(backup_path, [repository_url], repository.Layout.SHARDED, cache_path)
+
+    assert not flat_repository.local_path.exists()
+    assert sharded_repository.exists_locally()
+    assert list(pickle.loads(cache_path.read_bytes())) == [sharded_repository]
+    # The local copy is neither cloned nor read again after the migration.
+    create_local_copy_mock = mocker.spy(repository.Repository, "create_local_copy")
+    calculate_checksum_mock = mocker.spy(api.fs, "calculate_checksum")
+    api.backup(backup_path, [repository_url], cache_path, layout=repository.Layout.SHARDED)
+    create_local_copy_mock.assert_not_called()
+    calculate_checksum_mock.assert_not_called()
+
+
+def test_migrate_other_url(backup_path, cache_path, remote_repository_factory):
+    repository_url = remote_repository_factory("repository")
+    other_url = repository_url.replace("/remotes/", "/remotes/other/")
+    api.backup(backup_path, [repository_url], cache_path)
+
+    # Both urls share the same local path in the flat layout.
+    api.migrate(backup_path, [other_url], repository.Layout.SHARDED, cache_path)
+
+    assert repository.Repository.from_url(
+        parent_path=backup_path, url=repository_url
+    ).exists_locally()
+
+
+def test_backup_adaptive(
+    mocker, backup_path, cache_path, commit_factory, remote_repository_factory
+):
+    repository_url = remote_repository_factory("repository")
+    test_repository = repository.Repository.from_url(parent_path=backup_path, url=repository_url)
+    intervals = cache.FetchIntervals(minimum=3600.0, maximum=86400.0)
+
+    api.backup(backup_path, [repository_url], cache_path)
+    api.backup(backup_path, [repository_url], cache_path)  # nothing has changed
+    state = pickle.loads(cache_path.read_bytes())[test_repository]
+    assert state.change_rate == pytest.approx(0.7)
+
+    commit_factory(repository_url)
+    list_remote_references_mock = mocker.spy(repository.Repository, "list_remote_references")
+    api.backup(backup_path, [repository_url], cache_path, fetch_intervals=intervals)
+    list_remote_references_mock.assert_not_called()  # checked too recently
+
+    mocker.patch.object(api.time, "time", return_value=state.get_next_check(intervals))
+    api.backup(backup_path, [repository_url], cache_path, fetch_intervals=intervals)
+    assert test_repository.is_up_to_date(test_repository.list_remote_references())
+    assert pickle.loads(cache_path.read_bytes())[test_repository].change_rate == pytest.approx(0.79)
+
+
+def test_backup_verification_budget(mocker, backup_path, cache_path, remote_repository_factory):
+    repository_urls = [remote_repository_factory(f"repository-{index}") for index in range(2)]
+    test_repositories = [
+        repository.Repository.from_url(parent_path=backup_path, url=repository_url)
+        for repository_url in repository_urls
+    ]
+    api.backup(backup_path, repository_urls, cache_path)
+
+    backup_cache = pickle.loads(cache_path.read_bytes())
+    backup_cache[test_repositories[1]].verified_at = 0.0  # the oldest verification
+    cache_path.write_bytes(pickle.dumps(backup_cache))
+    budget = integrity.VerificationBudget(
+        max_bytes=backup_cache[test_repositories[1]].checksums.size
+    )
+
+    verify_mock = mocker.spy(integrity, "verify")
+    api.backup(backup_path, repository_urls, cache_path, verification_budget=budget)
+
+    paranoid = {call.args[0]: call.kwargs["paranoid"] for call in verify_mock.call_args_list}
+    assert paranoid == {test_repositories[0]: False, test_repositories[1]: True}
+    assert pickle.loads(cache_path.read_bytes())[test_repositories[1]].verified_at > 0.0
@@ -6,7 +6,7 @@ import pickle
 
 import pytest
 
-from git_backupper import cache, exceptions
+from git_backupper import cache, defaults, exceptions
 
 
 def test_cache_save(checksums, file_path):
@@ -18,6 +18,32 @@ def test_cache_save(checksums, file_path):
     assert checksums == pickle.loads(file_path.read_bytes())
 
 
+def test_cache_flush(checksums, file_path):
+    file_path.unlink()
+
+    persistent_cache = cache.PersistentCache(path=file_path)
+    with persistent_cache as test_cache:
+        test_cache.update(checksums)
+        persistent_cache.flush()
+
+        assert checksums == pickle.loads(file_path.read_bytes())
+
+
+def test_cache_flush_with_interval(mocker, checksums, file_path):
+    file_path.unlink()
+    monotonic = mocker.patch.object(cache.time, "monotonic", return_value=100.0)
+
+    persistent_cache = cache.PersistentCache(path=file_path)
+    with persistent_cache as test_cache:
+        test_cache.update(checksums)
+        persistent_cache.flush(interval=60.0)
+        assert not file_path.exists()  # the cache has just been loaded
+
+        monotonic.return_value = 160.0
+        persistent_cache.flush(interval=60.0)
+        assert checksums == pickle.loads(file_path.read_bytes())
+
+
 def test_cache_save_with_error(caplog, checksums, file_path):
     file_path.write_bytes(pickle.dumps(checksums))
 
@@ -66,3 +92,122 @@ def test_cache_load_with_unpickle_error(caplog, checksums, file_path):
     assert str(error.value) == (
         "Unable to convert the input data into its original or structured form."
     )
+
+
+def test_repository_state_from_value(checksums, directory_path):
+    state = cache.RepositoryState.from_value(checksums, path=directory_path)
+    restored_checksums = state.checksums.to_checksums(directory_path)
+
+    assert {path: checksum.digest for path, checksum in restored_checksums.items()} == checksums
+    assert cache.RepositoryState.from_value(state, path=directory_path) is state
+
+
+@pytest.fixture
+def database_path(tmp_path):
+    return tmp_path / ".git_backupper.sqlite3"
+
+
+@pytest.fixture
+def entries(tmp_path):
+    return {tmp_path / str(index): str(index) * 64 for index in range(5)}
+
+
+def test_sqlite_cache(database_path, entries):
+    with cache.SQLiteCache(path=database_path, legacy_path=None) as test_cache:
+        test_cache.update(entries)
+        del test_cache[next(iter(entries))]
+
+    with cache.SQLiteCache(path=database_path, legacy_path=None) as test_cache:
+        assert dict(test_cache) == dict(list(entries.items())[1:])
+        assert len(test_cache) == len(entries) - 1
+        assert next(iter(entries)) not in test_cache
+
+        with pytest.raises(KeyError):
+            test_cache[next(iter(entries))]
+
+
+def test_sqlite_cache_migration(database_path, entries, tmp_path):
+    legacy_path = tmp_path / ".git_backupper.pickle"
+    legacy_path.write_bytes(pickle.dumps(entries))
+
+    with cache.SQLiteCache(path=database_path, legacy_path=legacy_path) as test_cache:
+        assert dict(test_cache) == entries
+
+        test_cache.clear()
+
+    # The data must be moved from the pickle cache only once.
+    with cache.SQLiteCache(path=database_path, legacy_path=legacy_path) as test_cache:
+        assert dict(test_cache) == {}
+
+
+def test_sqlite_cache_without_with_statement(database_path):
+    with pytest.raises(RuntimeError):
+        cache.SQLiteCache(path=database_path)["test"] = "test"
+
+
+def test_sqlite_cache_with_error(caplog, database_path):
+    database_path.write_bytes(b"test" * 1024)
+
+    with caplog.at_level(logging.ERROR):
+        with pytest.raises(exceptions.FileSystemError) as error:
+            with cache.SQLiteCache(path=database_path, legacy_path=None):
+                pass
+
+    assert str(error.value) == f"Failed to open the database at {str(database_path)!r}."
+
+
+@pytest.mark.parametrize("backend", list(cache.Backend))
+def test_open_cache(backend, database_path):
+    test_cache = cache.open_cache(path=database_path, backend=backend)
+
+    assert isinstance(test_cache, (cache.PersistentCache, cache.SQLiteCache))
+    assert test_cache.path == database_path
+
+
+def test_open_cache_legacy_path(database_path):
+    # The pickle cache in the home directory is not related to the database at another path.
+    assert cache.open_cache(path=database_path, backend=cache.Backend.SQLITE).legacy_path is None
+    assert cache.open_cache(backend=cache.Backend.SQLITE).legacy_path == (
+        defaults.CACHE_PATH.expanduser()
+    )
+
+
+def test_repository_state_durations():
+    state = cache.RepositoryState()
+    assert state.expected_duration == float("inf")
+
+    for duration in range(10):
+        state.add_duration(float(duration))
+
+    assert state.durations == [5.0, 6.0, 7.0, 8.0, 9.0]
+    assert state.expected_duration == 7.0
+
+
+def test_repository_state_pickle_with_missing_fields():
+    state = cache.RepositoryState()
+    del state.durations  # the state saved by the previous versions
+    state.__dict__.pop("change_rate")
+
+    loaded_state = pickle.loads(pickle.dumps(state))
+    assert loaded_state == cache.RepositoryState()
+    assert "change_rate" in loaded_state.__dict__
+
+
+def test_repository_state_record_check(mocker):
+    mocker.patch.object(cache.time, "time", return_value=1000.0)
+    state = cache.RepositoryState()
+
+    state.record_check(changed=False)
+    state.record_check(changed=False)
+
+    assert state.change_rate == pytest.approx(0.49)
+    assert state.checked_at == 1000.0
+
+
+def test_repository_state_get_next_check():
+    intervals = cache.FetchIntervals(minimum=60.0, maximum=3600.0)
+
+    assert cache.RepositoryState(checked_at=100.0).get_next_check(intervals) == 160.0
+    assert cache.RepositoryState(change_rate=0.5).get_next_check(intervals) == 120.0
+    # The local copies of the repositories that never change are still updated in time.
+    assert cache.RepositoryState(change_rate=0.0).get_next_check(intervals) == 3600.0
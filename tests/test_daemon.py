@@ -0,0 +1,215 @@
+# Copyright 2023 (c) Vladislav Punko <iam.vlad.punko@gmail.com>
+
+import json
+import logging
+import os
+import pickle
+import threading
+
+import pytest
+
+from git_backupper import cache, daemon, exceptions, settings
+
+
+@pytest.fixture
+def settings_path(tmp_path):
+    path = tmp_path / "settings.json"
+    path.write_text(
+        json.dumps({"backup_path": str(tmp_path / "backup"), "repositories": ["1.git", "2.git"]})
+    )
+
+    return path
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return tmp_path / "cache.sqlite3"
+
+
+def _stop_after(stop_event, number, func=None):
+    calls = []
+
+    def _backup(backup_path, repositories, backup_cache, **options):
+        calls.append([entry.url for entry in repositories])
+        for entry in repositories:
+            backup_cache[entry.url] = len(calls)
+
+        if func is not None:
+            func(len(calls))
+        if len(calls) == number:
+            stop_event.set()
+
+    return calls, _backup
+
+
+def test_serve(mocker, cache_path, settings_path):
+    stop_event = threading.Event()
+    calls, backup = _stop_after(stop_event, 3)
+    backup_mock = mocker.patch("git_backupper.api.backup", side_effect=backup)
+
+    daemon.serve(
+        settings_path, interval=0.01, jitter=0.0, stop_event=stop_event, cache_path=cache_path
+    )
+
+    assert calls == [["1.git", "2.git"]] * 3
+    # The same cache is kept in memory between the runs.
+    assert len({id(call.kwargs["backup_cache"]) for call in backup_mock.call_args_list}) == 1
+    with cache.SQLiteCache(path=cache_path, legacy_path=None) as backup_cache:
+        assert dict(backup_cache) == {"1.git": 3, "2.git": 3}
+
+
+def test_serve_with_pickle_cache(caplog, mocker, settings_path, tmp_path):
+    cache_path = tmp_path / "cache.pickle"
+    stop_event = threading.Event()
+    calls, backup = _stop_after(stop_event, 1)
+    mocker.patch("git_backupper.api.backup", side_effect=backup)
+
+    with caplog.at_level(logging.WARNING):
+        daemon.serve(
+            settings_path,
+            interval=3600,
+            stop_event=stop_event,
+            cache_path=cache_path,
+            cache_backend=cache.Backend.PICKLE,
+        )
+
+    assert "The whole cache is saved after every run with the pickle backend." in caplog.text
+    assert pickle.loads(cache_path.read_bytes()) == {"1.git": 1, "2.git": 1}
+
+
+def test_serve_with_entry_interval(mocker, cache_path, settings_path, tmp_path):
+    (tmp_path / "manifest.jsonl").write_text('{"url": "3.git", "interval": 0.01}\n')
+    settings_path.write_text(json.dumps({"manifest": str(tmp_path / "manifest.jsonl")}))
+    stop_event = threading.Event()
+    calls, backup = _stop_after(stop_event, 3)
+    mocker.patch("git_backupper.api.backup", side_effect=backup)
+
+    daemon.serve(settings_path, interval=3600, stop_event=stop_event, cache_path=cache_path)
+
+    assert calls == [["3.git"]] * 3
+
+
+def test_serve_reload_settings(mocker, cache_path, settings_path):
+    mocker.patch.object(daemon, "_RELOAD_INTERVAL", 0.0)
+
+    def _change_settings(number):
+        if number == 1:
+            settings_path.write_text(json.dumps({"repositories": ["3.git"]}))
+            os.utime(settings_path, ns=(0, 0))  # the file is changed in the same nanosecond
+
+    stop_event = threading.Event()
+    calls, backup = _stop_after(stop_event, 2, func=_change_settings)
+    mocker.patch("git_backupper.api.backup", side_effect=backup)
+
+    daemon.serve(settings_path, interval=3600, stop_event=stop_event, cache_path=cache_path)
+
+    assert calls == [["1.git", "2.git"], ["3.git"]]
+
+
+def test_serve_reload_manifest_directory(mocker, cache_path, settings_path, tmp_path):
+    mocker.patch.object(daemon, "_RELOAD_INTERVAL", 0.0)
+    manifest_path = tmp_path / "manifest.d"
+    manifest_path.mkdir()
+    (manifest_path / "1.jsonl").write_text('"1.git"\n')
+    settings_path.write_text(json.dumps({"manifest": str(manifest_path)}))
+
+    def _change_manifest(number):
+        if number == 1:
+            # Append to the file in place, which leaves the directory unchanged.
+            with (manifest_path / "1.jsonl").open(mode="a") as stream_out:
+                stream_out.write('"2.git"\n')
+            os.utime(manifest_path / "1.jsonl", ns=(0, 0))
+
+    stop_event = threading.Event()
+    calls, backup = _stop_after(stop_event, 2, func=_change_manifest)
+    mocker.patch("git_backupper.api.backup", side_effect=backup)
+
+    timer = threading.Timer(5.0, stop_event.set)  # stop the service if it is never reloaded
+    timer.start()
+    try:
+        daemon.serve(settings_path, interval=3600, stop_event=stop_event, cache_path=cache_path)
+    finally:
+        timer.cancel()
+
+    assert calls == [["1.git"], ["2.git"]]
+
+
+def test_serve_reload_settings_with_error(caplog, mocker, cache_path, settings_path):
+    mocker.patch.object(daemon, "_RELOAD_INTERVAL", 0.0)
+
+    def _change_settings(number):
+        settings_path.write_text("{")
+        os.utime(settings_path, ns=(number, number))
+
+    stop_event = threading.Event()
+    calls, backup = _stop_after(stop_event, 2, func=_change_settings)
+    mocker.patch("git_backupper.api.backup", side_effect=backup)
+
+    with caplog.at_level(logging.WARNING):
+        daemon.serve(
+            settings_path, interval=0.01, jitter=0.0, stop_event=stop_event, cache_path=cache_path
+        )
+
+    assert calls[-1] == ["1.git", "2.git"]
+    assert "The previous settings are used until the settings file is fixed." in caplog.text
+
+
+def test_serve_with_error(caplog, mocker, cache_path, settings_path):
+    stop_event = threading.Event()
+
+    def _backup(*args, **kwargs):
+        if stop_event.is_set():
+            raise AssertionError("The service has not been stopped.")
+
+        if backup_mock.call_count == 2:
+            stop_event.set()
+        else:
+            raise exceptions.ExternalProcessError
+
+    backup_mock = mocker.patch("git_backupper.api.backup", side_effect=_backup)
+
+    with caplog.at_level(logging.ERROR):
+        daemon.serve(settings_path, interval=0.01, stop_event=stop_event, cache_path=cache_path)
+
+    assert "The backup has failed and will be run again later." in caplog.text
+    assert cache_path.is_file()
+
+
+def test_serve_with_failed_repository(mocker, cache_path, settings_path):
+    mocker.patch.object(daemon, "_RETRY_INTERVAL", 0.01)
+
+    def _fail_first(number):
+        backup_mock.call_args.kwargs["failed_urls"].add("1.git")
+
+    stop_event = threading.Event()
+    calls, backup = _stop_after(stop_event, 3, func=_fail_first)
+    backup_mock = mocker.patch("git_backupper.api.backup", side_effect=backup)
+
+    daemon.serve(
+        settings_path, interval=3600, jitter=0.0, stop_event=stop_event, cache_path=cache_path
+    )
+
+    # Only the failed repository is backed up again before the interval has passed.
+    assert calls == [["1.git", "2.git"], ["1.git"], ["1.git"]]
+
+
+def test_get_delay():
+    delays = [daemon._get_delay(100.0, jitter=0.1) for _ in range(100)]
+
+    assert all(90.0 <= delay <= 110.0 for delay in delays)
+    assert len(set(delays)) > 1
+
+
+def test_schedule():
+    schedule = daemon._Schedule()
+    schedule.update([settings.RepositoryEntry("1.git"), settings.RepositoryEntry("2.git")])
+
+    ready = schedule.pop_ready(float("inf"))
+    schedule.push("1.git", 10.0)
+    schedule.push("2.git", 5.0)
+    schedule.update([settings.RepositoryEntry("1.git")])
+
+    assert [entry.url for entry in ready] == ["1.git", "2.git"]
+    assert schedule.get_next_due() == 10.0
+    assert schedule.pop_ready(9.0) == []
+    assert schedule.pop_ready(10.0) == [settings.RepositoryEntry("1.git")]
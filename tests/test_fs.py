@@ -1,11 +1,13 @@
 # Copyright 2023 (c) Vladislav Punko <iam.vlad.punko@gmail.com>
 
+import hashlib
 import logging
 import os
+import pathlib
 
 import pytest
 
-from git_backupper import exceptions, fs
+from git_backupper import exceptions, fs, throttle
 
 
 def test_create_directory(directory_path):
@@ -32,6 +34,31 @@ def test_remove_directory(directory_path):
     assert not directory_path.is_dir()
 
 
+def test_move_directory(directory_path, file_path):
+    status = file_path.stat()
+    target_path = pathlib.Path("a", "b", "directory")
+
+    fs.move_directory(directory_path, target_path)
+
+    assert not directory_path.exists()
+    assert fs.FileChecksum.from_stat("", (target_path / file_path.name).stat()).matches(status)
+
+
+def test_move_directory_with_error(caplog, directory_path):
+    target_path = pathlib.Path("target")
+    target_path.mkdir()
+
+    with caplog.at_level(logging.ERROR):
+        with pytest.raises(exceptions.FileSystemError) as error:
+            fs.move_directory(directory_path, target_path)
+
+    assert "It is impossible to move a directory on the current machine." in caplog.text
+    assert str(error.value) == (
+        f"Failed to move directory {str(directory_path)!r} to {str(target_path)!r}."
+    )
+    assert directory_path.is_dir()
+
+
 def test_remove_directory_in_case_symlink(symlink_path):
     fs.remove_directory(symlink_path)
     assert not symlink_path.exists()
@@ -76,3 +103,90 @@ def test_calculate_checksums(checksums, directory_path, symlink_path):
 
     checksums = fs.calculate_checksums(symlink_path)
     assert checksums == {}
+
+
+def test_calculate_file_checksums(checksums, directory_path):
+    file_checksums = fs.calculate_file_checksums(directory_path)
+
+    assert {path: checksum.digest for path, checksum in file_checksums.items()} == checksums
+    for path, checksum in file_checksums.items():
+        assert checksum.matches(path.stat())
+
+
+def test_calculate_file_checksums_incrementally(mocker, checksums, directory_path):
+    previous = fs.calculate_file_checksums(directory_path)
+
+    changed_path = next(iter(checksums))
+    changed_path.write_text("test")
+    calculate_checksum_mock = mocker.patch(
+        "git_backupper.fs.calculate_checksum", wraps=fs.calculate_checksum
+    )
+
+    file_checksums = fs.calculate_file_checksums(directory_path, previous=previous)
+
+    calculate_checksum_mock.assert_called_once_with(changed_path)
+    assert not fs.have_same_digests(previous, file_checksums)
+    assert file_checksums[changed_path].digest == fs.calculate_checksum(changed_path)
+
+
+def test_have_same_digests(checksums, directory_path):
+    file_checksums = fs.calculate_file_checksums(directory_path)
+    path, checksum = next(iter(file_checksums.items()))
+
+    assert fs.have_same_digests(
+        file_checksums, {**file_checksums, path: checksum._replace(inode=-1)}
+    )
+    assert not fs.have_same_digests(file_checksums, {})
+    assert not fs.have_same_digests(
+        file_checksums, {**file_checksums, path: checksum._replace(digest="")}
+    )
+
+
+def test_calculate_checksums_concurrently(checksums, directory_path):
+    assert fs.calculate_checksums(directory_path, max_workers=4) == checksums
+    assert list(fs.calculate_checksums(directory_path, max_workers=4)) == list(
+        fs.calculate_checksums(directory_path)
+    )
+
+
+def test_calculate_checksums_largest_first(mocker, directory_path):
+    for size in (1, 100, 10):
+        (directory_path / str(size)).write_bytes(b"0" * size)
+    calculate_checksum_mock = mocker.patch(
+        "git_backupper.fs.calculate_checksum", wraps=fs.calculate_checksum
+    )
+
+    fs.calculate_checksums(directory_path)
+
+    assert [call.args[0].name for call in calculate_checksum_mock.call_args_list] == [
+        "100",
+        "10",
+        "1",
+    ]
+
+
+@pytest.mark.parametrize("buffer_size", (1, 7, 2**18))
+def test_calculate_checksum_with_buffer_size(buffer_size, checksums):
+    for path, checksum in checksums.items():
+        assert fs.calculate_checksum(path, buffer_size=buffer_size) == checksum
+
+
+def test_calculate_checksum_with_memory_map(mocker, tmp_path):
+    path = tmp_path / "test.pack"
+    path.write_bytes(os.urandom(2**16))
+    mocker.patch("git_backupper.fs._MMAP_THRESHOLD", 2**10)
+
+    assert fs.calculate_checksum(path) == hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def test_calculate_checksum_with_read_rate(mocker, tmp_path):
+    path = tmp_path / "test.pack"
+    path.write_bytes(os.urandom(2**16))
+    mocker.patch("git_backupper.fs._MMAP_THRESHOLD", 2**10)
+    consume_mock = mocker.patch("git_backupper.throttle.consume")
+
+    with throttle.limit(2**30):
+        digest = fs.calculate_checksum(path, buffer_size=2**12)
+
+    assert digest == hashlib.sha256(path.read_bytes()).hexdigest()
+    assert sum(call.args[0] for call in consume_mock.call_args_list) == 2**16
@@ -0,0 +1,140 @@
+# Copyright 2023 (c) Vladislav Punko <iam.vlad.punko@gmail.com>
+
+import logging
+import pathlib
+import subprocess
+
+import pytest
+
+from git_backupper import fs, integrity, manifest, repository
+
+
+@pytest.fixture
+def test_repository(remote_repository_factory, tmp_path):
+    repository_url = remote_repository_factory("repository")
+    test_repository = repository.Repository.from_url(
+        parent_path=tmp_path / ".backup_repositories", url=repository_url
+    )
+    test_repository.create_local_copy()
+    subprocess.check_call(
+        ["git", "-C", str(test_repository.local_path), "repack", "-a", "-d", "-q"]
+    )
+
+    return test_repository
+
+
+@pytest.fixture
+def pack_path(test_repository):
+    return next((test_repository.local_path / "objects" / "pack").glob("pack-*.pack"))
+
+
+def test_verify_pack(pack_path):
+    assert integrity.verify_pack(pack_path)
+
+
+def test_verify_pack_with_corrupted_trailer(pack_path):
+    data = bytearray(pack_path.read_bytes())
+    data[-1] ^= 0xFF
+    pack_path.chmod(0o644)
+    pack_path.write_bytes(data)
+
+    assert not integrity.verify_pack(pack_path)
+
+
+def test_verify_pack_without_index(pack_path):
+    pack_path.with_suffix(".idx").unlink()
+
+    assert not integrity.verify_pack(pack_path)
+
+
+@pytest.mark.parametrize("strategy", list(integrity.Strategy))
+def test_verify(strategy, test_repository):
+    checksums = manifest.Manifest.from_checksums(
+        test_repository.local_path, fs.calculate_file_checksums(test_repository.local_path)
+    )
+
+    assert integrity.verify(test_repository, checksums, strategy=strategy)
+    assert integrity.verify(test_repository, checksums, strategy=strategy, paranoid=True)
+
+
+@pytest.mark.parametrize(
+    "strategy",
+    (
+        integrity.Strategy.CHECKSUMS,
+        integrity.Strategy.FSCK_CONNECTIVITY,
+        integrity.Strategy.PACK_TRAILER,
+    ),
+)
+def test_verify_with_removed_pack(strategy, pack_path, test_repository):
+    checksums = manifest.Manifest.from_checksums(
+        test_repository.local_path, fs.calculate_file_checksums(test_repository.local_path)
+    )
+    pack_path.unlink()
+
+    result = integrity.verify(test_repository, checksums, strategy=strategy)
+
+    assert not result
+    if strategy is not integrity.Strategy.FSCK_CONNECTIVITY:
+        assert result.diff.removed == (
+            pack_path.relative_to(test_repository.local_path).as_posix(),
+        )
+    assert integrity.verify(test_repository, checksums, strategy=integrity.Strategy.NONE)
+
+
+def test_verify_pack_trailer_with_changed_file(test_repository):
+    checksums = manifest.Manifest.from_checksums(
+        test_repository.local_path, fs.calculate_file_checksums(test_repository.local_path)
+    )
+    (test_repository.local_path / "HEAD").write_text("ref: refs/heads/test\n")
+
+    result = integrity.verify(test_repository, checksums, strategy=integrity.Strategy.PACK_TRAILER)
+
+    assert not result
+    assert result.diff == manifest.ManifestDiff(changed=("HEAD",))
+
+
+def test_verify_pack_trailer_reads_every_pack_once(mocker, pack_path, test_repository):
+    checksums = manifest.Manifest.from_checksums(
+        test_repository.local_path, fs.calculate_file_checksums(test_repository.local_path)
+    )
+    verify_pack = mocker.spy(integrity, "verify_pack")
+
+    assert integrity.verify(test_repository, checksums, strategy=integrity.Strategy.PACK_TRAILER)
+    verify_pack.assert_called_once_with(pack_path)
+
+
+def test_verify_pack_trailer_with_corrupted_pack(pack_path, test_repository):
+    checksums = manifest.Manifest.from_checksums(
+        test_repository.local_path, fs.calculate_file_checksums(test_repository.local_path)
+    )
+    pack_path.chmod(0o644)
+    with pack_path.open(mode="r+b") as stream_out:
+        stream_out.write(b"TEST")
+
+    result = integrity.verify(test_repository, checksums, strategy=integrity.Strategy.PACK_TRAILER)
+
+    assert not result
+    path = pack_path.relative_to(test_repository.local_path)
+    assert result.diff == manifest.ManifestDiff(
+        changed=(path.with_suffix(".idx").as_posix(), path.as_posix())
+    )
+
+
+def test_verification_planner(caplog, mocker):
+    mocker.patch.object(integrity.time, "time", return_value=1000.0)
+    backup_repositories = [
+        repository.Repository(local_path=pathlib.Path(f"{index}.git"), url=f"{index}.git")
+        for index in range(4)
+    ]
+    planner = integrity.VerificationPlanner(integrity.VerificationBudget(max_bytes=30, max_age=10))
+    planner.add(backup_repositories[0], verified_at=990.0, size=10)
+    planner.add(backup_repositories[1], verified_at=980.0, size=25)  # too large for the budget
+    planner.add(backup_repositories[2], verified_at=995.0, size=10)
+    planner.add(backup_repositories[3], verified_at=0.0, size=10)
+
+    with caplog.at_level(logging.WARNING):
+        selected = [planner.is_selected(item) for item in backup_repositories]
+
+    assert selected == [True, False, True, True]
+    assert planner.remaining_bytes == 0
+    assert "The budget is too small to verify the '1.git' repository in time." in caplog.text
@@ -0,0 +1,53 @@
+# Copyright 2023 (c) Vladislav Punko <iam.vlad.punko@gmail.com>
+
+import json
+import logging
+import logging.handlers
+import threading
+
+import pytest
+
+from git_backupper import logger_wrapper, metrics
+
+
+@pytest.fixture(autouse=True)
+def log_path(mocker, tmp_path):
+    root_logger = logging.getLogger()
+    handlers, level = root_logger.handlers[:], root_logger.level
+    mocker.patch.object(logger_wrapper.tempfile, "gettempdir", return_value=str(tmp_path))
+
+    yield tmp_path / "git-backupper.log"
+
+    logger_wrapper.shutdown()
+    for handler in root_logger.handlers:
+        handler.close()
+    root_logger.handlers, root_logger.level = handlers, level
+
+
+def test_setup_queued(log_path):
+    logger_wrapper.setup(queued=True)
+    assert isinstance(logging.getLogger().handlers[0], logging.handlers.QueueHandler)
+
+    logging.getLogger("git_backupper.test").warning("The %s record.", "queued")
+    logger_wrapper.shutdown()
+
+    assert log_path.read_text().endswith("WARNING :: git_backupper.test :: The queued record.\n")
+
+
+@pytest.mark.parametrize("queued", (False, True))
+def test_setup_structured(log_path, queued):
+    logger_wrapper.setup(queued=queued, structured=True)
+
+    def log():
+        with metrics.repository("https://localhost/repository"), metrics.timer("verify"):
+            logging.getLogger("git_backupper.test").warning("The structured record.")
+
+    thread = threading.Thread(target=log)
+    thread.start()
+    thread.join()
+    logger_wrapper.shutdown()
+
+    entry = json.loads(log_path.read_text())
+    assert entry["message"] == "The structured record."
+    assert entry["repository"] == "https://localhost/repository"
+    assert entry["phase"] == "verify"
@@ -0,0 +1,100 @@
+# Copyright 2023 (c) Vladislav Punko <iam.vlad.punko@gmail.com>
+
+import subprocess
+import sys
+
+import pytest
+
+from git_backupper import __main__, cache, integrity, profiling, repository, throttle
+
+# The import of the command line interface must stay well below this limit in microseconds.
+_IMPORT_TIME_BUDGET = 100_000
+
+
+def _get_import_times():
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import git_backupper.__main__"],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+
+    import_times = {}
+    for line in process.stderr.splitlines()[1:]:  # skip the header
+        _, _, cumulative_time, name = (part.strip() for part in line.replace(":", "|").split("|"))
+        import_times[name] = int(cumulative_time)
+
+    return import_times
+
+
+def test_main_import_time():
+    import_times = _get_import_times()
+
+    assert import_times["git_backupper.__main__"] < _IMPORT_TIME_BUDGET
+    # These modules are imported only when the backup is started.
+    assert (
+        not {
+            "git_backupper.api",
+            "git_backupper.cache",
+            "git_backupper.logger_wrapper",
+            "importlib.metadata",
+            "logging.config",
+            "subprocess",
+        }
+        & import_times.keys()
+    )
+
+
+@pytest.mark.parametrize(
+    "choices, enum",
+    (
+        (__main__._CACHE_BACKENDS, cache.Backend),
+        (__main__._INTEGRITY_STRATEGIES, integrity.Strategy),
+        (__main__._IO_CLASSES, throttle.IOClass),
+        (__main__._LAYOUTS, repository.Layout),
+        (__main__._PROFILE_MODES, profiling.Mode),
+    ),
+)
+def test_main_choices(choices, enum):
+    assert choices == tuple(sorted(str(member) for member in enum))
+
+
+def test_main_version(capsys, mocker):
+    mocker.patch.object(sys, "argv", ["git-backupper", "--version"])
+    mocker.patch("importlib.metadata.version", return_value="1.2.3")
+
+    with pytest.raises(SystemExit):
+        __main__.main()
+
+    assert capsys.readouterr().out == "1.2.3\n"
+
+
+def test_main_serve(mocker):
+    mocker.patch.object(sys, "argv", ["git-backupper", "-j", "2", "serve", "--interval", "60"])
+    mocker.patch("signal.signal")
+    serve_mock = mocker.patch("git_backupper.daemon.serve")
+
+    __main__.main()
+
+    assert serve_mock.call_args.kwargs["interval"] == 60
+    assert serve_mock.call_args.kwargs["jitter"] == 0.1
+    assert serve_mock.call_args.kwargs["max_workers"] == 2
+    assert serve_mock.call_args.kwargs["cache_backend"] is cache.Backend.SQLITE
+
+
+def test_main_serve_with_pickle_cache(mocker):
+    mocker.patch.object(sys, "argv", ["git-backupper", "--cache-backend", "pickle", "serve"])
+    mocker.patch("signal.signal")
+    serve_mock = mocker.patch("git_backupper.daemon.serve")
+
+    __main__.main()
+
+    assert serve_mock.call_args.kwargs["cache_backend"] is cache.Backend.PICKLE
+
+
+@pytest.mark.parametrize("jitter", ("-0.1", "1", "nan", "text"))
+def test_main_serve_with_invalid_jitter(jitter, mocker):
+    mocker.patch.object(sys, "argv", ["git-backupper", "serve", "--jitter", jitter])
+
+    with pytest.raises(SystemExit):
+        __main__.main()
@@ -0,0 +1,159 @@
+# Copyright 2023 (c) Vladislav Punko <iam.vlad.punko@gmail.com>
+
+import array
+import itertools
+import pickle
+
+import pytest
+
+from git_backupper import fs, manifest
+
+
+@pytest.fixture
+def file_checksums(checksums, directory_path):
+    return fs.calculate_file_checksums(directory_path)
+
+
+@pytest.fixture
+def test_manifest(directory_path, file_checksums):
+    return manifest.Manifest.from_checksums(directory_path, file_checksums)
+
+
+def test_manifest_class(directory_path, file_checksums, test_manifest):
+    assert len(test_manifest) == len(file_checksums)
+    assert list(test_manifest) == sorted(path.name for path in file_checksums)
+    assert repr(test_manifest) == (
+        f"Manifest(files={len(file_checksums)}, root={test_manifest.root!r})"
+    )
+
+    for path, checksum in file_checksums.items():
+        assert test_manifest[path.name] == checksum
+
+    with pytest.raises(KeyError):
+        test_manifest["test"]
+
+
+def test_manifest_to_checksums(directory_path, file_checksums, test_manifest):
+    assert test_manifest.to_checksums(directory_path) == file_checksums
+
+
+def test_manifest_size(file_checksums, test_manifest):
+    assert test_manifest.size == sum(checksum.size for checksum in file_checksums.values())
+    assert manifest.Manifest().size == 0
+
+
+def test_manifest_pickle(test_manifest):
+    restored_manifest = pickle.loads(pickle.dumps(test_manifest, protocol=pickle.HIGHEST_PROTOCOL))
+
+    assert restored_manifest == test_manifest
+    assert dict(restored_manifest) == dict(test_manifest)
+
+
+def test_manifest_large_inode(test_manifest):
+    path, checksum = next(iter(test_manifest.items()))
+    # Some file systems like overlayfs use all 64 bits of the inode numbers.
+    checksum = checksum._replace(inode=2**64 - 1)
+
+    assert manifest.Manifest([(path, checksum)])[path] == checksum
+
+
+def test_manifest_pickle_with_inodes_in_states(test_manifest):
+    restored_manifest = manifest.Manifest.__new__(manifest.Manifest)
+    restored_manifest.__setstate__(
+        (
+            None,
+            {
+                "_digests": test_manifest._digests,
+                "_paths": test_manifest._paths,
+                # The previous versions kept size, mtime_ns, inode and ctime_ns together.
+                "_states": array.array(
+                    "q",
+                    itertools.chain.from_iterable(
+                        (checksum.size, checksum.mtime_ns, -1, checksum.ctime_ns)
+                        for checksum in test_manifest.values()
+                    ),
+                ),
+                "_tree": test_manifest._tree,
+            },
+        )
+    )
+
+    assert restored_manifest == test_manifest
+    assert dict(restored_manifest) == {
+        path: checksum._replace(inode=0) for path, checksum in test_manifest.items()
+    }
+
+
+def test_manifest_equality(test_manifest):
+    path, checksum = next(iter(test_manifest.items()))
+    entries = dict(test_manifest)
+
+    assert test_manifest == manifest.Manifest(
+        {**entries, path: checksum._replace(inode=checksum.inode + 1)}.items()
+    )
+    assert test_manifest != manifest.Manifest(
+        {**entries, path: checksum._replace(digest="0" * 64)}.items()
+    )
+    assert test_manifest != manifest.Manifest()
+    assert test_manifest != dict(test_manifest)
+
+
+def test_manifest_diff(test_manifest):
+    added, changed, removed = "0", *list(test_manifest)[:2]
+    entries = dict(test_manifest)
+    entries[added] = entries[changed]._replace(digest="0" * 64)
+    entries[changed] = entries[changed]._replace(digest="0" * 64)
+    del entries[removed]
+
+    diff = test_manifest.diff(manifest.Manifest(entries.items()))
+
+    assert diff == manifest.ManifestDiff(added=(added,), changed=(changed,), removed=(removed,))
+    assert not test_manifest.diff(test_manifest)
+
+
+@pytest.fixture
+def tree_manifest():
+    checksum = fs.FileChecksum("0" * 64, 0, 0, 0, 0)
+    paths = (
+        "HEAD",
+        "objects/00/1",
+        "objects/00/2",
+        "objects/01/1",
+        "objects/03/1",
+        "objects/03/2",
+        "refs/heads/main",
+        "refs.txt",
+    )
+
+    return manifest.Manifest((path, checksum) for path in paths)
+
+
+def test_manifest_root(tree_manifest):
+    entries = dict(tree_manifest)
+    entries["objects/00/2"] = entries["objects/00/2"]._replace(digest="1" * 64)
+
+    assert tree_manifest.root == manifest.Manifest(tree_manifest.items()).root
+    assert tree_manifest.root != manifest.Manifest(entries.items()).root
+    assert manifest.Manifest().root == manifest.Manifest().root
+
+
+def test_manifest_diff_subtrees(mocker, tree_manifest):
+    entries = dict(tree_manifest)
+    entries["objects/00/2"] = entries["objects/00/2"]._replace(digest="1" * 64)
+    entries["objects/02/1"] = entries.pop("objects/01/1")
+    del entries["refs/heads/main"]
+    other_manifest = manifest.Manifest(entries.items())
+    get_digest_mock = mocker.spy(manifest.Manifest, "_get_digest")
+
+    diff = tree_manifest.diff(other_manifest)
+
+    assert diff == manifest.ManifestDiff(
+        added=("objects/02/1",),
+        changed=("objects/00/2",),
+        removed=("objects/01/1", "refs/heads/main"),
+    )
+    # Only the files in the root and objects/00 directories are compared.
+    assert get_digest_mock.call_count == 2 * 4
+    assert str(diff) == (
+        "added 'objects/02/1'; changed 'objects/00/2'; removed 'objects/01/1', 'refs/heads/main'"
+    )
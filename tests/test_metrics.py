@@ -0,0 +1,60 @@
+# Copyright 2023 (c) Vladislav Punko <iam.vlad.punko@gmail.com>
+
+import json
+
+from git_backupper import metrics
+
+
+def test_metrics_collect():
+    with metrics.collect() as collector:
+        with metrics.timer("cache_load"):
+            pass
+
+        with metrics.repository("https://localhost/repository"), metrics.timer("git fetch"):
+            metrics.add("hashed_files", 2)
+            metrics.add("hashed_files", 3)
+
+    report = collector.to_dict()
+    assert report["finished_at"] > 0
+    assert report["run"]["phases"]["cache_load"]["calls"] == 1
+    assert report["repositories"]["https://localhost/repository"]["hashed_files"] == 5
+    assert (
+        report["repositories"]["https://localhost/repository"]["phases"]["git fetch"]["seconds"]
+        >= 0
+    )
+
+
+def test_metrics_without_collector(mocker):
+    add_mock = mocker.patch.object(metrics.Collector, "add", autospec=True)
+
+    with metrics.timer("verify"):
+        metrics.add("hashed_files", 1)
+
+    add_mock.assert_not_called()
+
+
+def test_metrics_to_prometheus():
+    with metrics.collect() as collector:
+        with metrics.repository('quoted "name"'), metrics.timer("verify"):
+            metrics.add("hashed_bytes", 10)
+
+    lines = collector.to_prometheus().splitlines()
+    assert "# TYPE git_backupper_phase_seconds gauge" in lines
+    assert 'git_backupper_phase_calls{repository="quoted \\"name\\"",phase="verify"} 1' in lines
+    assert 'git_backupper_hashed_bytes{repository="quoted \\"name\\""} 10.0' in lines
+
+
+def test_metrics_write(tmp_path):
+    with metrics.collect() as collector:
+        metrics.add("hashed_files", 1)
+
+    collector.write_json(tmp_path / "metrics" / "report.json")
+    collector.write_prometheus(tmp_path / "metrics" / "git_backupper.prom")
+
+    assert (
+        json.loads((tmp_path / "metrics" / "report.json").read_text())["run"]["hashed_files"] == 1
+    )
+    assert sorted(path.name for path in (tmp_path / "metrics").iterdir()) == [
+        "git_backupper.prom",
+        "report.json",
+    ]
@@ -0,0 +1,43 @@
+# Copyright 2023 (c) Vladislav Punko <iam.vlad.punko@gmail.com>
+
+import pstats
+import threading
+import time
+
+import pytest
+
+from git_backupper import profiling
+
+
+def _work():
+    deadline = time.monotonic() + 0.1
+    while time.monotonic() < deadline:
+        sum(range(1000))
+
+
+def _run_section(name):
+    with profiling.section(name):
+        _work()
+
+
+@pytest.mark.parametrize("mode", list(profiling.Mode))
+def test_profile(mode, tmp_path):
+    with profiling.profile(tmp_path, mode=mode):
+        thread = threading.Thread(target=_run_section, args=("repository.git",))
+        thread.start()
+        thread.join()
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "main.pstats",
+        "repository.git.pstats",
+    ]
+    functions = {name for _, _, name in pstats.Stats(str(tmp_path / "repository.git.pstats")).stats}
+    assert "_work" in functions
+
+
+def test_profile_section_without_profile(tmp_path, mocker):
+    profile_mock = mocker.patch.object(profiling.cProfile, "Profile", autospec=True)
+
+    _run_section("repository.git")
+
+    profile_mock.assert_not_called()
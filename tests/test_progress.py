@@ -0,0 +1,64 @@
+# Copyright 2023 (c) Vladislav Punko <iam.vlad.punko@gmail.com>
+
+import io
+
+import pytest
+
+from git_backupper import progress
+
+
+@pytest.mark.parametrize(
+    "line, event",
+    (
+        (
+            "Receiving objects:  45% (450/1000), 1.50 MiB | 512.00 KiB/s",
+            progress.Progress("Receiving objects", 450, 1000, 1572864, 524288.0),
+        ),
+        (
+            "Receiving objects: 100% (1000/1000), 312 bytes | 104 bytes/s, done.",
+            progress.Progress("Receiving objects", 1000, 1000, 312, 104.0, done=True),
+        ),
+        (
+            "remote: Counting objects: 100% (8/8), done.",
+            progress.Progress("Counting objects", 8, 8, done=True),
+        ),
+        (
+            "remote: Total 3 (delta 0), reused 0 (delta 0), pack-reused 0",
+            progress.Progress("Total", 3, 3, done=True),
+        ),
+        ("From https://github.com/vladpunko/git-backupper", None),
+        (" = [up to date]      main       -> main", None),
+    ),
+)
+def test_parse(line, event):
+    assert progress.parse(line) == event
+
+
+def test_read_lines():
+    stream = io.BufferedReader(io.BytesIO(b"a: 1%\ra: 2%\r\n\nlast"))
+
+    assert list(progress.read_lines(stream, buffer_size=3)) == ["a: 1%", "a: 2%", "last"]
+
+
+def test_read_lines_with_long_line(mocker):
+    mocker.patch.object(progress, "_MAX_LINE_SIZE", 4)
+    stream = io.BufferedReader(io.BytesIO(b"abcdefghij\n"))
+
+    assert list(progress.read_lines(stream)) == ["abcd", "efgh", "ij"]
+
+
+def test_tracker(caplog):
+    tracker = progress.Tracker(max_messages=1)
+    tracker.consume(
+        io.BufferedReader(
+            io.BytesIO(
+                b"Cloning into bare repository 'repository.git'...\n"
+                b"remote: Enumerating objects: 3, done.\n"
+                b"Receiving objects:  50% (1/2)\r"
+                b"Receiving objects: 100% (2/2), 1.00 KiB | 1.00 KiB/s, done.\n"
+            )
+        )
+    )
+
+    assert tracker.transfer == progress.Transfer(objects=2, received_bytes=1024, rate=1024.0)
+    assert list(tracker.messages) == ["remote: Enumerating objects: 3, done."]
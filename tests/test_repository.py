@@ -1,11 +1,13 @@
 # Copyright 2023 (c) Vladislav Punko <iam.vlad.punko@gmail.com>
 
+import hashlib
 import logging
 import reprlib
+import subprocess
 
 import pytest
 
-from git_backupper import exceptions, repository
+from git_backupper import exceptions, repository, throttle
 
 
 @pytest.fixture
@@ -37,6 +39,74 @@ def test_repository_from_url(directory_path, repository_url):
     assert test_repository.url == repository_url
 
 
+@pytest.mark.parametrize(
+    "url, path",
+    (
+        (
+            "https://github.com/vladpunko/git-backupper",
+            "github.com/{}/{}/vladpunko__git-backupper-{}.git",
+        ),
+        (
+            "git@github.com:vladpunko/git-backupper.git",
+            "github.com/{}/{}/vladpunko__git-backupper-{}.git",
+        ),
+        (
+            "https://gitlab.com/group/subgroup/name.git",
+            "gitlab.com/{}/{}/group__subgroup__name-{}.git",
+        ),
+        ("/tmp/../git-backupper", "local/{}/{}/tmp__git-backupper-{}.git"),
+    ),
+)
+def test_repository_from_url_sharded(directory_path, url, path):
+    digest = hashlib.sha256(url.encode()).hexdigest()
+    test_repository = repository.Repository.from_url(
+        parent_path=directory_path, url=url, layout=repository.Layout.SHARDED
+    )
+
+    assert test_repository.local_path == directory_path / path.format(
+        digest[:2], digest[2:4], digest[:12]
+    )
+
+
+def test_repository_from_url_sharded_without_collisions(directory_path):
+    urls = [
+        "https://github.com/vladpunko/git-backupper",
+        "https://github.com/vladpunko/git-backupper.git",
+        "https://gitlab.com/vladpunko/git-backupper",
+        "https://github.com/someone/git-backupper",
+        # The joined parts of these paths and the hosts without ports are the same.
+        "https://github.com/a__b/c",
+        "https://github.com/a/b__c",
+        "https://github.com:8443/org/x",
+        "https://github.com/org/x",
+    ]
+
+    local_paths = {
+        repository.Repository.from_url(
+            parent_path=directory_path, url=url, layout=repository.Layout.SHARDED
+        ).local_path
+        for url in urls
+    }
+
+    assert len(local_paths) == len(urls)
+    assert len({local_path.name for local_path in local_paths}) == len(urls)
+
+
+def test_repository_unique_name(directory_path):
+    urls = [
+        "https://github.com/vladpunko/git-backupper",
+        "https://gitlab.com/vladpunko/git-backupper",
+    ]
+
+    names = {
+        repository.Repository.from_url(parent_path=directory_path, url=url).unique_name
+        for url in urls
+    }
+
+    assert len(names) == len(urls)
+    assert all(name.startswith("vladpunko__git-backupper-") for name in names)
+
+
 def test_repository_create_local_copy(mocker, directory_path, repository_url):
     git_run_command_mock = mocker.patch("git_backupper.repository._run_git_command")
 
@@ -44,7 +114,8 @@ def test_repository_create_local_copy(mocker, directory_path, repository_url):
     test_repository.create_local_copy()
 
     git_run_command_mock.assert_called_once_with(
-        repository.GIT_COMMANDS["clone"].format(repository_url, str(directory_path))
+        repository.GIT_COMMANDS["clone"].format(repository_url, str(directory_path)),
+        tracker=mocker.ANY,
     )
 
 
@@ -55,7 +126,7 @@ def test_repository_update_local_copy(mocker, directory_path, repository_url):
     test_repository.update_local_copy()
 
     git_run_command_mock.assert_called_once_with(
-        repository.GIT_COMMANDS["fetch"].format(str(directory_path))
+        repository.GIT_COMMANDS["fetch"].format(str(directory_path)), tracker=mocker.ANY
     )
 
 
@@ -85,28 +156,156 @@ def test_repository_exists_on_remote(mocker, directory_path, repository_url):
     test_repository.exists_on_remote()
 
     git_run_command_mock.assert_called_once_with(
-        repository.GIT_COMMANDS["ls-remote"].format(repository_url), silent=True
+        repository.GIT_COMMANDS["ls-remote"].format(repository_url),
+        silent=True,
+        capture_output=True,
     )
 
 
-def test_repository_not_exists_on_remote(directory_path):
-    test_repository = repository.Repository(local_path=directory_path, url="https://google.com")
+def test_repository_not_exists_on_remote(tmp_path):
+    # The output of git commands can not be captured using the fake file system.
+    test_repository = repository.Repository(local_path=tmp_path, url="https://google.com")
 
     assert not test_repository.exists_on_remote()
 
 
-def test_repository_update_local_copy_with_error(caplog, directory_path, repository_url):
+def test_repository_update_local_copy_with_error(caplog, repository_url, tmp_path):
+    # The messages of git commands can not be read using the fake file system.
+    directory_path = tmp_path / "repository.git"
     test_repository = repository.Repository(local_path=directory_path, url=repository_url)
 
-    directory_path.rmdir()
     with caplog.at_level(logging.ERROR):
         with pytest.raises(exceptions.ExternalProcessError) as error:
             test_repository.update_local_copy()
 
     message = "An error occurred on the machine while attempting to execute the command."
     assert message in caplog.text
+    assert "fatal: cannot change to" in caplog.text  # the message of git itself
     assert str(error.value) == (
         "Failed to run the command: {0!r}.".format(
             repository.GIT_COMMANDS["fetch"].format(str(directory_path))
         )
     )
+
+
+def test_repository_check_connectivity(mocker, directory_path, repository_url):
+    git_run_command_mock = mocker.patch("git_backupper.repository._run_git_command")
+
+    test_repository = repository.Repository(local_path=directory_path, url=repository_url)
+
+    assert test_repository.check_connectivity()
+    git_run_command_mock.assert_called_once_with(
+        repository.GIT_COMMANDS["fsck"].format(str(directory_path)), silent=True
+    )
+
+
+def test_repository_check_connectivity_with_error(directory_path, repository_url):
+    test_repository = repository.Repository(local_path=directory_path, url=repository_url)
+
+    assert not test_repository.check_connectivity()  # directory is not a git repository
+
+
+@pytest.fixture
+def test_repository(remote_repository_factory, tmp_path):
+    repository_url = remote_repository_factory("repository")
+    test_repository = repository.Repository.from_url(parent_path=tmp_path, url=repository_url)
+    test_repository.create_local_copy()
+
+    return test_repository
+
+
+def test_repository_list_remote_references(test_repository):
+    references = test_repository.list_remote_references()
+
+    assert list(references) == ["refs/heads/main"]
+    assert all(len(object_name) == 40 for object_name in references.values())
+
+
+def test_repository_is_up_to_date(commit_factory, test_repository):
+    assert test_repository.is_up_to_date(test_repository.list_remote_references())
+
+    commit_factory(test_repository.url)
+    assert not test_repository.is_up_to_date(test_repository.list_remote_references())
+
+    test_repository.update_local_copy()
+    assert test_repository.is_up_to_date(test_repository.list_remote_references())
+
+
+@pytest.mark.parametrize(
+    "url, host",
+    (
+        ("https://github.com/vladpunko/git-backupper", "github.com"),
+        ("ssh://git@GitHub.com:22/vladpunko/git-backupper.git", "github.com"),
+        ("git@github.com:vladpunko/git-backupper.git", "github.com"),
+        ("file:///tmp/git-backupper", ""),
+        ("/tmp/git-backupper", ""),
+        ("./directory:name/git-backupper", ""),
+    ),
+)
+def test_repository_host(directory_path, url, host):
+    assert repository.Repository(local_path=directory_path, url=url).host == host
+
+
+def test_repository_list_local_references(commit_factory, test_repository):
+    assert test_repository.list_local_references() == test_repository.list_remote_references()
+
+    commit_factory(test_repository.url)
+    assert test_repository.list_local_references() != test_repository.list_remote_references()
+
+
+def test_repository_create_bundle(test_repository, tmp_path):
+    references = test_repository.list_local_references()
+    bundle_path = tmp_path / "repository.bundle"
+    test_repository.create_bundle(bundle_path, references=references, prerequisites=set())
+
+    output = subprocess.check_output(["git", "bundle", "list-heads", str(bundle_path)], text=True)
+    assert output.split() == [references["refs/heads/main"], "refs/heads/main"]
+
+
+def test_repository_filter_new_objects(commit_factory, test_repository):
+    old_object = test_repository.list_local_references()["refs/heads/main"]
+    commit_factory(test_repository.url)
+    test_repository.update_local_copy()
+    new_object = test_repository.list_local_references()["refs/heads/main"]
+
+    assert test_repository.filter_new_objects({old_object, new_object}, {old_object}) == {
+        new_object
+    }
+    assert not test_repository.filter_new_objects({old_object}, {new_object})
+
+
+def test_repository_run_maintenance(commit_factory, test_repository):
+    for _ in range(3):
+        commit_factory(test_repository.url)
+        test_repository.update_local_copy()
+
+    thresholds = repository.MaintenanceThresholds(loose_objects=3)
+    assert test_repository.count_objects()["count"] == 3  # the new empty commits
+    assert test_repository.needs_maintenance(thresholds)
+
+    test_repository.run_maintenance()
+    assert test_repository.count_objects()["count"] == 0
+    assert not test_repository.needs_maintenance(thresholds)
+    assert (test_repository.local_path / "objects" / "pack" / "multi-pack-index").is_file()
+    assert test_repository.check_connectivity()
+
+
+def test_repository_transfer(commit_factory, test_repository):
+    commit_factory(test_repository.url)
+
+    transfer = test_repository.update_local_copy()
+    assert transfer.objects == 1  # the new empty commit
+
+
+def test_repository_get_local_url(test_repository):
+    assert test_repository.get_local_url() == test_repository.url
+
+
+def test_repository_with_priority(mocker, test_repository):
+    run_mock = mocker.spy(repository.subprocess, "run")
+
+    with throttle.priority(throttle.Priority(niceness=5)):
+        references = test_repository.list_local_references()
+
+    assert references == test_repository.list_local_references()
+    assert run_mock.call_args_list[0].args[0][:4] == ["nice", "-n", "5", "git"]
@@ -0,0 +1,79 @@
+# Copyright 2023 (c) Vladislav Punko <iam.vlad.punko@gmail.com>
+
+import collections
+import threading
+import time
+
+import pytest
+
+from git_backupper import scheduler
+
+
+def test_run_longest_jobs_first():
+    order = []
+    jobs = [
+        scheduler.Job(func=lambda cost=cost: order.append(cost), host="localhost", cost=cost)
+        for cost in (1.0, float("inf"), 10.0, 5.0)
+    ]
+
+    scheduler.run(jobs)
+
+    assert order == [float("inf"), 10.0, 5.0, 1.0]
+
+
+def test_run_with_workers_per_host():
+    lock = threading.Lock()
+    workers_per_host = collections.Counter()
+    max_workers_per_host = collections.Counter()
+
+    def _run_job(host):
+        with lock:
+            workers_per_host[host] += 1
+            max_workers_per_host[host] = max(max_workers_per_host[host], workers_per_host[host])
+
+        time.sleep(0.01)
+        with lock:
+            workers_per_host[host] -= 1
+
+    jobs = [
+        scheduler.Job(func=lambda host=host: _run_job(host), host=host)
+        for host in ("github.com", "gitlab.com") * 8
+    ]
+
+    scheduler.run(jobs, max_workers=6, max_workers_per_host=2)
+
+    assert max_workers_per_host == {"github.com": 2, "gitlab.com": 2}
+
+
+def test_run_with_error():
+    calls = []
+
+    def _raise_error():
+        raise RuntimeError("test")
+
+    jobs = [scheduler.Job(func=_raise_error, host="localhost", cost=1.0)] + [
+        scheduler.Job(func=lambda: calls.append(None), host="localhost", cost=0.0) for _ in range(5)
+    ]
+
+    with pytest.raises(RuntimeError):
+        scheduler.run(jobs)
+
+    assert calls == []
+
+
+def test_run_with_lookahead():
+    generated = []
+    started = []
+
+    def _generate_jobs():
+        for index in range(6):
+            generated.append(index)
+            yield scheduler.Job(
+                func=lambda index=index: started.append((index, len(generated))), host="localhost"
+            )
+
+    scheduler.run(_generate_jobs(), lookahead=2)
+
+    # The first job is started before the rest of jobs are generated.
+    assert started[0] == (0, 2)
+    assert sorted(index for index, _ in started) == list(range(6))
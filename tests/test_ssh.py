@@ -0,0 +1,70 @@
+# Copyright 2023 (c) Vladislav Punko <iam.vlad.punko@gmail.com>
+
+import os
+import shlex
+
+import pytest
+
+from git_backupper import repository, ssh
+
+
+@pytest.fixture
+def calls_path(tmp_path):
+    return tmp_path / "calls.txt"
+
+
+@pytest.fixture
+def ssh_command(calls_path, tmp_path):
+    # This fake ssh client saves its arguments and fails to connect to any host.
+    path = tmp_path / "ssh"
+    path.write_text(f'#!/bin/sh\necho "$@" >> {shlex.quote(str(calls_path))}\nexit 255\n')
+    path.chmod(0o755)
+
+    return str(path)
+
+
+def test_multiplexing(monkeypatch, ssh_command):
+    monkeypatch.delenv("GIT_SSH_COMMAND", raising=False)
+
+    with ssh.multiplexing(persist=10, ssh_command=ssh_command) as directory:
+        assert os.environ["GIT_SSH_COMMAND"] == (
+            f"{ssh_command} -o ControlMaster=auto -o ControlPath={directory}/%C"
+            " -o ControlPersist=10"
+        )
+
+    assert "GIT_SSH_COMMAND" not in os.environ
+    assert not directory.exists()
+
+
+def test_multiplexing_with_git(monkeypatch, calls_path, ssh_command):
+    monkeypatch.setenv("GIT_SSH_COMMAND", ssh_command)
+    test_repository = repository.Repository.from_url(
+        parent_path=calls_path.parent, url="ssh://git@localhost/repository.git"
+    )
+
+    with ssh.multiplexing() as directory:
+        assert not test_repository.exists_on_remote()
+
+    assert os.environ["GIT_SSH_COMMAND"] == ssh_command
+    assert f"-o ControlMaster=auto -o ControlPath={directory}/%C" in calls_path.read_text()
+
+
+def test_multiplexing_close_connections(calls_path, tmp_path):
+    # This fake ssh client saves the socket path it uses, which is the first one like in ssh.
+    path = tmp_path / "ssh"
+    path.write_text(
+        "#!/bin/sh\n"
+        "while [ $# -gt 0 ]; do\n"
+        '  case "$1" in -o) case "$2" in ControlPath=*)\n'
+        f'    echo "${{2#ControlPath=}}" >> {shlex.quote(str(calls_path))}; exit 0;;\n'
+        "  esac;; esac\n"
+        "  shift\n"
+        "done\n"
+        "exit 255\n"
+    )
+    path.chmod(0o755)
+
+    with ssh.multiplexing(ssh_command=str(path)) as directory:
+        (directory / "socket").touch()  # the master connection to some host
+
+    assert calls_path.read_text().splitlines() == [str(directory / "socket")]
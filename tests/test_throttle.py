@@ -0,0 +1,67 @@
+# Copyright 2023 (c) Vladislav Punko <iam.vlad.punko@gmail.com>
+
+import logging
+
+import pytest
+
+from git_backupper import metrics, throttle
+
+
+@pytest.fixture
+def clock(mocker):
+    now = [0.0]
+
+    def _sleep(delay):
+        now[0] += delay
+
+    mocker.patch.object(throttle.time, "monotonic", side_effect=lambda: now[0])
+    mocker.patch.object(throttle.time, "sleep", side_effect=_sleep)
+
+    return now
+
+
+def test_token_bucket(clock):
+    bucket = throttle.TokenBucket(rate=100.0)
+
+    assert bucket.consume(100) == 0.0  # the burst of the first second
+    assert bucket.consume(50) == pytest.approx(0.5)
+    assert bucket.consume(200) == pytest.approx(2.0)
+    # The whole transfer has taken the time it takes at the given rate.
+    assert clock[0] == pytest.approx(2.5)
+
+
+def test_consume(clock):
+    with metrics.collect() as collector, throttle.limit(10.0):
+        assert throttle.is_limited()
+        throttle.consume(20)
+
+    assert not throttle.is_limited()
+    assert collector.counters[""]["throttled_seconds"] == pytest.approx(1.0)
+
+
+def test_consume_without_limit(mocker):
+    sleep_mock = mocker.patch.object(throttle.time, "sleep")
+
+    with throttle.limit(None):
+        throttle.consume(2**30)
+
+    sleep_mock.assert_not_called()
+
+
+def test_priority(mocker):
+    mocker.patch.object(throttle.shutil, "which", return_value="/usr/bin/ionice")
+
+    with throttle.priority(throttle.Priority(niceness=10, io_class=throttle.IOClass.IDLE)):
+        assert throttle.get_command_prefix() == ("ionice", "-c", "3", "nice", "-n", "10")
+
+    assert throttle.get_command_prefix() == ()
+
+
+def test_priority_without_ionice(caplog, mocker):
+    mocker.patch.object(throttle.shutil, "which", return_value=None)
+
+    with caplog.at_level(logging.WARNING):
+        with throttle.priority(throttle.Priority(io_class=throttle.IOClass.BEST_EFFORT)):
+            assert throttle.get_command_prefix() == ()
+
+    assert "The disk priority cannot be changed without the ionice command." in caplog.text